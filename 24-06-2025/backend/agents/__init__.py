@@ -4,7 +4,14 @@ from .content_healer import ContentHealerAgent
 from .fix_generator import FixGeneratorAgent
 from .code_optimizer import CodeOptimizerAgent
 from .user_approval import UserApprovalAgent
-from .workflow import create_bug_fixer_graph, run_bug_fixer
+from .workflow import (
+    create_bug_fixer_graph,
+    get_bug_fixer_graph,
+    warmup_bug_fixer,
+    reload_bug_fixer,
+    run_bug_fixer,
+    arun_bug_fixer
+)
 
 __all__ = [
     'BaseAgent',
@@ -14,5 +21,9 @@ __all__ = [
     'CodeOptimizerAgent',
     'UserApprovalAgent',
     'create_bug_fixer_graph',
-    'run_bug_fixer'
+    'get_bug_fixer_graph',
+    'warmup_bug_fixer',
+    'reload_bug_fixer',
+    'run_bug_fixer',
+    'arun_bug_fixer'
 ]
@@ -1,15 +1,36 @@
-from langchain.agents import initialize_agent, AgentType
+from langchain.agents import AgentExecutor, ZeroShotAgent
+from langchain.chains import LLMChain
 from langchain.tools import Tool
 from typing import List, Dict, Any
 from abc import ABC, abstractmethod
-from gemini_llm import get_llm
+from gemini_llm import register_static_prompt, route_llm
 from langchain.prompts import PromptTemplate
 
+def react_prompt(tools: List[Tool], instructions: str) -> PromptTemplate:
+    """ReAct prompt that leads with the agent's own instructions.
+
+    Instructions, tool descriptions and the Thought/Action format come
+    first and {input} last, so everything but the question is the same on
+    every call.
+    """
+    return ZeroShotAgent.create_prompt(tools, prefix=instructions, input_variables=["input", "agent_scratchpad"])
+
+def create_react_executor(llm, tools: List[Tool], prompt: PromptTemplate, **kwargs) -> AgentExecutor:
+    """ReAct executor that sends `prompt`, with its static head registered for context caching.
+
+    initialize_agent() ignores agent_kwargs={"prompt": ...} and sends its
+    generic template, so the agent is assembled here instead.
+    """
+    agent = ZeroShotAgent(llm_chain=LLMChain(llm=llm, prompt=prompt), allowed_tools=[tool.name for tool in tools])
+    executor = AgentExecutor.from_agent_and_tools(agent=agent, tools=tools, **kwargs)
+    register_static_prompt(executor.agent.llm_chain.prompt)
+    return executor
+
 class BaseAgent(ABC):
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
-        self.llm = get_llm()
+        self.llm = route_llm("general")
         self.tools = self._get_tools()
         self.executor = self._create_executor()
 
@@ -19,21 +40,24 @@ class BaseAgent(ABC):
         pass
 
     def _create_executor(self):
-        return initialize_agent(
-            tools=self.tools,
-            llm=self.llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            agent_kwargs={"prompt": self._get_prompt()},
+        return create_react_executor(
+            self.llm,
+            self.tools,
+            self._get_prompt(),
             verbose=True,
             handle_parsing_errors=True
         )
 
     @abstractmethod
     def _get_prompt(self) -> PromptTemplate:
-        """Return the PromptTemplate for the agent"""
+        """Return the PromptTemplate for the agent, e.g. react_prompt(self.tools, instructions)"""
         pass
 
     @abstractmethod
     def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Run the agent with input data"""
         return self.executor.run(input=input_data)
+
+    async def arun(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async version of run"""
+        return await self.executor.arun(input=input_data)
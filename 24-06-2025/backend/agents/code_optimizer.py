@@ -1,24 +1,26 @@
 from langchain.tools import Tool
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.prompts import PromptTemplate
-from langchain.agents import initialize_agent, AgentType
-from gemini_llm import get_llm
+from agents.base_agent import create_react_executor, react_prompt
+from gemini_llm import get_embeddings, route_llm
+from llm.prompt_packing import PromptPacker, Section, find_anchor_lines, summarize_css, summarize_html, summarize_js
 from typing import List, Dict, Any
 import os
 import fitz  # PyMuPDF for PDF reading
 
+SUMMARY_TEMPLATE = "HTML:\n{html}\n\nCSS:\n{css}\n\nJavaScript:\n{js}\n\nFixes:\n{fixes}"
+
 class CodeOptimizerAgent:
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = route_llm("code_fix", latency_budget=60)
+        self.packer = PromptPacker()
         self.tools = self._get_tools()
         self.vectorstore = self._setup_vectorstore()
-        self.executor = initialize_agent(
-            tools=self.tools,
-            llm=self.llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            agent_kwargs={"prompt": self._get_prompt()},
+        self.executor = create_react_executor(
+            self.llm,
+            self.tools,
+            self._get_prompt(),
             verbose=True,
             handle_parsing_errors=True,
             iterations=1
@@ -26,7 +28,7 @@ class CodeOptimizerAgent:
 
     def _setup_vectorstore(self) -> Chroma:
         """Setup RAG with coding best practices from PDF"""
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        embeddings = get_embeddings("models/embedding-001")
         db_path = "optimization_db"
         pdf_path = os.path.join(os.path.dirname(__file__), "..", "data", "WebDevelopmentBestPractices.pdf")
         if not os.path.exists(db_path):
@@ -81,8 +83,7 @@ class CodeOptimizerAgent:
         return tools
 
     def _get_prompt(self) -> PromptTemplate:
-        return PromptTemplate(
-            template="""You are a Code Optimizer Agent using RAG-based best practices.
+        return react_prompt(self.tools, """You are a Code Optimizer Agent using RAG-based best practices.
 Your goal is to optimize code by:
 - Applying industry best practices
 - Improving performance
@@ -90,12 +91,6 @@ Your goal is to optimize code by:
 - Ensuring accessibility
 - Following modern standards
 
-Input: {input}
-Available tools: {tools}
-Tool names: {tool_names}
-
-{agent_scratchpad}
-
 Think through this step-by-step:
 1. Analyze current code
 2. Query best practices database
@@ -103,15 +98,15 @@ Think through this step-by-step:
 4. Ensure compatibility
 5. Provide implementation steps
 
-Response should be in JSON format with:
+Your Final Answer should be JSON with:
 - optimizations: list of suggested improvements
 - code_changes: specific code modifications
 - rationale: explanation for each change
 - performance_impact: expected improvements
 
-Let's optimize this code!""",
-            input_variables=["input", "tools", "tool_names", "agent_scratchpad"]
-        )
+Let's optimize this code!
+
+You have access to the following tools:""")
 
     def _optimize_css(self, css: str) -> Dict:
         """Optimize CSS code"""
@@ -194,11 +189,27 @@ Let's optimize this code!""",
             "explanation": best_practice
         }
 
-    def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Run code optimization"""
+    def _build_summary(self, input_data: Dict[str, Any]) -> str:
         css = input_data.get("css", "")
         js = input_data.get("javascript", "")
         html = input_data.get("html", "")
         fixes = input_data.get("fixes", {})
-        summary = f"HTML:\n{html}\n\nCSS:\n{css}\n\nJavaScript:\n{js}\n\nFixes:\n{fixes}"
-        return self.executor.run(input=summary)
+        # The code the fixes touch is what matters; keep windows around it
+        fix_list = fixes.get("fixes", []) if isinstance(fixes, dict) else []
+        summary, packed = self.packer.fill(SUMMARY_TEMPLATE, [
+            Section("html", html, priority=0, anchors=find_anchor_lines(html, fix_list), summarize=summarize_html),
+            Section("css", css, priority=1, anchors=find_anchor_lines(css, fix_list), summarize=summarize_css),
+            Section("js", js, priority=1, anchors=find_anchor_lines(js, fix_list), summarize=summarize_js),
+            Section("fixes", str(fixes), priority=2, required=True),
+        ])
+        if packed.trimmed:
+            print(f"[Code Optimizer] Prompt trimmed: {packed.summary()}")
+        return summary
+
+    def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run code optimization"""
+        return self.executor.run(input=self._build_summary(input_data))
+
+    async def arun(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async version of run"""
+        return await self.executor.arun(input=self._build_summary(input_data))
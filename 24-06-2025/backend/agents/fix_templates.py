@@ -0,0 +1,371 @@
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# A template returns the fixes for one issue ([] when nothing needs
+# changing), or None when it cannot handle this instance and the LLM should
+# decide instead
+FixTemplate = Callable[[Dict[str, Any], Dict[str, str]], Optional[List[Dict[str, Any]]]]
+
+FIX_TYPES = {"html": "html_fix", "css": "css_fix", "js": "js_fix"}
+
+PLACEHOLDER_COPY = "Welcome to our website! This is where you can add your main content."
+PLACEHOLDER_IMAGE = "https://via.placeholder.com/300x200"
+
+
+class FixTemplateRegistry:
+    """Deterministic fixes for known issue types, keyed by issue type.
+
+    Every fix carries the exact source span it replaces: `span` holds the
+    file ("html", "css" or "js"), character offsets and 1-based line, and
+    `before` is the source text at that span. `sources` maps those file
+    names to the submitted code. Issues no template handles are returned
+    unchanged so they can go to the LLM.
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, List[FixTemplate]] = {}
+
+    def register(self, issue_type: str):
+        def decorator(template: FixTemplate) -> FixTemplate:
+            self._templates.setdefault(issue_type, []).append(template)
+            return template
+        return decorator
+
+    def covers(self, issue_type: str) -> bool:
+        return issue_type in self._templates
+
+    def apply(self, issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+        """Fixes for `issue` from the first template that handles it, else None."""
+        for template in self._templates.get(issue.get("type"), []):
+            fixes = template(issue, sources)
+            if fixes is not None:
+                for fix in fixes:
+                    fix.setdefault("issue_type", issue.get("type"))
+                    fix.setdefault("source", "template")
+                return fixes
+        return None
+
+    def split(self, issues: Iterable[Any], sources: Dict[str, str]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+        """(template fixes, issues left for the LLM)"""
+        fixes, uncovered = [], []
+        seen = set()
+        for issue in issues:
+            result = self.apply(issue, sources) if isinstance(issue, dict) else None
+            if result is None:
+                uncovered.append(issue)
+                continue
+            keys = [(fix["span"]["file"], fix["span"]["start"], fix["span"]["end"]) for fix in result]
+            if any(key in seen for key in keys):
+                # The span is already taken by another issue's fix: this issue
+                # is about an element the template could not tell apart, so
+                # it goes to the LLM rather than being dropped
+                uncovered.append(issue)
+                continue
+            seen.update(keys)
+            fixes.extend(result)
+        return fixes, uncovered
+
+
+def make_fix(file: str, source: str, start: int, end: int, after: str, explanation: str) -> Dict[str, Any]:
+    return {
+        "type": FIX_TYPES[file],
+        "before": source[start:end],
+        "after": after,
+        "explanation": explanation,
+        "span": {"file": file, "start": start, "end": end, "line": source.count("\n", 0, start) + 1},
+    }
+
+
+def line_bounds(source: str, line: Any) -> Optional[Tuple[int, int]]:
+    """Character offsets of a 1-based line number (as validators report it)."""
+    try:
+        number = int(line)
+    except (TypeError, ValueError):
+        return None
+    if number < 1:
+        return None
+    start = 0
+    for _ in range(number - 1):
+        start = source.find("\n", start) + 1
+        if start == 0:
+            return None
+    end = source.find("\n", start)
+    return start, len(source) if end == -1 else end
+
+
+def search_near(pattern: "re.Pattern", source: str, issue: Dict[str, Any]) -> Optional["re.Match"]:
+    """First match from the issue's line on (text can follow its tag), within a few lines.
+
+    None when the issue has no line: a match elsewhere in the file may
+    belong to another element.
+    """
+    bounds = line_bounds(source, issue.get("location"))
+    if not bounds:
+        return None
+    match = pattern.search(source, bounds[0])
+    if match and source.count("\n", bounds[0], match.start()) <= 5:
+        return match
+    return None
+
+
+_START_TAG = re.compile(r"""<([a-zA-Z][\w:-]*)\b(?:[^>"']|"[^"]*"|'[^']*')*>""")
+_TAG_NAME = re.compile(r"[a-zA-Z][\w:-]*")
+# How far before its line a start tag may begin (attributes split over lines)
+_TAG_LOOKBACK = 4096
+
+
+def tags_on_line(source: str, issue: Dict[str, Any], name: Optional[str] = None) -> Optional[List["re.Match"]]:
+    """Start tags (named `name`, if given) on the issue's line; None if it has no line.
+
+    A tag spread over several lines counts on each: lxml reports the line
+    a start tag ends on, other parsers the line it begins on.
+    """
+    bounds = line_bounds(source, issue.get("location"))
+    if not bounds:
+        return None
+    start, end = bounds
+    found = []
+    for match in _START_TAG.finditer(source, max(0, start - _TAG_LOOKBACK)):
+        if match.start() > end:
+            break
+        if match.end() > start and (name is None or match.group(1).lower() == name.lower()):
+            found.append(match)
+    return found
+
+
+registry = FixTemplateRegistry()
+
+_STYLE_ATTR = re.compile(r"""(?<![-\w])style\s*=\s*(["'])(.*?)\1""", re.S | re.I)
+_POSITION = re.compile(r"position\s*:\s*(absolute|fixed|relative)\s*;?", re.I)
+_FIXED_WIDTH = re.compile(r"(?<![-\w])width\s*:\s*(\d+)px\s*;?", re.I)
+_ANCHOR = re.compile(r"<a\b([^>]*)>(.*?)</a\s*>", re.I | re.S)
+_GET_BY_ID = re.compile(r"""getElementById\(\s*(['"])([^'"]+)\1\s*\)""")
+_QUERY_ONE = re.compile(r"\.querySelector\(")
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_Z_INDEX = re.compile(r"(?<![-\w])z-index\s*:\s*[^;}]+;?")
+_POSITIONED = re.compile(r"(?<![-\w])position\s*:\s*(relative|absolute|fixed|sticky)", re.I)
+
+
+def _find_declaration(file: str, source: str, issue: Dict[str, Any],
+                      declaration: "re.Pattern") -> Optional[Tuple[int, int, "re.Match"]]:
+    """(start, end, match) of a declaration the issue points at.
+
+    In HTML only the style attribute of the element on the issue's line is
+    searched; with no line, or several such elements on it, there is no
+    telling which one the issue means. Issues about an HTML element are
+    never looked up in CSS.
+    """
+    if file == "html":
+        name = issue.get("element")
+        found = []
+        for tag in tags_on_line(source, issue, name if name and _TAG_NAME.fullmatch(name) else None) or ():
+            attr = _STYLE_ATTR.search(tag.group(0))
+            match = declaration.search(attr.group(2)) if attr else None
+            if match:
+                offset = tag.start() + attr.start(2)
+                found.append((offset + match.start(), offset + match.end(), match))
+        return found[0] if len(found) == 1 else None
+    if issue.get("element"):
+        return None
+    match = declaration.search(source)
+    return (match.start(), match.end(), match) if match else None
+
+
+@registry.register("positioning")
+def fix_positioning(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    for file in ("html", "css"):
+        source = sources.get(file, "")
+        found = _find_declaration(file, source, issue, _POSITION)
+        if not found:
+            continue
+        start, end, match = found
+        mode = match.group(1).lower()
+        if mode == "relative":
+            # Stays in the flow: nothing can overlap because of it
+            return []
+        if mode == "fixed":
+            # Usually deliberate (headers, overlays); needs judgement
+            return None
+        return [make_fix(file, source, start, end, "position: relative; z-index: 1;",
+                         "Changed to relative positioning to prevent overlap")]
+    return None
+
+
+@registry.register("responsive")
+def fix_responsive(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    for file in ("html", "css"):
+        source = sources.get(file, "")
+        found = _find_declaration(file, source, issue, _FIXED_WIDTH)
+        if not found:
+            continue
+        start, end, match = found
+        return [make_fix(file, source, start, end, f"width: 100%; max-width: {match.group(1)}px;",
+                         "Made width responsive with max-width constraint")]
+    return None
+
+
+@registry.register("z-index")
+def fix_z_index(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    css = sources.get("css", "")
+    wanted = " ".join((issue.get("selector") or "").split())
+    if not wanted and issue.get("element"):
+        # Set by an inline style attribute, not a rule
+        return None
+    for rule in _CSS_RULE.finditer(css):
+        body = rule.group(2)
+        z_index = _Z_INDEX.search(body)
+        if not z_index or (wanted and " ".join(rule.group(1).split()) != wanted):
+            continue
+        if _POSITIONED.search(body):
+            # Already positioned, so z-index takes effect as written
+            return []
+        start = rule.start(2) + z_index.start()
+        end = rule.start(2) + z_index.end()
+        return [make_fix("css", css, start, end, f"position: relative; {css[start:end]}",
+                         "z-index only applies to positioned elements; added position: relative")]
+    return None
+
+
+@registry.register("placeholder")
+def fix_placeholder(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    html = sources.get("html", "")
+    text = (issue.get("content") or "").strip()
+    match = search_near(re.compile(re.escape(text)), html, issue) if text else None
+    if not match:
+        match = search_near(re.compile(r"lorem ipsum[^<]*[^<\s]", re.I), html, issue)
+    if not match:
+        return None
+    return [make_fix("html", html, match.start(), match.end(), PLACEHOLDER_COPY,
+                     "Replace placeholder text with meaningful content")]
+
+
+@registry.register("missing_image")
+def fix_missing_image(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    html = sources.get("html", "")
+    candidates = [m for m in tags_on_line(html, issue, "img") or () if _missing_src(m.group(0))]
+    if len(candidates) != 1:
+        # No line, or no telling which image on it the issue means
+        return None
+    match = candidates[0]
+    tag = match.group(0)
+    if re.search(r"""\bsrc\s*=""", tag, re.I):
+        fixed = re.sub(r"""\bsrc\s*=\s*(["'])[^"']*\1""", f'src="{PLACEHOLDER_IMAGE}"', tag, count=1, flags=re.I)
+    else:
+        fixed = re.sub(r"^<img\b", f'<img src="{PLACEHOLDER_IMAGE}"', tag, flags=re.I)
+    if re.search(r"""\balt\s*=\s*(["'])\s*\1""", fixed, re.I):
+        fixed = re.sub(r"""\balt\s*=\s*(["'])\s*\1""", 'alt="Sample image"', fixed, count=1, flags=re.I)
+    elif not re.search(r"\balt\s*=", fixed, re.I):
+        fixed = fixed[:-2] + ' alt="Sample image"' + fixed[-2:] if fixed.endswith("/>") else fixed[:-1] + ' alt="Sample image">'
+    return [make_fix("html", html, match.start(), match.end(), fixed,
+                     "Add proper image source and descriptive alt text")]
+
+
+def _missing_src(tag: str) -> bool:
+    src = re.search(r"""\bsrc\s*=\s*(["'])([^"']*)\1""", tag, re.I)
+    return src is None or not src.group(2).strip() or src.group(2).startswith("#")
+
+
+@registry.register("missing_element")
+def fix_missing_element(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    js = sources.get("js", "")
+    content = issue.get("content") or ""
+    wanted = _GET_BY_ID.search(content)
+    if content and not wanted:
+        if _QUERY_ONE.search(content) and content in js:
+            # querySelector() returns null when nothing matches, like getElementById()
+            return _guard_lookups(js, re.escape(content), issue.get("selector") or content) or None
+        # Collections (querySelectorAll, getElementsByClassName, $()) are never
+        # null: an empty one means a wrong selector, which only the author can fix
+        return None
+    ids = [wanted.group(2)] if wanted else sorted({m.group(2) for m in _GET_BY_ID.finditer(js)})
+    html = sources.get("html", "")
+    fixes = []
+    for element_id in ids:
+        if re.search(r"""\bid\s*=\s*(["'])""" + re.escape(element_id) + r"\1", html):
+            # The element exists; nothing to guard
+            continue
+        lookup = r"""document\.getElementById\(\s*(?P<quote>['"])""" + re.escape(element_id) + r"""(?P=quote)\s*\)"""
+        fixes.extend(_guard_lookups(js, lookup, f"#{element_id}"))
+    if not fixes and wanted and not re.search(r"""\bid\s*=\s*(["'])""" + re.escape(wanted.group(2)) + r"\1", html):
+        # A lookup we could not pattern-match: let the LLM handle it
+        return None
+    return fixes
+
+
+def _guard_lookups(js: str, lookup: str, label: str) -> List[Dict[str, Any]]:
+    """Null checks around each use of the element lookup matched by `lookup` in `js`."""
+    fixes = []
+    # document.getElementById('x').foo = bar;  (dereferenced directly)
+    direct = re.compile(r"^(?P<indent>[ \t]*)(?P<call>" + lookup + r")(?P<rest>\.[^\n;]+;)", re.M)
+    for match in direct.finditer(js):
+        indent, call, rest = match.group("indent"), match.group("call"), match.group("rest")
+        # A block of its own: the temporary cannot clash with (or overwrite) the script's names
+        after = f"{indent}{{\n{indent}    const __el = {call};\n{indent}    if (__el) {{ __el{rest} }}\n{indent}}}"
+        fixes.append(make_fix("js", js, match.start(), match.end(), after,
+                              f"Added check for missing element {label} before using it"))
+    # const el = document.getElementById('x');  followed by  el.foo...;
+    assigned = re.compile(r"^[ \t]*(?:const|let|var)\s+(?P<name>\w+)\s*=\s*" + lookup + r"\s*;?[ \t]*\n", re.M)
+    for match in assigned.finditer(js):
+        name = match.group("name")
+        use = re.compile(r"^([ \t]*)(" + re.escape(name) + r"\.[^\n]*;)[ \t]*$", re.M).search(js, match.end())
+        if not use or js[match.end():use.start()].strip():
+            continue
+        indent = use.group(1)
+        after = f"{indent}if ({name}) {{\n{indent}    {use.group(2)}\n{indent}}}"
+        fixes.append(make_fix("js", js, use.start(), use.end(), after,
+                              f"Added null check for missing element {label} before accessing properties"))
+    return fixes
+
+
+@registry.register("unused_selector")
+def fix_unused_selector(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    # Dead CSS breaks nothing, and it may be meant for pages not submitted
+    # here; it is reported, not deleted
+    return []
+
+
+@registry.register("broken_link")
+def fix_broken_link(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    html = sources.get("html", "")
+    anchors = [_ANCHOR.match(html, tag.start()) for tag in tags_on_line(html, issue, "a") or ()]
+    anchors = [match for match in anchors if match and _dead_href(match.group(1))]
+    if len(anchors) != 1:
+        return None
+    match = anchors[0]
+    attrs, label = match.group(1), match.group(2)
+    if not re.search(r"\bon\w+\s*=", attrs, re.I):
+        # A link with nowhere to go and no handler: only the author knows the target
+        return None
+    kept = re.sub(r"""\s*\bhref\s*=\s*(["'])[^"']*\1""", "", attrs, flags=re.I)
+    return [make_fix("html", html, match.start(), match.end(), f'<button type="button"{kept}>{label}</button>',
+                     "A link without a destination that runs a script is a button")]
+
+
+def _dead_href(attrs: str) -> bool:
+    """Same test as the broken_link check: no href, "#" or javascript:void(0)."""
+    href = re.search(r"""\bhref\s*=\s*(["'])([^"']*)\1""", attrs, re.I)
+    return href is None or not href.group(2) or href.group(2) == "#" or href.group(2).startswith("javascript:void(0)")
+
+
+_HANDLER_CALL = re.compile(r"(?<![\w.$])([A-Za-z_$][\w$]*)\s*\(")
+_BROWSER_GLOBALS = {"alert", "confirm", "prompt", "setTimeout", "setInterval", "fetch", "if", "return"}
+
+
+@registry.register("event_check")
+def check_event_handler(issue: Dict[str, Any], sources: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    handler = re.match(r"""\s*on\w+\s*=\s*"(.*)"\s*$""", issue.get("content") or "", re.S)
+    if not handler:
+        return None
+    js = sources.get("js", "")
+    for name in _HANDLER_CALL.findall(handler.group(1)):
+        if name in _BROWSER_GLOBALS:
+            continue
+        defined = re.search(
+            r"\bfunction\s+" + re.escape(name) + r"\s*\(|\b" + re.escape(name) + r"\s*=\s*(?:async\s*)?(?:function\b|\()",
+            js,
+        )
+        if not defined:
+            # Calls something the script never defines: needs a real fix
+            return None
+    # Every function the handler calls exists; nothing to change
+    return []
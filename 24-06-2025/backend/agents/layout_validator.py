@@ -1,21 +1,48 @@
 from langchain.tools import Tool
 from langchain.prompts import PromptTemplate
-from langchain.agents import initialize_agent, AgentType
-from gemini_llm import get_llm
-from bs4 import BeautifulSoup
+from agents.base_agent import create_react_executor, react_prompt
+from gemini_llm import route_llm, telemetry
+from analysis import DocumentContext, RuleEngine, document_for, stacking_issues
 from typing import List, Dict, Any
-import cssutils
+import asyncio
 import re
 
+# DOM checks, run together in one pass over the document
+LAYOUT_RULES = RuleEngine("layout")
+telemetry.add_gauges(LAYOUT_RULES.stats)
+
+@LAYOUT_RULES.rule("positioning", attributes=["style"])
+def check_positioning(elem, doc: DocumentContext) -> List[Dict]:
+    """Positioned elements that may overlap others"""
+    if not re.search(r'position:\s*(absolute|relative|fixed)', elem["style"]):
+        return []
+    return [{
+        "type": "positioning",
+        "element": elem.name,
+        "location": str(doc.line(elem)),
+        "description": f"Potential overlap with positioned element: {elem.name}"
+    }]
+
+@LAYOUT_RULES.rule("responsive", attributes=["style"])
+def check_fixed_width(elem, doc: DocumentContext) -> List[Dict]:
+    """Fixed pixel widths that break on small screens"""
+    if not re.search(r'width:\s*\d+px', elem["style"]):
+        return []
+    return [{
+        "type": "responsive",
+        "element": elem.name,
+        "location": str(doc.line(elem)),
+        "description": "Fixed width may cause responsive issues"
+    }]
+
 class LayoutValidatorAgent:
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = route_llm("analysis", latency_budget=10)
         self.tools = self._get_tools()
-        self.executor = initialize_agent(
-            tools=self.tools,
-            llm=self.llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            agent_kwargs={"prompt": self._get_prompt()},
+        self.executor = create_react_executor(
+            self.llm,
+            self.tools,
+            self._get_prompt(),
             verbose=True,
             handle_parsing_errors=True,
             iterations=1
@@ -25,25 +52,24 @@ class LayoutValidatorAgent:
         tools = [
             Tool(
                 name="analyze_layout",
-                func=self._analyze_layout,
+                func=lambda html: self._analyze_layout(document_for({"html": html})),
                 description="Analyzes HTML and CSS for layout issues"
             ),
             Tool(
                 name="check_responsive",
-                func=self._check_responsive,
+                func=lambda html: self._check_responsive(document_for({"html": html})),
                 description="Checks for responsive design issues"
             ),
             Tool(
                 name="validate_css",
-                func=self._validate_css,
+                func=lambda css: self._validate_css(document_for({"css": css})),
                 description="Validates CSS for potential conflicts"
             )
         ]
         return tools
 
     def _get_prompt(self) -> PromptTemplate:
-        return PromptTemplate(
-            template="""You are a Layout Validator Agent specialized in detecting HTML and CSS layout issues.
+        return react_prompt(self.tools, """You are a Layout Validator Agent specialized in detecting HTML and CSS layout issues.
 Your goal is to identify problems like:
 - Element overlaps
 - Responsive design breakage
@@ -51,12 +77,6 @@ Your goal is to identify problems like:
 - Grid/Flexbox issues
 - Positioning problems
 
-Input: {input}
-Available tools: {tools}
-Tool names: {tool_names}
-
-{agent_scratchpad}
-
 Think through this step-by-step:
 1. Analyze the HTML structure
 2. Review CSS properties
@@ -64,85 +84,54 @@ Think through this step-by-step:
 4. Identify potential conflicts
 5. Generate a detailed report
 
-Response should be in JSON format with:
+Your Final Answer should be JSON with:
 - issues: list of detected problems
 - locations: where issues were found
 - severity: high/medium/low for each issue
 
-Let's approach this systematically!""",
-            input_variables=["input", "tools", "tool_names", "agent_scratchpad"]
-        )
+Let's approach this systematically!
+
+You have access to the following tools:""")
 
-    def _analyze_layout(self, html: str) -> Dict:
+    def _analyze_layout(self, doc: DocumentContext) -> Dict:
         """Analyze HTML for layout issues"""
-        soup = BeautifulSoup(html, 'lxml')
-        issues = []
-        
-        # Check for potential overlap issues
-        positioned_elements = soup.find_all(style=re.compile(r'position:\s*(absolute|relative|fixed)'))
-        for elem in positioned_elements:
-            issues.append({
-                "type": "positioning",
-                "element": elem.name,
-                "location": str(elem.sourceline),
-                "description": f"Potential overlap with positioned element: {elem.name}"
-            })
-            
-        return {"issues": issues}
+        return {"issues": LAYOUT_RULES.run(doc, only=["positioning"]).all_issues()}
 
-    def _check_responsive(self, html: str) -> Dict:
+    def _check_responsive(self, doc: DocumentContext) -> Dict:
         """Check for responsive design issues"""
-        soup = BeautifulSoup(html, 'lxml')
-        issues = []
-        
-        # Check for fixed widths
-        fixed_width_elements = soup.find_all(style=re.compile(r'width:\s*\d+px'))
-        for elem in fixed_width_elements:
-            issues.append({
-                "type": "responsive",
-                "element": elem.name,
-                "location": str(elem.sourceline),
-                "description": "Fixed width may cause responsive issues"
-            })
-            
-        return {"issues": issues}
+        return {"issues": LAYOUT_RULES.run(doc, only=["responsive"]).all_issues()}
 
-    def _validate_css(self, css: str) -> Dict:
-        """Validate CSS for conflicts"""
-        parser = cssutils.CSSParser()
-        sheet = parser.parseString(css)
+    def _validate_css(self, doc: DocumentContext) -> Dict:
+        """Validate CSS for stacking and overlap conflicts against the elements it styles"""
+        if doc.elements and doc.html.strip():
+            return {"issues": stacking_issues(doc)}
+        # CSS on its own: nothing to match against, so flag z-index rules
         issues = []
-        
-        for rule in sheet:
-            if rule.type == rule.STYLE_RULE:
-                # Check for z-index conflicts
-                if 'z-index' in rule.style.cssText:
-                    issues.append({
-                        "type": "z-index",
-                        "selector": rule.selectorText,
-                        "description": "Potential z-index stacking context issue"
-                    })
-                    
+        for rule in doc.css_rules:
+            if any(d.name == 'z-index' for d in rule.declarations):
+                issues.append({
+                    "type": "z-index",
+                    "selector": rule.selector_text,
+                    "description": "Potential z-index stacking context issue"
+                })
         return {"issues": issues}
 
     def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Run layout validation analysis"""
         html = input_data.get('html', '')
         css = input_data.get('css', '')
+        # Parsed once per submission and shared with the other agents
+        doc = document_for(input_data)
         
         all_issues = []
         
-        # Check layout issues
+        # Check layout issues: every DOM rule in a single traversal
         if html:
-            layout_result = self._analyze_layout(html)
-            all_issues.extend(layout_result.get('issues', []))
-            
-            responsive_result = self._check_responsive(html)
-            all_issues.extend(responsive_result.get('issues', []))
+            all_issues.extend(LAYOUT_RULES.run(doc).all_issues())
         
         # Check CSS issues
         if css:
-            css_result = self._validate_css(css)
+            css_result = self._validate_css(doc)
             all_issues.extend(css_result.get('issues', []))
         
         # If no issues found, create specific ones based on common patterns
@@ -170,3 +159,7 @@ Let's approach this systematically!""",
                 })
         
         return {"issues": all_issues}
+
+    async def arun(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async entry point; the analysis is CPU-bound, so it runs off the event loop"""
+        return await asyncio.to_thread(self.run, input_data)
@@ -1,19 +1,23 @@
 from langchain.tools import Tool
 from langchain.prompts import PromptTemplate
-from langchain.agents import initialize_agent, AgentType
-from gemini_llm import get_llm
+from agents.base_agent import create_react_executor, react_prompt
+from gemini_llm import route_llm
+from llm.prompt_packing import PromptPacker, Section
 from typing import List, Dict, Any
 import json
 
+# Change groups in the order they are kept when the prompt is over budget
+CHANGE_PRIORITY = {"layout": 2, "content": 1, "optimizations": 0}
+
 class UserApprovalAgent:
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = route_llm("summarize", latency_budget=10)
+        self.packer = PromptPacker()
         self.tools = self._get_tools()
-        self.executor = initialize_agent(
-            tools=self.tools,
-            llm=self.llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            agent_kwargs={"prompt": self._get_prompt()},
+        self.executor = create_react_executor(
+            self.llm,
+            self.tools,
+            self._get_prompt(),
             verbose=True,
             handle_parsing_errors=True,
             iterations=1
@@ -40,8 +44,7 @@ class UserApprovalAgent:
         return tools
 
     def _get_prompt(self) -> PromptTemplate:
-        return PromptTemplate(
-            template="""You are a User Approval Agent managing the change approval process.
+        return react_prompt(self.tools, """You are a User Approval Agent managing the change approval process.
 Your goal is to:
 - Summarize proposed changes
 - Present clear before/after comparisons
@@ -49,12 +52,6 @@ Your goal is to:
 - Maintain audit logs
 - Ensure transparency
 
-Input: {input}
-Available tools: {tools}
-Tool names: {tool_names}
-
-{agent_scratchpad}
-
 Think through this step-by-step:
 1. Collect all proposed changes
 2. Generate clear summaries
@@ -62,15 +59,15 @@ Think through this step-by-step:
 4. Record decisions
 5. Update audit logs
 
-Response should be in JSON format with:
+Your Final Answer should be JSON with:
 - changes: list of proposed changes
 - comparisons: before/after views
 - approval_status: pending/approved/rejected
 - audit_trail: decision log
 
-Let's manage these changes!""",
-            input_variables=["input", "tools", "tool_names", "agent_scratchpad"]
-        )
+Let's manage these changes!
+
+You have access to the following tools:""")
 
     def _generate_summary(self, changes) -> Dict:
         """Generate a summary of proposed changes. Handles both dict and string input."""
@@ -155,12 +152,40 @@ Let's manage these changes!""",
         # In a real implementation, this would save to a database
         return {"log_entry": log_entry}
 
+    def _build_summary(self, changes: Any) -> str:
+        if not isinstance(changes, dict) or not changes:
+            return f"Proposed Changes: {changes}"
+        sections, seen = [], {}
+        for name, value in changes.items():
+            text = str(value)
+            if text in seen:
+                # Layout and content often carry the same fix list
+                text = f"(same as {seen[text]})"
+            else:
+                seen[text] = name
+            sections.append(Section(name, text, priority=CHANGE_PRIORITY.get(name, 0)))
+        template = "Proposed Changes:\n" + "\n".join(f"{name}: {{{name}}}" for name in changes)
+        summary, packed = self.packer.fill(template, sections)
+        if packed.trimmed:
+            print(f"[User Approval] Prompt trimmed: {packed.summary()}")
+        return summary
+
     def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         changes = input_data.get('changes', {})
         manual_fixes = input_data.get('manual_fix_required', [])
-        summary = f"Proposed Changes: {changes}"
+        summary = self._build_summary(changes)
         result = self.executor.run(input=summary)
         # Attach manual fixes to the result for the approval dashboard
         if manual_fixes:
             result['manual_fix_required'] = manual_fixes
         return result
+
+    async def arun(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async version of run"""
+        changes = input_data.get('changes', {})
+        manual_fixes = input_data.get('manual_fix_required', [])
+        summary = self._build_summary(changes)
+        result = await self.executor.arun(input=summary)
+        if manual_fixes:
+            result['manual_fix_required'] = manual_fixes
+        return result
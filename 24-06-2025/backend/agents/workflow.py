@@ -1,7 +1,9 @@
 from langchain.agents.agent import AgentExecutor
-from langgraph.graph import Graph, StateGraph
-from typing import Dict, TypedDict, Annotated, Sequence
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import Graph, StateGraph, START
+from typing import Any, Dict, Optional, TypedDict, Annotated, Sequence
 import operator
+import threading
 import re
 
 from agents.layout_validator import LayoutValidatorAgent
@@ -10,14 +12,26 @@ from agents.fix_generator import FixGeneratorAgent
 from agents.code_optimizer import CodeOptimizerAgent
 from agents.user_approval import UserApprovalAgent
 
+def merge_state_value(current: Any, update: Any) -> Any:
+    """Reducer for every state key so parallel branches can write in the same step.
+
+    Dict updates are merged into the existing dict (update wins per key);
+    anything else simply replaces the current value.
+    """
+    if update is None:
+        return current
+    if isinstance(current, dict) and isinstance(update, dict):
+        return {**current, **update}
+    return update
+
 class AgentState(TypedDict):
-    input: Dict  # changed from str to Dict
-    layout_issues: Dict
-    content_issues: Dict
-    fixes: Dict
-    optimizations: Dict 
-    approval: Dict
-    final_output: Dict
+    input: Annotated[Dict, merge_state_value]  # changed from str to Dict
+    layout_issues: Annotated[Dict, merge_state_value]
+    content_issues: Annotated[Dict, merge_state_value]
+    fixes: Annotated[Dict, merge_state_value]
+    optimizations: Annotated[Dict, merge_state_value]
+    approval: Annotated[Dict, merge_state_value]
+    final_output: Annotated[Dict, merge_state_value]
 
 def create_bug_fixer_graph() -> Graph:
     # Initialize all agents
@@ -30,46 +44,93 @@ def create_bug_fixer_graph() -> Graph:
     # Create the graph
     workflow = StateGraph(AgentState)
     
-    # Add nodes for each agent
-    def validate_layout(state: AgentState) -> AgentState:
+    # Add nodes for each agent. Every node has a sync and an async version so
+    # the same graph serves graph.invoke (threads) and graph.ainvoke (event loop).
+    # validate_layout and heal_content run as parallel branches, so they only
+    # return the key they own instead of the whole state
+    def validate_layout(state: AgentState) -> Dict:
         result = layout_validator.run(state["input"])
         print("\n[Layout Validator Agent]")
         print(result)
-        state["layout_issues"] = result
-        return state
+        return {"layout_issues": result}
+
+    async def avalidate_layout(state: AgentState) -> Dict:
+        result = await layout_validator.arun(state["input"])
+        print("\n[Layout Validator Agent]")
+        print(result)
+        return {"layout_issues": result}
 
-    def heal_content(state: AgentState) -> AgentState:
+    def heal_content(state: AgentState) -> Dict:
         result = content_healer.run(state["input"])
         print("\n[Content Healer Agent]")
         print(result)
-        state["content_issues"] = result
-        return state
-    
+        return {"content_issues": result}
+
+    async def aheal_content(state: AgentState) -> Dict:
+        result = await content_healer.arun(state["input"])
+        print("\n[Content Healer Agent]")
+        print(result)
+        return {"content_issues": result}
+
+    def fix_input(state: AgentState) -> Dict:
+        # Sources let fix templates point at exact spans
+        return {
+            "issues": {"layout": state["layout_issues"], "content": state["content_issues"]},
+            **state["input"]
+        }
+
     def generate_fixes(state: AgentState) -> AgentState:
-        result = fix_generator.run({"issues": {"layout": state["layout_issues"], "content": state["content_issues"]}})
+        result = fix_generator.run(fix_input(state))
         print("\n[Fix Generator Agent]")
         print(result)
         state["fixes"] = result
         return state
-    
-    def optimize_code(state: AgentState) -> AgentState:
-        result = code_optimizer.run({
+
+    async def agenerate_fixes(state: AgentState) -> AgentState:
+        result = await fix_generator.arun(fix_input(state))
+        print("\n[Fix Generator Agent]")
+        print(result)
+        state["fixes"] = result
+        return state
+
+    def optimizer_input(state: AgentState) -> Dict:
+        return {
             "fixes": state["fixes"],
             **state["input"]
-        })
+        }
+
+    def optimize_code(state: AgentState) -> AgentState:
+        result = code_optimizer.run(optimizer_input(state))
         print("\n[Code Optimizer Agent]")
         print(result)
         state["optimizations"] = result
         return state
-    
-    def get_approval(state: AgentState) -> AgentState:
-        result = user_approval.run({
+
+    async def aoptimize_code(state: AgentState) -> AgentState:
+        result = await code_optimizer.arun(optimizer_input(state))
+        print("\n[Code Optimizer Agent]")
+        print(result)
+        state["optimizations"] = result
+        return state
+
+    def approval_input(state: AgentState) -> Dict:
+        return {
             "changes": {
                 "layout": state["fixes"],
                 "content": state["fixes"],
                 "optimizations": state["optimizations"]
             }
-        })
+        }
+
+    def get_approval(state: AgentState) -> AgentState:
+        result = user_approval.run(approval_input(state))
+        print("\n[User Approval Agent]")
+        print(result)
+        state["approval"] = result
+        return state
+
+    async def aget_approval(state: AgentState) -> AgentState:
+        result = await user_approval.arun(approval_input(state))
         print("\n[User Approval Agent]")
         print(result)
         state["approval"] = result
@@ -82,8 +143,23 @@ def create_bug_fixer_graph() -> Graph:
         if not fixes or not isinstance(fixes, list):
             return fixed_code
 
+        # Template fixes name the exact span they replace. Apply those to the
+        # untouched source, last span first so earlier offsets stay valid
+        spanned = [
+            fix for fix in fixes
+            if isinstance(fix, dict) and isinstance(fix.get("span"), dict) and fix["span"].get("file") == code_type
+        ]
+        taken = []
+        for fix in sorted(spanned, key=lambda f: f["span"]["start"], reverse=True):
+            start, end = fix["span"]["start"], fix["span"]["end"]
+            if original_code[start:end] != fix.get("before") or any(start < e and s < end for s, e in taken):
+                print(f"Skipping stale or overlapping {fix.get('type')} at line {fix['span'].get('line')}")
+                continue
+            fixed_code = fixed_code[:start] + fix.get("after", "") + fixed_code[end:]
+            taken.append((start, end))
+
         for fix in fixes:
-            if not isinstance(fix, dict):
+            if not isinstance(fix, dict) or isinstance(fix.get("span"), dict):
                 continue
 
             before = fix.get("before", "")
@@ -219,17 +295,18 @@ def create_bug_fixer_graph() -> Graph:
         return state
 
     # Add nodes to the graph
-    workflow.add_node("validate_layout", validate_layout)
-    workflow.add_node("heal_content", heal_content)
-    workflow.add_node("generate_fixes", generate_fixes)
-    workflow.add_node("optimize_code", optimize_code)
-    workflow.add_node("get_approval", get_approval)
+    workflow.add_node("validate_layout", RunnableLambda(validate_layout, afunc=avalidate_layout))
+    workflow.add_node("heal_content", RunnableLambda(heal_content, afunc=aheal_content))
+    workflow.add_node("generate_fixes", RunnableLambda(generate_fixes, afunc=agenerate_fixes))
+    workflow.add_node("optimize_code", RunnableLambda(optimize_code, afunc=aoptimize_code))
+    workflow.add_node("get_approval", RunnableLambda(get_approval, afunc=aget_approval))
     workflow.add_node("process_approval", process_approval)
 
-    # Define the flow
-    workflow.set_entry_point("validate_layout")
-    workflow.add_edge("validate_layout", "heal_content")
-    workflow.add_edge("heal_content", "generate_fixes")
+    # Define the flow: layout and content analysis fan out from the start and
+    # join at generate_fixes, which waits for both branches
+    workflow.add_edge(START, "validate_layout")
+    workflow.add_edge(START, "heal_content")
+    workflow.add_edge(["validate_layout", "heal_content"], "generate_fixes")
     workflow.add_edge("generate_fixes", "optimize_code")
     workflow.add_edge("optimize_code", "get_approval")
     workflow.add_edge("get_approval", "process_approval")
@@ -239,13 +316,41 @@ def create_bug_fixer_graph() -> Graph:
     
     return app
 
-def run_bug_fixer(input_data: Dict) -> Dict:
-    """Run the bug fixer workflow"""
-    # Create the graph
+# Process-wide warm runtime: the compiled graph (and the agents captured by its
+# nodes) is built once and shared by every request. Nodes only read the agents
+# and write to the per-invocation state, so concurrent invokes are safe.
+_graph: Optional[Graph] = None
+_graph_lock = threading.Lock()
+
+def get_bug_fixer_graph() -> Graph:
+    """Return the shared compiled graph, building it on first use."""
+    global _graph
+    graph = _graph
+    if graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = create_bug_fixer_graph()
+            graph = _graph
+    return graph
+
+def warmup_bug_fixer() -> Graph:
+    """Build the shared graph ahead of the first request (e.g. on app startup)."""
+    return get_bug_fixer_graph()
+
+def reload_bug_fixer() -> Graph:
+    """Rebuild the agents and graph, e.g. after the best-practices PDF or keys change.
+
+    Requests already running keep the graph they started with; new requests
+    pick up the rebuilt one.
+    """
+    global _graph
     graph = create_bug_fixer_graph()
-    
-    # Initialize the state
-    initial_state = AgentState(
+    with _graph_lock:
+        _graph = graph
+    return graph
+
+def _initial_state(input_data: Dict) -> AgentState:
+    return AgentState(
         input=input_data,
         layout_issues={},
         content_issues={},
@@ -254,8 +359,19 @@ def run_bug_fixer(input_data: Dict) -> Dict:
         approval={},
         final_output={}
     )
+
+def run_bug_fixer(input_data: Dict) -> Dict:
+    """Run the bug fixer workflow"""
+    # Reuse the warm graph instead of rebuilding every agent per request
+    graph = get_bug_fixer_graph()
     
     # Run the workflow
-    result = graph.invoke(initial_state)
+    result = graph.invoke(_initial_state(input_data))
     
     return result["final_output"]
+
+async def arun_bug_fixer(input_data: Dict) -> Dict:
+    """Run the bug fixer workflow on the event loop (LLM calls never block a thread)"""
+    graph = get_bug_fixer_graph()
+    result = await graph.ainvoke(_initial_state(input_data))
+    return result["final_output"]
@@ -0,0 +1,33 @@
+from .css_index import CssRule, Declaration, SelectorIndex, selector_names
+from .css_scanner import scan as scan_css
+from .document import DocumentContext, EventHandler, build_document, document_for, document_stats
+from .js_parse import JS_PARSER, JsParser, JsParseResult, JsSyntaxError, parse_js
+from .references import Reference, ReferenceIndex, build_reference_index, reference_issues
+from .rule_engine import Rule, RuleEngine, RuleReport
+from .stacking import stacking_issues
+
+__all__ = [
+    'CssRule',
+    'Declaration',
+    'SelectorIndex',
+    'selector_names',
+    'scan_css',
+    'DocumentContext',
+    'EventHandler',
+    'build_document',
+    'document_for',
+    'document_stats',
+    'JS_PARSER',
+    'JsParser',
+    'JsParseResult',
+    'JsSyntaxError',
+    'parse_js',
+    'Reference',
+    'ReferenceIndex',
+    'build_reference_index',
+    'reference_issues',
+    'Rule',
+    'RuleEngine',
+    'RuleReport',
+    'stacking_issues'
+]
@@ -0,0 +1,276 @@
+import re
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import soupsieve
+from bs4 import Tag
+
+logger = logging.getLogger("Analysis-CSS-Index")
+
+Specificity = Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class Declaration:
+    name: str
+    value: str
+    important: bool = False
+    start: Optional[int] = None  # offset in the stylesheet, when known
+
+
+@dataclass(frozen=True)
+class CssRule:
+    """One style rule: its selector list and declarations, in source order."""
+    selectors: Tuple[str, ...]
+    declarations: Tuple[Declaration, ...]
+    line: Optional[int] = None
+    media: Optional[str] = None  # condition of an enclosing @media, if any
+    start: Optional[int] = None  # offsets of the rule in the stylesheet
+    end: Optional[int] = None
+
+    @property
+    def selector_text(self) -> str:
+        return ", ".join(self.selectors)
+
+
+@dataclass(frozen=True)
+class SelectorEntry:
+    """A single selector of a rule, ready to match."""
+    selector: str
+    specificity: Specificity
+    order: int  # source order of the rule; later wins on equal specificity
+    rule: CssRule
+    matcher: "soupsieve.SoupSieve"
+
+
+_ESCAPE = r"\\[0-9a-fA-F]{1,6}\s?|\\."
+_ESCAPE_RE = re.compile(_ESCAPE)
+_COMBINATOR = re.compile(r"\s*[>+~]\s*|\s+")
+_ID = re.compile(r"#(-?[_a-zA-Z][\w-]*)")
+_CLASS = re.compile(r"\.(-?[_a-zA-Z][\w-]*)")
+_TAG = re.compile(r"^([a-zA-Z][\w-]*)")
+_ATTRIBUTE = re.compile(r"\[[^\]]*\]")
+_PSEUDO_ELEMENT = re.compile(r"::[\w-]+|:(?:before|after|first-line|first-letter)\b")
+_PSEUDO_CLASS = re.compile(r"(?<!:):[\w-]+(?:\([^)]*\))?")
+
+
+def _blank_escapes(selector: str) -> str:
+    """Escapes (`\\:`, `\\31 `) replaced by as many "_", so they read as name characters."""
+    return _ESCAPE_RE.sub(lambda m: "_" * len(m.group()), selector)
+
+
+def _strip_brackets(selector: str) -> str:
+    """Selector with [...] and (...) contents blanked, so combinators inside them are ignored."""
+    out, depth = [], 0
+    for char in _blank_escapes(selector):
+        if char in "[(":
+            depth += 1
+        elif char in "])":
+            depth = max(0, depth - 1)
+        out.append("_" if depth and char not in "[(" else char)
+    return "".join(out)
+
+
+def rightmost_compound(selector: str) -> str:
+    """The compound selector that must match the element itself (`a .b > li.c` -> `li.c`)."""
+    blanked = _strip_brackets(selector.strip())
+    cut = 0
+    for match in _COMBINATOR.finditer(blanked):
+        if match.end() < len(blanked):
+            cut = match.end()
+    return selector.strip()[cut:]
+
+
+def bucket_key(selector: str) -> Tuple[str, str]:
+    """Bucket for the selector index: ("id", x), ("class", x), ("tag", x) or ("*", "").
+
+    Names are unescaped, so `.md\\:absolute` lands in the bucket of the
+    class an element actually carries, "md:absolute".
+    """
+    compound = rightmost_compound(selector)
+    ids, classes = selector_names(compound)
+    if ids:
+        return "id", ids[0]
+    if classes:
+        return "class", classes[0]
+    found = _TAG.match(compound)
+    if found and found.group(1) != "*":
+        return "tag", found.group(1).lower()
+    return "*", ""
+
+
+def specificity(selector: str) -> Specificity:
+    """(ids, classes/attributes/pseudo-classes, types/pseudo-elements)"""
+    text = _ATTRIBUTE.sub(".a", _blank_escapes(selector))
+    pseudo_elements = len(_PSEUDO_ELEMENT.findall(text))
+    text = _PSEUDO_ELEMENT.sub("", text)
+    # :not()/:is() count as their argument, :where() as nothing
+    text = re.sub(r":where\([^)]*\)", "", text)
+    text = re.sub(r":(?:not|is|matches|has)\(([^)]*)\)", r" \1", text)
+    ids = len(_ID.findall(text))
+    classes = len(_CLASS.findall(text)) + len(_PSEUDO_CLASS.findall(text))
+    text = _PSEUDO_CLASS.sub("", _CLASS.sub("", _ID.sub("", text)))
+    types = sum(1 for part in _COMBINATOR.split(text) if _TAG.match(part) and part != "*")
+    return ids, classes, types + pseudo_elements
+
+
+_ESCAPED_NAME = r"-?(?:[_a-zA-Z\x80-\U0010ffff]|" + _ESCAPE + r")(?:[\w\-\x80-\U0010ffff]|" + _ESCAPE + r")*"
+# Escapes are consumed on their own so `\.` is never read as a class
+_NAME_REF = re.compile(r"(?:" + _ESCAPE + r")|([#.])(" + _ESCAPED_NAME + ")")
+_FUNCTIONAL_PSEUDO = re.compile(r":[\w-]+\(")
+_HEX_ESCAPE = re.compile(r"\\([0-9a-fA-F]{1,6})\s?")
+
+
+def _unescape(name: str) -> str:
+    name = _HEX_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)) if int(m.group(1), 16) <= 0x10FFFF else "\ufffd", name)
+    return re.sub(r"\\(.)", r"\1", name)
+
+
+def selector_names(selector: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """(ids, classes) an element must have for `selector` to match anything.
+
+    Attribute selectors, strings and the arguments of functional
+    pseudo-classes (:not(), :is(), :nth-child() ...) are left out: a name in
+    those is optional or negated. Escapes are resolved, so `.sm\\:flex` is
+    the class "sm:flex".
+    """
+    text, out, depth, quote, index = selector, [], 0, None, 0
+    while index < len(text):
+        char = text[index]
+        if char == "\\" and not quote:
+            out.append(text[index:index + 2] if not depth else "")
+            index += 2
+            continue
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "\"'":
+            quote = char
+        elif char in "[(":
+            depth += 1
+        elif char in "])":
+            depth = max(0, depth - 1)
+            index += 1
+            continue
+        elif not depth:
+            # Drop a functional pseudo-class's name along with its argument
+            pseudo = _FUNCTIONAL_PSEUDO.match(text, index)
+            if pseudo:
+                depth += 1
+                index = pseudo.end()
+                continue
+            out.append(char)
+        index += 1
+    ids, classes = [], []
+    for match in _NAME_REF.finditer("".join(out)):
+        if match.group(1):
+            (ids if match.group(1) == "#" else classes).append(_unescape(match.group(2)))
+    return tuple(ids), tuple(classes)
+
+
+def parse_inline_style(style: str) -> List[Declaration]:
+    declarations = []
+    for part in style.split(";"):
+        name, sep, value = part.partition(":")
+        if not sep or not name.strip():
+            continue
+        value = value.strip()
+        important = value.lower().endswith("!important")
+        if important:
+            value = value[:-len("!important")].strip()
+        declarations.append(Declaration(name.strip().lower(), value, important))
+    return declarations
+
+
+class SelectorIndex:
+    """Style rules bucketed by the rightmost id, class or tag of each selector.
+
+    Browsers match selectors right to left and only try rules whose key
+    the element has; the same here. For an element, `candidates` gathers
+    the buckets for its id, classes and tag plus the few universal
+    selectors, and only those are matched in full. Selectors that cannot
+    apply to an element (pseudo-elements) are skipped, as are ones the
+    matcher does not support.
+    """
+
+    def __init__(self, rules: Iterable[CssRule]):
+        self.rules = tuple(rules)
+        self._buckets: Dict[Tuple[str, str], List[SelectorEntry]] = {}
+        self.skipped: List[str] = []
+        for order, rule in enumerate(self.rules):
+            for selector in rule.selectors:
+                if _PSEUDO_ELEMENT.search(_blank_escapes(selector)):
+                    continue
+                try:
+                    matcher = soupsieve.compile(selector)
+                except (soupsieve.SelectorSyntaxError, NotImplementedError) as e:
+                    self.skipped.append(selector)
+                    logger.debug(f"Unsupported selector {selector!r}: {e}")
+                    continue
+                entry = SelectorEntry(selector, specificity(selector), order, rule, matcher)
+                self._buckets.setdefault(bucket_key(selector), []).append(entry)
+        self._lock = threading.Lock()
+        self.tried = 0
+        self.matched = 0
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._buckets.values())
+
+    def candidates(self, elem: Tag) -> List[SelectorEntry]:
+        found = list(self._buckets.get(("*", ""), ()))
+        found += self._buckets.get(("tag", elem.name), ())
+        element_id = elem.get("id")
+        if element_id:
+            found += self._buckets.get(("id", element_id), ())
+        classes = elem.get("class") or ()
+        for cls in classes if isinstance(classes, list) else str(classes).split():
+            found += self._buckets.get(("class", cls), ())
+        return found
+
+    def match(self, elem: Tag) -> List[SelectorEntry]:
+        """Selectors matching `elem`, in cascade order (lowest precedence first)."""
+        seen, matched, tried = set(), [], 0
+        for entry in self.candidates(elem):
+            # An element with two classes can reach the same entry twice
+            if id(entry) in seen:
+                continue
+            seen.add(id(entry))
+            tried += 1
+            if entry.matcher.match(elem):
+                matched.append(entry)
+        with self._lock:
+            self.tried += tried
+            self.matched += len(matched)
+        return sorted(matched, key=lambda e: (e.specificity, e.order))
+
+    def computed(self, elem: Tag, properties: Optional[Iterable[str]] = None) -> Dict[str, Tuple[str, str]]:
+        """Cascaded value of each property: {name: (value, where it came from)}.
+
+        `where` is the winning selector, or "style" for the inline attribute.
+        Only specificity, source order and !important are considered; there
+        is no inheritance and no media evaluation.
+        """
+        wanted = set(properties) if properties is not None else None
+        winners: Dict[str, Tuple[Tuple, str, str]] = {}
+
+        def offer(declaration: Declaration, rank: Tuple, source: str):
+            if wanted is not None and declaration.name not in wanted:
+                return
+            key = (declaration.important,) + rank
+            current = winners.get(declaration.name)
+            if current is None or key >= current[0]:
+                winners[declaration.name] = (key, declaration.value, source)
+
+        for entry in self.match(elem):
+            for declaration in entry.rule.declarations:
+                offer(declaration, (0, entry.specificity, entry.order), entry.selector)
+        style = elem.get("style")
+        if style:
+            for declaration in parse_inline_style(style):
+                offer(declaration, (1, (0, 0, 0), 0), "style")
+        return {name: (value, source) for name, (_, value, source) in winners.items()}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"selectors": len(self), "skipped": len(self.skipped), "tried": self.tried, "matched": self.matched}
@@ -0,0 +1,236 @@
+import bisect
+import re
+from typing import Iterator, List, Optional, Tuple
+
+from analysis.css_index import CssRule, Declaration
+
+# Characters that change the scanner's state; everything between them is
+# copied through in one slice
+_SPECIAL = re.compile(r"""/\*|["'{};()\\]""")
+_IMPORTANT = re.compile(r"!\s*important\s*$", re.I)
+_AT_KEYWORD = re.compile(r"@([\w-]+)\s*(.*)", re.S)
+
+# Block at-rules whose contents are style rules (like a stylesheet of their own)
+GROUPING_RULES = {"media", "supports", "layer", "container", "document", "-moz-document", "scope"}
+
+
+class LineIndex:
+    """1-based line numbers for offsets into a text."""
+
+    def __init__(self, text: str):
+        self._newlines = [m.start() for m in re.finditer("\n", text)]
+
+    def line(self, offset: int) -> int:
+        return bisect.bisect_right(self._newlines, offset - 1) + 1
+
+
+def split_selectors(prelude: str) -> Tuple[str, ...]:
+    """Split a selector list on top-level commas (not those in :is(a, b) or [x=","])."""
+    if "(" not in prelude and "[" not in prelude and '"' not in prelude and "'" not in prelude:
+        parts = prelude.split(",")
+    else:
+        parts, depth, quote, start = [], 0, None, 0
+        for index, char in enumerate(prelude):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "\"'":
+                quote = char
+            elif char in "([":
+                depth += 1
+            elif char in ")]":
+                depth = max(0, depth - 1)
+            elif char == "," and depth == 0:
+                parts.append(prelude[start:index])
+                start = index + 1
+        parts.append(prelude[start:])
+    return tuple(" ".join(part.split()) for part in parts if part.strip())
+
+
+def _nested_media(outer: Optional[str], inner: str) -> Optional[str]:
+    """Condition of an @media inside another: both must hold.
+
+    `print` then `(min-width: 600px)` is `print and (min-width: 600px)`;
+    query lists combine pairwise (`a, b` then `c` is `a and c, b and c`).
+    """
+    if not inner:
+        return outer
+    if not outer:
+        return inner
+    if "," not in outer and "," not in inner:
+        return f"{outer} and {inner}"
+    return ", ".join(f"{o} and {i}" for o in split_selectors(outer) for i in split_selectors(inner))
+
+
+def parse_declaration(text: str, start: Optional[int] = None) -> Optional[Declaration]:
+    name, sep, value = text.partition(":")
+    name = name.strip()
+    if not sep or not name:
+        return None
+    value = value.strip()
+    important = _IMPORTANT.search(value)
+    if important:
+        value = value[:important.start()].rstrip()
+    # Custom properties are case-sensitive; everything else is not
+    return Declaration(name if name.startswith("--") else name.lower(), value, bool(important), start)
+
+
+def scan(css: str) -> Iterator[CssRule]:
+    """Stream the style rules of a stylesheet in source order.
+
+    A tokenizer-level scanner, not a parser: it tracks comments, strings,
+    escapes, parentheses and braces, and turns each `selectors { ... }`
+    block into a CssRule with its declarations and source offsets. Rules
+    inside @media (and other grouping at-rules) carry the media condition,
+    joined with `and` across nested @media.
+    Other at-rules (@font-face, @keyframes, @page, @import ...) and nested
+    rules inside a style rule are skipped. Malformed input never raises:
+    an unclosed block ends at the end of the text, stray `}` are ignored.
+    """
+    lines = LineIndex(css)
+    # Open blocks: ("group", media) | ("rule", selectors, start, media) | ("skip",)
+    stack: List[tuple] = []
+    pieces: List[str] = []  # current prelude or declaration, comments removed
+    segment = 0  # start of the text not yet copied into `pieces`
+    text_start = 0  # offset where the current prelude or declaration began
+    declarations: List[Declaration] = []
+    depth = 0  # parentheses: `;` inside url(data:...;base64,...) is not a terminator
+    pos, length = 0, len(css)
+
+    def take(end: int) -> str:
+        pieces.append(css[segment:end])
+        text = "".join(pieces)
+        pieces.clear()
+        return text
+
+    def media() -> Optional[str]:
+        for frame in reversed(stack):
+            if frame[0] == "group":
+                return frame[1]
+            if frame[0] == "rule":
+                return frame[3]
+        return None
+
+    def add_declaration(text: str):
+        if text.strip():
+            declaration = parse_declaration(text, text_start + len(text) - len(text.lstrip()))
+            if declaration is not None:
+                declarations.append(declaration)
+
+    while pos < length:
+        match = _SPECIAL.search(css, pos)
+        if match is None:
+            break
+        index = match.start()
+        token = match.group()
+        if token == "/*":
+            close = css.find("*/", index + 2)
+            end = length if close < 0 else close + 2
+            pieces.append(css[segment:index])
+            segment = pos = end
+            continue
+        if token in "\"'":
+            # Skip to the closing quote, honouring escapes; strings end at a newline
+            scan_at = index + 1
+            while True:
+                close = _string_end(css, scan_at, token)
+                if close < 0:
+                    pos = length
+                    break
+                if css[close] == "\\":
+                    scan_at = close + 2
+                    continue
+                pos = close + 1
+                break
+            continue
+        if token == "\\":
+            pos = index + 2
+            continue
+        if token == "(":
+            depth += 1
+            pos = index + 1
+            continue
+        if token == ")":
+            depth = max(0, depth - 1)
+            pos = index + 1
+            continue
+        if token == ";" and depth:
+            pos = index + 1
+            continue
+
+        frame = stack[-1] if stack else None
+        if token == "{":
+            prelude = take(index).strip()
+            depth = 0
+            if frame is not None and frame[0] != "group":
+                # Nested rule in a style rule, or anything inside a skipped block
+                stack.append(("skip",))
+            elif prelude.startswith("@"):
+                at = _AT_KEYWORD.match(prelude)
+                name = at.group(1).lower() if at else ""
+                if name in GROUPING_RULES:
+                    condition = _nested_media(media(), " ".join(at.group(2).split())) if name == "media" else media()
+                    stack.append(("group", condition))
+                else:
+                    stack.append(("skip",))
+            else:
+                stack.append(("rule", split_selectors(prelude), text_start + _leading_space(css, text_start, index), media()))
+                declarations = []
+        elif token == ";":
+            text = take(index)
+            if frame is not None and frame[0] == "rule":
+                add_declaration(text)
+        else:  # "}"
+            text = take(index)
+            depth = 0
+            if frame is not None:
+                stack.pop()
+                if frame[0] == "rule":
+                    add_declaration(text)
+                    if frame[1]:
+                        yield CssRule(
+                            selectors=frame[1],
+                            declarations=tuple(declarations),
+                            line=lines.line(frame[2]),
+                            media=frame[3],
+                            start=frame[2],
+                            end=index + 1,
+                        )
+                    declarations = []
+        segment = pos = index + 1
+        text_start = segment
+
+    # Unclosed style rule at the end of the text: keep what it has
+    for frame in reversed(stack):
+        if frame[0] == "rule":
+            add_declaration(take(length))
+            if frame[1]:
+                yield CssRule(frame[1], tuple(declarations), lines.line(frame[2]), frame[3], frame[2], length)
+            break
+
+
+def _string_end(css: str, start: int, quote: str) -> int:
+    """Offset of the closing quote or of the next backslash; -1 if neither comes."""
+    close = css.find(quote, start)
+    escape = css.find("\\", start, close if close >= 0 else len(css))
+    newline = css.find("\n", start, close if close >= 0 else len(css))
+    if escape >= 0 and (newline < 0 or escape < newline):
+        return escape
+    if newline >= 0:
+        # Unterminated string: CSS ends it at the line break
+        return newline
+    return close
+
+
+def _leading_space(css: str, start: int, end: int) -> int:
+    """Length of the whitespace (and comments) before a prelude's first character."""
+    offset = start
+    while offset < end:
+        if css[offset].isspace():
+            offset += 1
+        elif css.startswith("/*", offset):
+            close = css.find("*/", offset + 2)
+            offset = end if close < 0 else close + 2
+        else:
+            break
+    return offset - start
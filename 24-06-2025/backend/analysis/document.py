@@ -0,0 +1,200 @@
+import hashlib
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from bs4 import BeautifulSoup, Tag
+from lxml import etree
+
+from analysis.css_index import CssRule, SelectorIndex
+from analysis.css_scanner import scan
+from analysis.js_parse import JsParseResult, JsSyntaxError, parse_js
+from llm.singleflight import SingleFlight
+
+logger = logging.getLogger("Analysis-Document")
+
+# Parsed documents kept for reuse; agents of one request share an entry
+DOCUMENT_CACHE_SIZE = int(os.getenv("ANALYSIS_DOCUMENT_CACHE_SIZE", "32"))
+
+
+@dataclass(frozen=True)
+class EventHandler:
+    element: Tag
+    attribute: str  # e.g. "onclick"
+    code: str
+
+
+@dataclass(frozen=True)
+class DocumentContext:
+    """One submission parsed once: DOM, style rules, JS AST and lookup indexes.
+
+    Shared by every agent working on the same request, so treat it as
+    read-only. The soup and AST are plain mutable objects, shared through
+    caches: never modify them. `css_rules` come from the streaming scanner, with source
+    offsets; `selectors` indexes them for matching against elements.
+    `js_ast` is the ESTree program as plain dicts (see analysis.js_parse):
+    partial after a fatal syntax error, None if the parse timed out or ran
+    out of memory. `js_parse.status` says which; `js_errors` lists the
+    syntax errors.
+    """
+    html: str
+    css: str
+    javascript: str
+    soup: BeautifulSoup
+    css_rules: Tuple[CssRule, ...]
+    selectors: SelectorIndex
+    js_ast: Optional[Dict[str, Any]]
+    js_errors: Tuple[JsSyntaxError, ...]
+    js_parse: Optional[JsParseResult]
+    elements: Tuple[Tag, ...]  # document order
+    element_lines: Mapping[int, int]  # id(element) -> 1-based source line of its start tag
+    ids: Mapping[str, Tuple[Tag, ...]]
+    classes: Mapping[str, Tuple[Tag, ...]]
+    tags: Mapping[str, Tuple[Tag, ...]]
+    inline_styles: Tuple[Tuple[Tag, str], ...]
+    event_handlers: Tuple[EventHandler, ...]
+    parse_seconds: float
+
+    def line(self, elem: Optional[Tag]) -> Optional[int]:
+        """Source line of an element's start tag (of its parent, for a text node), if known."""
+        if elem is not None and not isinstance(elem, Tag):
+            elem = elem.parent
+        return self.element_lines.get(id(elem)) if elem is not None else None
+
+    def by_id(self, element_id: str) -> Tuple[Tag, ...]:
+        return self.ids.get(element_id, ())
+
+    def by_class(self, name: str) -> Tuple[Tag, ...]:
+        return self.classes.get(name, ())
+
+    def by_tag(self, name: str) -> Tuple[Tag, ...]:
+        return self.tags.get(name.lower(), ())
+
+
+def content_key(html: str, css: str, javascript: str) -> str:
+    digest = hashlib.sha256()
+    for part in (html, css, javascript):
+        data = part.encode("utf-8")
+        # Length-prefixed so ("ab", "") and ("a", "b") differ
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _element_lines(html: str, elements: List[Tag]) -> Dict[int, int]:
+    """Source line of each element, from a second lxml parse of the same HTML.
+
+    The soup drops the line numbers lxml reports, but both parses yield the
+    same elements in the same order, so they are paired by position. Pairing
+    stops where the trees differ: a missing line is better than a wrong one.
+    """
+    if not html.strip():
+        return {}
+    try:
+        root = etree.fromstring(html, etree.HTMLParser())
+    except (etree.Error, ValueError):
+        return {}
+    lines = {}
+    if root is None:
+        return lines
+    parsed = (node for node in root.iter() if isinstance(node.tag, str))
+    for elem, node in zip(elements, parsed):
+        if node.tag.lower() != elem.name.lower():
+            break
+        if node.sourceline:
+            lines[id(elem)] = node.sourceline
+    return lines
+
+
+def build_document(html: str = "", css: str = "", javascript: str = "") -> DocumentContext:
+    """Parse a submission and index it. Prefer `document_for`, which reuses parses."""
+    started = time.perf_counter()
+    soup = BeautifulSoup(html or "", 'lxml')
+
+    elements: List[Tag] = []
+    ids: Dict[str, List[Tag]] = {}
+    classes: Dict[str, List[Tag]] = {}
+    tags: Dict[str, List[Tag]] = {}
+    inline_styles: List[Tuple[Tag, str]] = []
+    handlers: List[EventHandler] = []
+    for elem in soup.find_all(True):
+        elements.append(elem)
+        tags.setdefault(elem.name, []).append(elem)
+        for name, value in elem.attrs.items():
+            if name == "id" and value:
+                ids.setdefault(value, []).append(elem)
+            elif name == "class":
+                for cls in value if isinstance(value, list) else str(value).split():
+                    classes.setdefault(cls, []).append(elem)
+            elif name == "style":
+                inline_styles.append((elem, value))
+            elif name.startswith("on"):
+                handlers.append(EventHandler(elem, name, value))
+
+    css_rules = tuple(scan(css)) if css else ()
+
+    # Cached by content hash and time-boxed: a huge bundle cannot stall the request
+    js_parse = parse_js(javascript) if javascript else None
+
+    def frozen(index: Dict[str, List[Tag]]) -> Mapping[str, Tuple[Tag, ...]]:
+        return MappingProxyType({key: tuple(value) for key, value in index.items()})
+
+    return DocumentContext(
+        html=html, css=css, javascript=javascript,
+        soup=soup, css_rules=css_rules, selectors=SelectorIndex(css_rules),
+        js_ast=js_parse.ast if js_parse else None,
+        js_errors=js_parse.errors if js_parse else (),
+        js_parse=js_parse,
+        elements=tuple(elements), element_lines=MappingProxyType(_element_lines(html, elements)), ids=frozen(ids), classes=frozen(classes), tags=frozen(tags),
+        inline_styles=tuple(inline_styles), event_handlers=tuple(handlers),
+        parse_seconds=time.perf_counter() - started,
+    )
+
+
+_lock = threading.Lock()
+_documents: "OrderedDict[str, DocumentContext]" = OrderedDict()
+_parsing = SingleFlight()
+_stats = {"parses": 0, "hits": 0}
+
+
+def document_for(input_data: Dict[str, Any]) -> DocumentContext:
+    """Shared DocumentContext for a request's {html, css, javascript}.
+
+    Parses happen once per distinct submission: agents running in parallel
+    branches join the parse already in flight, and later agents get the
+    cached result.
+    """
+    html = input_data.get('html', '') or ''
+    css = input_data.get('css', '') or ''
+    javascript = input_data.get('javascript', '') or ''
+    key = content_key(html, css, javascript)
+    with _lock:
+        doc = _documents.get(key)
+        if doc is not None:
+            _documents.move_to_end(key)
+            _stats["hits"] += 1
+            return doc
+    return _parsing.do(key, lambda: _parse_and_store(key, html, css, javascript))
+
+
+def _parse_and_store(key: str, html: str, css: str, javascript: str) -> DocumentContext:
+    doc = build_document(html, css, javascript)
+    logger.info(f"Parsed document {key[:12]} in {doc.parse_seconds * 1000:.1f}ms "
+                f"({len(doc.elements)} elements, {len(doc.ids)} ids, {len(doc.event_handlers)} handlers)")
+    with _lock:
+        _stats["parses"] += 1
+        _documents[key] = doc
+        _documents.move_to_end(key)
+        while len(_documents) > DOCUMENT_CACHE_SIZE:
+            _documents.popitem(last=False)
+    return doc
+
+
+def document_stats() -> Dict[str, int]:
+    with _lock:
+        return {"parses": _stats["parses"], "hits": _stats["hits"], "cached": len(_documents)}
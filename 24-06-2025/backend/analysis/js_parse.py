@@ -0,0 +1,290 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import esprima
+from esprima.objects import Object
+
+from llm.singleflight import SingleFlight
+
+logger = logging.getLogger("Analysis-JS-Parse")
+
+# Wall-clock limit for one parse; a stuck worker is killed when it runs out
+JS_PARSE_TIMEOUT = float(os.getenv("ANALYSIS_JS_PARSE_TIMEOUT", "10"))
+# Address-space limit of each parser process (Linux/macOS), in MB
+JS_PARSE_MEMORY_MB = int(os.getenv("ANALYSIS_JS_PARSE_MEMORY_MB", "1024"))
+JS_PARSE_WORKERS = int(os.getenv("ANALYSIS_JS_PARSE_WORKERS", "2"))
+# Scripts up to this size are parsed in the calling thread: a few hundred ms
+# at most, less than handing them to another process
+JS_INLINE_BYTES = int(os.getenv("ANALYSIS_JS_INLINE_BYTES", "50000"))
+JS_PARSE_CACHE_SIZE = int(os.getenv("ANALYSIS_JS_PARSE_CACHE_SIZE", "64"))
+
+_OPTIONS = {"loc": True, "range": True}
+
+
+@dataclass(frozen=True)
+class JsSyntaxError:
+    message: str
+    line: Optional[int] = None
+    column: Optional[int] = None
+    index: Optional[int] = None
+
+    def __str__(self) -> str:
+        return self.message
+
+
+@dataclass(frozen=True)
+class JsParseResult:
+    """Outcome of parsing one script.
+
+    status is one of:
+      ok       - `ast` is the whole program; `errors` may list problems the
+                 tolerant parser stepped over (e.g. an illegal `return`)
+      partial  - a fatal syntax error; `ast` holds the statements completed
+                 before it (tolerant mode only)
+      error    - a fatal syntax error and no AST
+      timeout  - the parse ran out of time and its worker was killed
+      memory   - the parse hit the memory limit
+      failed   - the parser process died
+    `ast` is an ESTree program as plain dicts and lists, with `loc` and
+    `range` on every node.
+    """
+    status: str
+    ast: Optional[Dict[str, Any]]
+    errors: Tuple[JsSyntaxError, ...] = ()
+    seconds: float = 0.0
+    where: str = "inline"  # or "pool"
+
+    @property
+    def parsed(self) -> bool:
+        return self.ast is not None
+
+
+def _plain(value: Any) -> Any:
+    """esprima nodes as dicts and lists: picklable and cheap to walk."""
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    if isinstance(value, Object):
+        return {key: _plain(item) for key, item in value.__dict__.items()}
+    return value
+
+
+def _syntax_error(error: Any) -> JsSyntaxError:
+    get = error.get if isinstance(error, dict) else lambda name: getattr(error, name, None)
+    message = get("message") or str(error)
+    if message.startswith("Error: "):
+        message = message[len("Error: "):]
+    return JsSyntaxError(message, get("lineNumber"), get("column"), get("index"))
+
+
+def _recover(source: str, error: esprima.Error) -> Dict[str, Any]:
+    """Statements the parser completed before a fatal error, as a partial program.
+
+    The text up to the error is parsed again with a delegate that sees each
+    node as it is finished; the outermost finished nodes are kept. Statements
+    from the block the error interrupted come out at the top level, so code
+    inside a broken function is still visible to whoever walks the AST.
+    """
+    finished: List[Tuple[int, Any]] = []
+
+    def delegate(node, metadata):
+        start = metadata.start.offset
+        # Children finish before their parent, and start at or after it
+        while finished and finished[-1][0] >= start:
+            finished.pop()
+        finished.append((start, node))
+        return node
+
+    try:
+        esprima.parseScript(source[:error.index], _OPTIONS, delegate)
+    except esprima.Error:
+        pass
+    body = []
+    for _, node in finished:
+        if node.type.endswith(("Statement", "Declaration")):
+            body.append(_plain(node))
+        elif node.type.endswith("Expression"):
+            expression = _plain(node)
+            body.append({"type": "ExpressionStatement", "expression": expression,
+                         "loc": expression.get("loc"), "range": expression.get("range")})
+    return {"type": "Program", "sourceType": "script", "body": body}
+
+
+def parse_source(source: str, tolerant: bool = True) -> JsParseResult:
+    """Parse a script in this process, with no time or memory limit."""
+    started = time.perf_counter()
+    try:
+        try:
+            options = dict(_OPTIONS, tolerant=True) if tolerant else _OPTIONS
+            tree = esprima.parseScript(source, options)
+            errors = tuple(_syntax_error(e) for e in getattr(tree, "errors", None) or ())
+            status, ast = "ok", _plain(tree)
+            ast.pop("errors", None)
+        except esprima.Error as e:
+            errors = (_syntax_error(e),)
+            if tolerant:
+                status, ast = "partial", _recover(source, e)
+            else:
+                status, ast = "error", None
+    except MemoryError:
+        status, ast, errors = "memory", None, ()
+    except RecursionError:
+        status, ast, errors = "error", None, (JsSyntaxError("Script is nested too deeply to parse"),)
+    return JsParseResult(status, ast, errors, time.perf_counter() - started)
+
+
+def _limit_memory(megabytes: int):
+    """Pool initializer: cap the worker's address space so a runaway parse raises MemoryError."""
+    try:
+        import resource
+    except ImportError:  # Windows: no limit
+        return
+    limit = megabytes * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError):
+        pass
+
+
+class JsParser:
+    """Cached, time-boxed JavaScript parsing.
+
+    Results are kept by content hash, and concurrent requests for the same
+    script share one parse. Small scripts are parsed inline. Bigger ones go
+    to a process pool whose workers run under a memory limit; if a parse is
+    still running at the timeout, the pool is torn down (killing the worker)
+    and replaced, so a huge vendor bundle costs at most `timeout` seconds,
+    once. Timeouts and memory failures are cached like any other result.
+    """
+
+    def __init__(self, timeout: float = JS_PARSE_TIMEOUT, memory_mb: int = JS_PARSE_MEMORY_MB,
+                 workers: int = JS_PARSE_WORKERS, inline_bytes: int = JS_INLINE_BYTES,
+                 cache_size: int = JS_PARSE_CACHE_SIZE):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.workers = workers
+        self.inline_bytes = inline_bytes
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._results: "OrderedDict[str, JsParseResult]" = OrderedDict()
+        self._parsing = SingleFlight()
+        self._counts = {"parses": 0, "hits": 0, "pooled": 0, "timeout": 0, "memory": 0, "recycled": 0}
+
+    def parse(self, source: str, tolerant: bool = True) -> JsParseResult:
+        key = ("t:" if tolerant else "s:") + hashlib.sha256(source.encode("utf-8")).hexdigest()
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self._counts["hits"] += 1
+                return result
+        return self._parsing.do(key, lambda: self._parse_and_store(key, source, tolerant))
+
+    def _parse_and_store(self, key: str, source: str, tolerant: bool) -> JsParseResult:
+        if len(source) <= self.inline_bytes:
+            result = parse_source(source, tolerant)
+        else:
+            result = self._parse_in_pool(source, tolerant)
+        level = logging.WARNING if result.status in ("timeout", "memory", "failed") else logging.INFO
+        logger.log(level, f"Parsed script {key[2:14]} ({len(source)} chars) {result.where} "
+                          f"in {result.seconds * 1000:.1f}ms: {result.status}, {len(result.errors)} errors")
+        with self._lock:
+            self._counts["parses"] += 1
+            if result.status in ("timeout", "memory"):
+                self._counts[result.status] += 1
+            if result.status != "failed":
+                self._results[key] = result
+                self._results.move_to_end(key)
+                while len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+        return result
+
+    def _parse_in_pool(self, source: str, tolerant: bool) -> JsParseResult:
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        with self._lock:
+            self._counts["pooled"] += 1
+        # A second try covers a pool that broke under us because another
+        # parse timed out and recycled it
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                future = pool.submit(parse_source, source, tolerant)
+                result = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                return JsParseResult(result.status, result.ast, result.errors, time.perf_counter() - started, "pool")
+            except FutureTimeout:
+                self._recycle(pool)
+                return JsParseResult("timeout", None, (), time.perf_counter() - started, "pool")
+            except (BrokenProcessPool, RuntimeError) as e:
+                # RuntimeError: submit() on a pool another thread just shut down
+                if self._recycle(pool):
+                    # Nobody else killed it: a worker died on its own, which
+                    # under the address-space limit means it ran out of memory
+                    return JsParseResult("memory", None, (), time.perf_counter() - started, "pool")
+                if attempt or time.perf_counter() >= deadline:
+                    return JsParseResult("failed", None, (JsSyntaxError(f"Parser process died: {e}"),),
+                                         time.perf_counter() - started, "pool")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: the server has threads (and their locks) that a forked child would inherit
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_limit_memory,
+                    initargs=(self.memory_mb,),
+                )
+            return self._pool
+
+    def _recycle(self, pool: ProcessPoolExecutor) -> bool:
+        """Kill a pool's workers and let the next parse start a fresh one.
+
+        False if another thread had already replaced the pool.
+        """
+        with self._lock:
+            if self._pool is not pool:
+                return False
+            self._pool = None
+            self._counts["recycled"] += 1
+        # shutdown() waits for running tasks, which is the one thing we cannot
+        # do for a stuck parse: terminate the workers first
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        # Quick now that the workers are gone; reaps them and the pool's manager thread
+        pool.shutdown(wait=True, cancel_futures=True)
+        logger.warning("JS parser pool recycled")
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(metric name, labels, value) samples for Telemetry.add_gauges."""
+        with self._lock:
+            samples = [(f"analysis_js_{name}", {}, value) for name, value in self._counts.items()]
+            samples.append(("analysis_js_cached", {}, len(self._results)))
+        return samples
+
+
+# Shared by every DocumentContext build
+JS_PARSER = JsParser()
+
+
+def parse_js(source: str, tolerant: bool = True) -> JsParseResult:
+    return JS_PARSER.parse(source, tolerant)
@@ -0,0 +1,276 @@
+import os
+import re
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from analysis.css_index import selector_names
+from analysis.css_scanner import split_selectors
+from analysis.document import DocumentContext
+
+logger = logging.getLogger("Analysis-References")
+
+# Dead CSS rules reported per document; framework sheets can have hundreds
+UNUSED_SELECTOR_LIMIT = int(os.getenv("ANALYSIS_UNUSED_SELECTOR_LIMIT", "20"))
+
+# Calls whose first argument names the elements they look up
+ID_LOOKUPS = {"getElementById"}
+CLASS_LOOKUPS = {"getElementsByClassName"}
+SELECTOR_LOOKUPS = {"querySelector", "querySelectorAll"}
+JQUERY = {"$", "jQuery"}
+
+# Markup inside JS strings (innerHTML templates, $('<div class="x">'))
+_MARKUP_ID = re.compile(r"""\bid\s*=\s*["']([^"'\s]+)["']""")
+_MARKUP_CLASS = re.compile(r"""\bclass\s*=\s*["']([^"']+)["']""")
+
+
+@dataclass(frozen=True)
+class Reference:
+    """A place in the JS or CSS that only works if elements with these ids/classes exist."""
+    file: str  # "js" or "css"
+    via: str  # "getElementById", "querySelector", "$", ... or "selector" for a CSS rule
+    ids: Tuple[str, ...]
+    classes: Tuple[str, ...]
+    text: str  # the lookup call as written, or the CSS selector
+    line: Optional[int] = None
+    start: Optional[int] = None  # offsets in the file (for CSS: of the whole rule)
+    end: Optional[int] = None
+    selector: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ReferenceIndex:
+    """Every id/class reference in a submission, and every id/class the page can have.
+
+    `ids` and `classes` are the HTML's, plus the ones scripts add at
+    runtime (el.id = ..., classList.add(...), setAttribute, markup in
+    strings), so a CSS rule for a class the script toggles is not dead.
+    """
+    references: Tuple[Reference, ...]
+    ids: frozenset
+    classes: frozenset
+
+    def missing(self, reference: Reference) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """(ids, classes) of `reference` that nothing on the page has."""
+        return (tuple(name for name in reference.ids if name not in self.ids),
+                tuple(name for name in reference.classes if name not in self.classes))
+
+    def broken(self) -> List[Tuple[Reference, Tuple[str, ...], Tuple[str, ...]]]:
+        """(reference, missing ids, missing classes) for each reference that matches nothing."""
+        found = []
+        for reference in self.references:
+            ids, classes = self.missing(reference)
+            if ids or classes:
+                found.append((reference, ids, classes))
+        return found
+
+
+def _string(node: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Value of a string literal or a template literal without ${...}."""
+    if not isinstance(node, dict):
+        return None
+    if node.get("type") == "Literal" and isinstance(node.get("value"), str):
+        return node["value"]
+    if node.get("type") == "TemplateLiteral" and not node.get("expressions"):
+        return node["quasis"][0]["value"]["cooked"]
+    return None
+
+
+def _name(node: Dict[str, Any]) -> Optional[str]:
+    """Property name of a member expression (obj.name or obj["name"])."""
+    prop = node.get("property") or {}
+    if not node.get("computed") and prop.get("type") == "Identifier":
+        return prop["name"]
+    return _string(prop) if node.get("computed") else None
+
+
+def _walk(ast: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    stack: List[Any] = [ast]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+            continue
+        if "type" in item:
+            yield item
+        for key, value in item.items():
+            if key not in ("loc", "range") and isinstance(value, (dict, list)):
+                stack.append(value)
+
+
+def _add_markup(text: str, ids: Set[str], classes: Set[str]):
+    if "=" in text:
+        ids.update(_MARKUP_ID.findall(text))
+        for value in _MARKUP_CLASS.findall(text):
+            classes.update(value.split())
+
+
+def _js_references(doc: DocumentContext, ids: Set[str], classes: Set[str]) -> List[Reference]:
+    """Lookups in the script, and (into ids/classes) what the script creates."""
+    js, found = doc.javascript, []
+    for node in _walk(doc.js_ast):
+        kind = node["type"]
+        if kind == "Literal":
+            if isinstance(node.get("value"), str):
+                _add_markup(node["value"], ids, classes)
+            continue
+        if kind == "TemplateElement":
+            _add_markup((node.get("value") or {}).get("cooked") or "", ids, classes)
+            continue
+        if kind == "AssignmentExpression":
+            # el.id = "x"; el.className = "a b"
+            left = node.get("left") or {}
+            value = _string(node.get("right"))
+            if left.get("type") == "MemberExpression" and value is not None:
+                name = _name(left)
+                if name == "id":
+                    ids.add(value.strip())
+                elif name == "className":
+                    classes.update(value.split())
+            continue
+        if kind != "CallExpression":
+            continue
+        callee = node["callee"]
+        member = callee["type"] == "MemberExpression"
+        if callee["type"] == "Identifier":
+            method = callee["name"]
+        elif member:
+            method = _name(callee)
+        else:
+            continue
+        args = node.get("arguments") or []
+        first = _string(args[0]) if args else None
+
+        # el.classList.add("open"), $(el).addClass("open"), el.setAttribute("id", "x")
+        target = callee.get("object") if member else None
+        if method in ("add", "toggle", "replace") and target and target.get("type") == "MemberExpression" \
+                and _name(target) == "classList":
+            classes.update(value for value in map(_string, args) if value)
+            continue
+        if method == "addClass" and first:
+            classes.update(first.split())
+            continue
+        if method in ("setAttribute", "attr") and first in ("id", "class") and len(args) > 1:
+            value = _string(args[1]) or ""
+            if first == "id":
+                ids.update(value.split()[:1])
+            else:
+                classes.update(value.split())
+            continue
+
+        if first is None:
+            continue
+        if method in ID_LOOKUPS and member:
+            names, selector = ((first.strip(),), ()), None
+        elif method in CLASS_LOOKUPS and member:
+            names, selector = ((), tuple(first.split())), None
+        elif (method in SELECTOR_LOOKUPS and member) or (method in JQUERY and not member):
+            if first.lstrip().startswith("<"):
+                continue  # $('<div>...'): creates elements, looks nothing up
+            names, selector = _selector_list_names(first), first
+        else:
+            continue
+        if not names[0] and not names[1]:
+            continue
+        start, end = node.get("range") or (None, None)
+        found.append(Reference(
+            file="js", via=method, ids=names[0], classes=names[1],
+            text=js[start:end] if start is not None else first,
+            line=((node.get("loc") or {}).get("start") or {}).get("line"),
+            start=start, end=end, selector=selector,
+        ))
+    return found
+
+
+def _selector_list_names(selectors: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Names a selector list needs to match anything: those every alternative needs."""
+    required = None
+    for selector in split_selectors(selectors):
+        ids, classes = selector_names(selector)
+        names = {("id", name) for name in ids} | {("class", name) for name in classes}
+        required = names if required is None else required & names
+    required = sorted(required or ())
+    return (tuple(name for kind, name in required if kind == "id"),
+            tuple(name for kind, name in required if kind == "class"))
+
+
+def _css_references(doc: DocumentContext) -> List[Reference]:
+    """One reference per selector, including those that need no id or class
+    (`div`, `p a`): such a selector can always match, and keeps its rule live."""
+    found = []
+    for rule in doc.css_rules:
+        for selector in rule.selectors:
+            ids, classes = selector_names(selector)
+            found.append(Reference(
+                file="css", via="selector", ids=ids, classes=classes, text=selector,
+                line=rule.line, start=rule.start, end=rule.end, selector=selector,
+            ))
+    return found
+
+
+def build_reference_index(doc: DocumentContext) -> ReferenceIndex:
+    """Collect the references of a parsed submission (JS AST and style rules)."""
+    ids, classes = set(doc.ids), set(doc.classes)
+    references = _js_references(doc, ids, classes) if doc.js_ast is not None else []
+    references += _css_references(doc)
+    references.sort(key=lambda r: (r.file, r.start if r.start is not None else -1))
+    return ReferenceIndex(tuple(references), frozenset(ids), frozenset(classes))
+
+
+def _names(ids: Tuple[str, ...], classes: Tuple[str, ...]) -> str:
+    parts = [f'id "{name}"' for name in ids] + [f'class "{name}"' for name in classes]
+    return " or ".join(parts) if len(parts) < 3 else ", ".join(parts[:-1]) + f" or {parts[-1]}"
+
+
+def reference_issues(doc: DocumentContext) -> List[Dict[str, Any]]:
+    """Broken id/class references, joined against the page in one pass.
+
+    JS lookups that can find nothing are reported as `missing_element`
+    with the call as written; CSS rules whose every selector needs a
+    missing id or class as `unused_selector`. Without HTML there is no page
+    to check against, so nothing is reported.
+    """
+    if not doc.html.strip():
+        return []
+    index = build_reference_index(doc)
+    issues: List[Dict[str, Any]] = []
+    dead_rules: Dict[int, List[Tuple[Reference, Tuple[str, ...], Tuple[str, ...]]]] = {}
+    live_rules: Set[int] = set()
+    for reference in index.references:
+        ids, classes = index.missing(reference)
+        if reference.file == "css":
+            # A rule is dead only if none of its selectors can match
+            if ids or classes:
+                dead_rules.setdefault(reference.start, []).append((reference, ids, classes))
+            else:
+                live_rules.add(reference.start)
+            continue
+        if not ids and not classes:
+            continue
+        issue = {
+            "type": "missing_element",
+            "location": str(reference.line),
+            "content": reference.text,
+            "description": f"{reference.via}() on line {reference.line} finds nothing: "
+                           f"no element has {_names(ids, classes)}",
+        }
+        if reference.selector is not None:
+            issue["selector"] = reference.selector
+        issues.append(issue)
+
+    unused = [refs for start, refs in dead_rules.items() if start not in live_rules]
+    for refs in unused[:UNUSED_SELECTOR_LIMIT]:
+        first = refs[0][0]
+        ids = tuple(dict.fromkeys(name for _, missing, _ in refs for name in missing))
+        classes = tuple(dict.fromkeys(name for _, _, missing in refs for name in missing))
+        selector_text = ", ".join(reference.selector for reference, _, _ in refs)
+        issues.append({
+            "type": "unused_selector",
+            "location": str(first.line),
+            "selector": selector_text,
+            "description": f"{selector_text} matches nothing: no element has {_names(ids, classes)}",
+        })
+    logger.info(f"References: {len(index.references)} checked, "
+                f"{sum(1 for issue in issues if issue['type'] == 'missing_element')} broken JS lookups, "
+                f"{len(unused)} dead CSS rules ({min(len(unused), UNUSED_SELECTOR_LIMIT)} reported)")
+    return issues
@@ -0,0 +1,179 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from bs4 import NavigableString, Tag
+
+from analysis.document import DocumentContext
+
+logger = logging.getLogger("Analysis-Rules")
+
+# check(node, doc) -> issues for that node (None or empty when it is fine)
+RuleCheck = Callable[[Any, DocumentContext], Optional[Iterable[Dict[str, Any]]]]
+
+
+@dataclass
+class Rule:
+    """A DOM check and the nodes it wants to see.
+
+    `tags` are element names. `attributes` are attribute names; a trailing
+    "*" matches a prefix (e.g. "on*" for event handlers). `text` asks for
+    text nodes. A rule with no interests sees every element.
+    """
+    name: str
+    check: RuleCheck
+    tags: Tuple[str, ...] = ()
+    attributes: Tuple[str, ...] = ()
+    text: bool = False
+
+
+@dataclass
+class RuleReport:
+    issues: Dict[str, List[Dict[str, Any]]]  # by rule, in registration order
+    seconds: Dict[str, float]  # time spent in each rule's check
+    calls: Dict[str, int]
+    nodes: int
+    total_seconds: float
+
+    def all_issues(self) -> List[Dict[str, Any]]:
+        return [issue for issues in self.issues.values() for issue in issues]
+
+    def summary(self) -> str:
+        per_rule = ", ".join(
+            f"{name} {self.seconds[name] * 1000:.2f}ms/{self.calls[name]} calls" for name in self.issues
+        )
+        return f"{self.nodes} nodes in {self.total_seconds * 1000:.2f}ms ({per_rule})"
+
+
+@dataclass
+class _Dispatch:
+    every: List[Rule] = field(default_factory=list)
+    by_tag: Dict[str, List[Rule]] = field(default_factory=dict)
+    by_attribute: Dict[str, List[Rule]] = field(default_factory=dict)
+    by_prefix: List[Tuple[str, Rule]] = field(default_factory=list)
+    text: List[Rule] = field(default_factory=list)
+
+
+class RuleEngine:
+    """Runs DOM rules in one traversal of the document.
+
+    Rules register interest in tags, attributes or text nodes. `run` walks
+    the tree once and hands each node only to the rules that asked for it,
+    so adding a rule costs its own checks, not another walk. Time spent in
+    each rule is reported per run and accumulated for /metrics.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._rules: "OrderedDict[str, Rule]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._seconds: Dict[str, float] = {}
+        self._calls: Dict[str, int] = {}
+        self._issues: Dict[str, int] = {}
+        self._runs = 0
+
+    def rule(self, name: str, tags: Iterable[str] = (), attributes: Iterable[str] = (), text: bool = False):
+        """Decorator registering `check(node, doc)` as a rule."""
+        def decorator(check: RuleCheck) -> RuleCheck:
+            self.add(Rule(name, check, tuple(t.lower() for t in tags), tuple(attributes), text))
+            return check
+        return decorator
+
+    def add(self, rule: Rule):
+        if rule.name in self._rules:
+            raise ValueError(f"Rule {rule.name!r} is already registered with {self.name!r}")
+        self._rules[rule.name] = rule
+
+    @property
+    def rule_names(self) -> List[str]:
+        return list(self._rules)
+
+    def _dispatch(self, rules: List[Rule]) -> _Dispatch:
+        dispatch = _Dispatch()
+        for rule in rules:
+            if rule.text:
+                dispatch.text.append(rule)
+            for tag in rule.tags:
+                dispatch.by_tag.setdefault(tag, []).append(rule)
+            for attribute in rule.attributes:
+                if attribute.endswith("*"):
+                    dispatch.by_prefix.append((attribute[:-1], rule))
+                else:
+                    dispatch.by_attribute.setdefault(attribute, []).append(rule)
+            if not (rule.text or rule.tags or rule.attributes):
+                dispatch.every.append(rule)
+        return dispatch
+
+    def run(self, doc: DocumentContext, only: Optional[Iterable[str]] = None) -> RuleReport:
+        """Apply the rules (or just those named in `only`) to `doc` in one pass."""
+        if only is None:
+            rules = list(self._rules.values())
+        else:
+            wanted = set(only)
+            unknown = wanted - set(self._rules)
+            if unknown:
+                raise KeyError(f"Unknown rules for {self.name!r}: {sorted(unknown)}")
+            rules = [rule for name, rule in self._rules.items() if name in wanted]
+        dispatch = self._dispatch(rules)
+        issues: Dict[str, List[Dict[str, Any]]] = {rule.name: [] for rule in rules}
+        seconds = {rule.name: 0.0 for rule in rules}
+        calls = {rule.name: 0 for rule in rules}
+        clock = time.perf_counter
+
+        def visit(rule: Rule, node: Any):
+            started = clock()
+            found = rule.check(node, doc)
+            seconds[rule.name] += clock() - started
+            calls[rule.name] += 1
+            if found:
+                issues[rule.name].extend(found)
+
+        # Elements with the same tag and attribute names go to the same rules
+        routes: Dict[Tuple[str, Tuple[str, ...]], List[Rule]] = {}
+
+        def route(node: Tag) -> List[Rule]:
+            key = (node.name, tuple(node.attrs))
+            matched = routes.get(key)
+            if matched is None:
+                matched = dispatch.every + dispatch.by_tag.get(node.name, [])
+                for attribute in node.attrs:
+                    matched = matched + dispatch.by_attribute.get(attribute, [])
+                    matched = matched + [rule for prefix, rule in dispatch.by_prefix if attribute.startswith(prefix)]
+                # One call per rule even if a node matches it several ways
+                matched = routes[key] = list(OrderedDict((id(rule), rule) for rule in matched).values())
+            return matched
+
+        started = clock()
+        nodes = 0
+        for node in doc.soup.descendants:
+            nodes += 1
+            if isinstance(node, Tag):
+                for rule in route(node):
+                    visit(rule, node)
+            elif dispatch.text and isinstance(node, NavigableString):
+                for rule in dispatch.text:
+                    visit(rule, node)
+        report = RuleReport(issues, seconds, calls, nodes, clock() - started)
+
+        with self._lock:
+            self._runs += 1
+            for name in issues:
+                self._seconds[name] = self._seconds.get(name, 0.0) + seconds[name]
+                self._calls[name] = self._calls.get(name, 0) + calls[name]
+                self._issues[name] = self._issues.get(name, 0) + len(issues[name])
+        logger.info(f"{self.name} rules: {report.summary()}")
+        return report
+
+    def stats(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(metric name, labels, value) samples for Telemetry.add_gauges."""
+        with self._lock:
+            samples = [("analysis_rule_runs", {"engine": self.name}, self._runs)]
+            for name in self._seconds:
+                labels = {"engine": self.name, "rule": name}
+                samples.append(("analysis_rule_seconds", labels, round(self._seconds[name], 6)))
+                samples.append(("analysis_rule_calls", labels, self._calls[name]))
+                samples.append(("analysis_rule_issues", labels, self._issues[name]))
+        return samples
@@ -0,0 +1,182 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from bs4 import Tag
+
+from analysis.document import DocumentContext
+
+logger = logging.getLogger("Analysis-Stacking")
+
+STACKING_PROPERTIES = (
+    "position", "z-index", "opacity", "transform", "isolation", "display",
+    "top", "right", "bottom", "left",
+)
+POSITIONED = {"relative", "absolute", "fixed", "sticky"}
+OUT_OF_FLOW = {"absolute", "fixed"}
+
+
+def describe(elem: Tag) -> str:
+    """Short CSS-like name for an element: div#main.card"""
+    name = elem.name
+    if elem.get("id"):
+        name += f"#{elem['id']}"
+    classes = elem.get("class") or []
+    return name + "".join(f".{cls}" for cls in classes[:2])
+
+
+class _Box:
+    """Cascaded stacking-related style of one element."""
+
+    def __init__(self, elem: Tag, style: Dict[str, Tuple[str, str]], parent: Optional["_Box"],
+                 line: Optional[int] = None):
+        self.elem = elem
+        self.line = line
+        self.style = style
+        self.parent = parent
+        self.position = self.value("position") or "static"
+        self.z_index = _int(self.value("z-index"))
+        in_flex = parent is not None and (parent.value("display") or "").endswith(("flex", "grid"))
+        self.positioned = self.position in POSITIONED
+        # z-index applies to positioned boxes and to flex/grid items
+        self.z_applies = self.positioned or in_flex
+        opacity = _float(self.value("opacity"))
+        self.creates_context = (
+            (self.z_applies and self.z_index is not None)
+            or self.position in ("fixed", "sticky")
+            or (opacity is not None and opacity < 1)
+            or (self.value("transform") or "none") != "none"
+            or self.value("isolation") == "isolate"
+        )
+        # Nearest ancestor that forms a stacking context (None: the root)
+        node = parent
+        while node is not None and not node.creates_context:
+            node = node.parent
+        self.context = node
+
+    def value(self, name: str) -> Optional[str]:
+        found = self.style.get(name)
+        return found[0].strip().lower() if found else None
+
+    def source(self, name: str) -> Optional[str]:
+        found = self.style.get(name)
+        return found[1] if found else None
+
+    def offsets(self) -> Tuple[Optional[str], ...]:
+        return tuple(self.value(side) for side in ("top", "right", "bottom", "left"))
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def stacking_issues(doc: DocumentContext) -> List[Dict[str, Any]]:
+    """z-index and overlap problems found by matching the stylesheet against the DOM.
+
+    Each element gets its cascaded position, z-index and context-forming
+    properties from the selector index (candidate rules only). Reports
+    z-index that cannot take effect, z-index trapped by an ancestor's
+    stacking context, and out-of-flow siblings stacked on the same spot.
+    """
+    boxes: Dict[int, _Box] = {}
+    for elem in doc.elements:
+        parent = boxes.get(id(elem.parent))
+        style = doc.selectors.computed(elem, STACKING_PROPERTIES)
+        boxes[id(elem)] = _Box(elem, style, parent, doc.line(elem))
+    issues = _ineffective_z_index(boxes.values()) + _trapped_z_index(boxes.values()) + _overlaps(boxes.values())
+    stats = doc.selectors.stats()
+    logger.info(f"Stacking analysis: {len(boxes)} elements, {stats['selectors']} selectors, "
+                f"{stats['tried']} candidate matches tried, {len(issues)} issues")
+    return issues
+
+
+def _ineffective_z_index(boxes) -> List[Dict[str, Any]]:
+    issues, reported = [], set()
+    for box in boxes:
+        if box.value("z-index") in (None, "auto") or box.z_applies:
+            continue
+        source = box.source("z-index")
+        # One issue per rule, however many elements it hits
+        key = source if source != "style" else id(box.elem)
+        if key in reported:
+            continue
+        reported.add(key)
+        issue = {
+            "type": "z-index",
+            "element": describe(box.elem),
+            "location": str(box.line),
+            "description": f"z-index: {box.value('z-index')} on {describe(box.elem)} has no effect "
+                           f"because the element is not positioned (position: {box.position})",
+        }
+        if source != "style":
+            issue["selector"] = source
+        issues.append(issue)
+    return issues
+
+
+def _trapped_z_index(boxes) -> List[Dict[str, Any]]:
+    """A z-index that cannot beat a box outside its ancestor's stacking context."""
+    boxes = list(boxes)
+    # Stacking contexts with an explicit z-index, grouped by their parent context
+    levels: Dict[Optional[int], List[_Box]] = {}
+    for box in boxes:
+        if box.creates_context and box.z_index is not None:
+            levels.setdefault(id(box.context) if box.context else None, []).append(box)
+    issues = []
+    for box in boxes:
+        if box.z_index is None or not box.z_applies:
+            continue
+        ancestor = box.context
+        while ancestor is not None:
+            parent_level = levels.get(id(ancestor.context) if ancestor.context else None, [])
+            ancestor_z = ancestor.z_index or 0
+            rival = next((other for other in parent_level
+                          if other is not ancestor and ancestor_z < other.z_index < box.z_index), None)
+            if rival is not None:
+                issues.append({
+                    "type": "stacking",
+                    "element": describe(box.elem),
+                    "location": str(box.line),
+                    "selector": box.source("z-index"),
+                    "description": f"z-index: {box.z_index} on {describe(box.elem)} cannot rise above "
+                                   f"{describe(rival.elem)} (z-index: {rival.z_index}): its ancestor "
+                                   f"{describe(ancestor.elem)} forms a stacking context at z-index {ancestor_z}",
+                })
+                break
+            ancestor = ancestor.context
+    return issues
+
+
+def _overlaps(boxes) -> List[Dict[str, Any]]:
+    """Out-of-flow siblings at the same offsets and z-index: source order decides which shows."""
+    groups: Dict[Tuple, List[_Box]] = {}
+    for box in boxes:
+        if box.position not in OUT_OF_FLOW:
+            continue
+        # Fixed boxes share the viewport; absolute ones their parent
+        container = None if box.position == "fixed" else id(box.elem.parent)
+        groups.setdefault((box.position, container, box.z_index, box.offsets()), []).append(box)
+    issues = []
+    for (position, _, z_index, offsets), group in groups.items():
+        if len(group) < 2:
+            continue
+        names = ", ".join(describe(box.elem) for box in group[:5])
+        where = ", ".join(f"{side}: {value}" for side, value in zip(("top", "right", "bottom", "left"), offsets) if value)
+        issues.append({
+            "type": "overlap",
+            "element": describe(group[0].elem),
+            "location": str(group[0].line),
+            "description": f"{len(group)} {position} elements ({names}) sit at the same offsets "
+                           f"({where or 'static position'}) with z-index {z_index if z_index is not None else 'auto'}; "
+                           f"they overlap and only source order decides which is visible",
+        })
+    return issues
@@ -1,9 +1,15 @@
+import logging
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from typing import Any, Dict
-from agents.workflow import run_bug_fixer
+from agents.workflow import arun_bug_fixer, warmup_bug_fixer, reload_bug_fixer
+from gemini_llm import telemetry
 from fastapi.middleware.cors import CORSMiddleware
 
+# The LLM modules log under their own names; the app decides where that goes
+logging.basicConfig(level=logging.INFO)
+
 app = FastAPI()
 
 # Add CORS middleware
@@ -15,6 +21,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def warmup():
+    # Build the agents and compile the graph once, before the first request
+    try:
+        warmup_bug_fixer()
+    except Exception as e:
+        # Leave the server up; the first request will retry the build
+        print(f"Bug fixer warmup failed: {e}")
+
 class BugFixRequest(BaseModel):
     input_data: Dict[str, Any]
 
@@ -22,13 +37,27 @@ class BugFixResponse(BaseModel):
     result: Any
 
 @app.post("/api/bug-fix", response_model=BugFixResponse)
-def bug_fix(request: BugFixRequest):
+async def bug_fix(request: BugFixRequest):
     try:
-        result = run_bug_fixer(request.input_data)
+        # Async path: one worker can drive many workflows while they wait on Gemini
+        result = await arun_bug_fixer(request.input_data)
         return {"result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/reload")
+def reload():
+    try:
+        reload_bug_fixer()
+        return {"status": "reloaded"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text format: per-call LLM histograms plus key pool gauges
+    return telemetry.render()
@@ -0,0 +1,146 @@
+"""Benchmark the streaming CSS scanner against cssutils.
+
+Run from backend/:
+
+    python -m benchmarks.css_scanner                       # 100KB to 5MB synthetic sheets
+    python -m benchmarks.css_scanner --sizes 100k 1m
+    python -m benchmarks.css_scanner --file vendor/bootstrap.css
+
+Synthetic sheets look like framework output: utility classes, component
+rules with compound selectors, @media blocks, @font-face, @keyframes,
+comments, strings and data: URLs. For each input it reports wall time,
+peak traced memory and the number of style rules each side found.
+Memory is measured in a second run under tracemalloc, which slows both
+sides; pass --no-memory to skip it. cssutils is slow on multi-megabyte
+sheets; --cssutils-limit skips it above a size.
+"""
+import argparse
+import gc
+import logging
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import cssutils
+
+from analysis.css_scanner import scan
+
+cssutils.log.setLevel(logging.CRITICAL)
+
+SIZES = {"100k": 100_000, "500k": 500_000, "1m": 1_000_000, "5m": 5_000_000}
+
+_PROPERTIES = [
+    ("display", ["block", "flex", "grid", "none", "inline-block"]),
+    ("position", ["relative", "absolute", "fixed", "static"]),
+    ("z-index", ["1", "10", "100", "1000", "auto"]),
+    ("margin", ["0", "0 auto", "1rem 2rem", "4px 8px 4px 8px"]),
+    ("padding", ["0", ".5rem", "1rem 1.5rem"]),
+    ("color", ["#212529", "rgba(0, 0, 0, .5)", "var(--bs-body-color)"]),
+    ("background", ["url(data:image/svg+xml;base64,PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmci/PjwvZz4=) no-repeat",
+                    "linear-gradient(180deg, #fff 0%, #eee 100%)", "transparent"]),
+    ("font-family", ['"Helvetica Neue", Arial, sans-serif', "system-ui, -apple-system"]),
+    ("transition", ["opacity .15s linear", "transform .3s ease-out"]),
+    ("width", ["100%", "300px", "calc(100% - 2rem)"]),
+]
+
+
+def synthetic_css(size: int, seed: int = 7) -> str:
+    """A framework-like stylesheet of about `size` characters."""
+    rng = random.Random(seed)
+    out: List[str] = []
+    total = 0
+    n = 0
+    while total < size:
+        n += 1
+        kind = rng.random()
+        if kind < 0.55:
+            selector = rng.choice([
+                f".u-{n}", f".btn-{n}:hover", f".card-{n} > .card-body", f"#nav-{n} li a",
+                f".col-{n % 12}, .col-md-{n % 12}", f"input[type=\"text\"].f-{n}", f".list-{n} > li:nth-child(2n+1)",
+            ])
+            block = _rule(rng, selector)
+        elif kind < 0.85:
+            inner = "\n".join(_rule(rng, f".m-{n}-{i}") for i in range(rng.randint(1, 4)))
+            block = f"@media (min-width: {rng.choice([576, 768, 992, 1200])}px) {{\n{inner}\n}}"
+        elif kind < 0.92:
+            block = f"/* component {n}: generated; do not edit {{ }} */"
+        elif kind < 0.96:
+            block = f"@keyframes spin-{n} {{ from {{ transform: rotate(0deg) }} to {{ transform: rotate(360deg) }} }}"
+        else:
+            block = f"@font-face {{ font-family: \"F{n}\"; src: url(\"f{n}.woff2\") format(\"woff2\"); }}"
+        out.append(block)
+        total += len(block) + 1
+    return "\n".join(out)
+
+
+def _rule(rng: random.Random, selector: str) -> str:
+    declarations = []
+    for name, values in rng.sample(_PROPERTIES, rng.randint(2, 6)):
+        important = " !important" if rng.random() < 0.05 else ""
+        declarations.append(f"  {name}: {rng.choice(values)}{important};")
+    return selector + " {\n" + "\n".join(declarations) + "\n}"
+
+
+def run_scanner(css: str) -> int:
+    return sum(1 for _ in scan(css))
+
+
+def run_cssutils(css: str) -> int:
+    sheet = cssutils.CSSParser().parseString(css)
+    count = 0
+    for rule in sheet:
+        if rule.type == rule.STYLE_RULE:
+            count += 1
+        elif rule.type == rule.MEDIA_RULE:
+            count += sum(1 for inner in rule.cssRules if inner.type == inner.STYLE_RULE)
+    return count
+
+
+def measure(fn: Callable[[str], int], css: str, memory: bool) -> Tuple[float, int, float]:
+    """(seconds, rules found, peak MB or nan)"""
+    gc.collect()
+    started = time.perf_counter()
+    rules = fn(css)
+    seconds = time.perf_counter() - started
+    peak = float("nan")
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(css)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return seconds, rules, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSS scanner vs cssutils")
+    parser.add_argument("--sizes", nargs="*", default=list(SIZES), help=f"any of {', '.join(SIZES)}")
+    parser.add_argument("--file", action="append", default=[], help="benchmark a real stylesheet (repeatable)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--cssutils-limit", type=float, default=None,
+                        help="skip cssutils above this many MB")
+    args = parser.parse_args()
+
+    inputs: Dict[str, str] = {}
+    for name in args.sizes:
+        inputs[f"synthetic {name}"] = synthetic_css(SIZES[name.lower()])
+    for path in args.file:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            inputs[path] = f.read()
+
+    print(f"{'input':<22}{'size':>9}  {'scanner s':>10}{'MB':>8}{'rules':>8}  {'cssutils s':>11}{'MB':>8}{'rules':>8}  {'speedup':>8}")
+    for name, css in inputs.items():
+        size_mb = len(css) / 1e6
+        s_time, s_rules, s_peak = measure(run_scanner, css, not args.no_memory)
+        if args.cssutils_limit is not None and size_mb > args.cssutils_limit:
+            c_cols, speedup = f"{'skipped':>11}{'':>8}{'':>8}", ""
+        else:
+            c_time, c_rules, c_peak = measure(run_cssutils, css, not args.no_memory)
+            c_cols = f"{c_time:>11.3f}{c_peak:>8.1f}{c_rules:>8}"
+            speedup = f"{c_time / s_time:>7.1f}x"
+        print(f"{name:<22}{size_mb:>8.2f}M  {s_time:>10.3f}{s_peak:>8.1f}{s_rules:>8}  {c_cols}  {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -84,87 +84,806 @@
 # ######
 # Code by GPT
 import os
+import string
 import time
+import asyncio
 import threading
 import logging
 from dotenv import load_dotenv
-from collections import deque
-from typing import Optional
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+import httpx
+
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.outputs import ChatResult
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 
+from llm.adaptive_limiter import AdaptiveLimiter
+from llm.client_pool import ClientPool
+from llm.context_cache import ContextCache
+from llm.hedging import HedgeLost, Hedger
+from llm.key_scheduler import KeyScheduler
+from llm.prompt_packing import estimate_tokens
+from llm.router import ModelRouter, ModelTier, TaskPolicy
+from llm.retry import ErrorClass, RetryBudgetExhausted, RetryPolicy, classify_error, retry_call
+from llm.response_cache import SQLiteLLMCache, cache_key
+from llm.shared_state import SharedKeyScheduler
+from llm.singleflight import SingleFlight
+from llm.telemetry import CallRecord, MeteredCache, Telemetry
+
 # Load env variables
 load_dotenv()
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("LLM-Key-Rotation")
 
+# Optional REST endpoint override, e.g. the local stand-in (gemini_standin.py)
+API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
 # Load and clean API keys
 API_KEYS = [os.getenv(f"GOOGLE_API_KEY{i}") for i in range(1, 6)]
 API_KEYS = [key for key in API_KEYS if key]
-
-# Thread-safe key rotation
-_api_key_lock = threading.Lock()
-_key_queue = deque(API_KEYS)
-_blacklisted_keys = {}  # key: timestamp
+if API_ENDPOINT and not API_KEYS:
+    # The stand-in accepts any key; give the scheduler a full pool to work with
+    API_KEYS = [f"standin-key{i}" for i in range(1, 6)]
 
 BLACKLIST_TIMEOUT = 300  # 5 minutes
+# Breaker cooldown per failure class (doubles on consecutive trips)
+KEY_COOLDOWNS = {
+    ErrorClass.QUOTA: 60,  # per-minute quotas refill within a minute
+    ErrorClass.AUTH: BLACKLIST_TIMEOUT,
+}
+
+# Retries per LLM call: attempts and total wall-clock budget
+RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("GEMINI_MAX_ATTEMPTS", "4")),
+    budget_seconds=float(os.getenv("GEMINI_RETRY_BUDGET", "60")),
+)
+
+# Per-key quota (defaults are the gemini-1.5-flash free tier)
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM_PER_KEY", "15"))
+TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TPM_PER_KEY", "1000000"))
+# How long a call may wait for quota when every key is saturated
+MAX_KEY_WAIT = float(os.getenv("GEMINI_KEY_MAX_WAIT", "30"))
+# Output tokens assumed when reserving quota before the real usage is known
+OUTPUT_TOKEN_ESTIMATE = 512
+# Calls allowed in flight on one key at the same time
+MAX_CONCURRENCY_PER_KEY = int(os.getenv("GEMINI_MAX_CONCURRENCY_PER_KEY", "8"))
+
+# Adaptive limit on upstream calls in flight across all keys: grows while
+# latency is healthy, shrinks on 429s, timeouts, 5xx and rising latency
+CONCURRENCY_INITIAL = int(os.getenv("GEMINI_CONCURRENCY_INITIAL", "8"))
+CONCURRENCY_MIN = int(os.getenv("GEMINI_CONCURRENCY_MIN", "1"))
+CONCURRENCY_MAX = int(os.getenv("GEMINI_CONCURRENCY_MAX", str(MAX_CONCURRENCY_PER_KEY * max(1, len(API_KEYS)))))
+OVERLOAD_ERRORS = {ErrorClass.QUOTA, ErrorClass.TRANSIENT, ErrorClass.SERVER}
+
+# Hedged requests (off unless GEMINI_HEDGE_PERCENTILE is set): a backup call
+# goes out on another key once the primary is slower than this percentile of
+# observed latency; GEMINI_HEDGE_MAX_RATIO caps hedges as a share of calls
+HEDGE_PERCENTILE = os.getenv("GEMINI_HEDGE_PERCENTILE")
+HEDGE_MAX_RATIO = float(os.getenv("GEMINI_HEDGE_MAX_RATIO", "0.1"))
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+# Model tiers for route_llm(); quotas default to each model's free tier
+MODEL_TIERS = {
+    "lite": ModelTier(
+        "lite", os.getenv("GEMINI_MODEL_LITE", "gemini-1.5-flash-8b"), typical_latency=1.5,
+        requests_per_minute=float(os.getenv("GEMINI_LITE_RPM_PER_KEY", "15")), tokens_per_minute=TOKENS_PER_MINUTE,
+    ),
+    "flash": ModelTier(
+        "flash", DEFAULT_MODEL, typical_latency=3.0,
+        requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+    ),
+    "pro": ModelTier(
+        "pro", os.getenv("GEMINI_MODEL_PRO", "gemini-1.5-pro"), typical_latency=10.0,
+        requests_per_minute=float(os.getenv("GEMINI_PRO_RPM_PER_KEY", "2")),
+        tokens_per_minute=float(os.getenv("GEMINI_PRO_TPM_PER_KEY", "32000")),
+    ),
+}
+
+# Task class -> preferred tiers, temperature and output cap
+TASK_POLICIES = {
+    "triage": TaskPolicy(("lite", "flash"), temperature=0.0, max_output_tokens=256),
+    "summarize": TaskPolicy(("lite", "flash"), temperature=0.3, max_output_tokens=1024),
+    "analysis": TaskPolicy(("flash", "lite"), temperature=0.2, max_output_tokens=2048),
+    "code_fix": TaskPolicy(("flash", "pro"), temperature=0.0, max_output_tokens=8192),
+    "general": TaskPolicy(("flash", "lite"), temperature=0.7),
+}
+
+router = ModelRouter(MODEL_TIERS, TASK_POLICIES)
+
+# With a fallback tier to go to, wait at most this long for quota on the
+# routed tier before falling back
+FALLBACK_KEY_WAIT = float(os.getenv("GEMINI_FALLBACK_KEY_WAIT", "5"))
+
+# Gemini context caching for static prompt prefixes (agent instructions,
+# tool descriptions): "on" or "off". The API refuses caches below a
+# model-specific size (32768 tokens for gemini-1.5-flash), so shorter
+# prefixes are not registered and go out in full as before. The bundled
+# agent prefixes are 170-360 tokens, so against the real API this is
+# effectively off; it applies to prefixes that reach the model's minimum
+CONTEXT_CACHE_MODE = os.getenv("GEMINI_CONTEXT_CACHE", "on")
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+# On-disk state lives next to this module unless a path is configured, so
+# it does not depend on the working directory
+STATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Key quotas, health and breakers are shared by every worker on the host
+# through this SQLite file; "off" keeps them per process
+KEY_STATE_PATH = os.getenv("GEMINI_KEY_STATE_PATH", os.path.join(STATE_DIR, "key_state.sqlite3"))
+
+# Response cache: "deterministic" caches only temperature-0 models, "all"
+# caches every model, "off" disables it
+CACHE_MODE = os.getenv("LLM_CACHE_MODE", "deterministic")
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(STATE_DIR, "llm_cache.sqlite3"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+def _new_scheduler(model: str = DEFAULT_MODEL) -> KeyScheduler:
+    tier = router.tier_for_model(model)
+    settings = dict(
+        requests_per_minute=tier.requests_per_minute if tier else REQUESTS_PER_MINUTE,
+        tokens_per_minute=tier.tokens_per_minute if tier else TOKENS_PER_MINUTE,
+        max_wait=MAX_KEY_WAIT,
+    )
+    if KEY_STATE_PATH and KEY_STATE_PATH != "off":
+        try:
+            scope = "" if model == DEFAULT_MODEL else model
+            return SharedKeyScheduler(API_KEYS, path=KEY_STATE_PATH, scope=scope, **settings)
+        except Exception as e:
+            logger.error(f"Shared key state unavailable ({e}); falling back to per-process scheduling")
+    return KeyScheduler(API_KEYS, **settings)
+
+# Gemini quotas are per model, so each model schedules its own key quotas
+_schedulers: Dict[str, KeyScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+def scheduler_for(model: str) -> KeyScheduler:
+    with _schedulers_lock:
+        scheduler = _schedulers.get(model)
+        if scheduler is None:
+            scheduler = _new_scheduler(model)
+            _schedulers[model] = scheduler
+        return scheduler
+
+def _default_scheduler() -> KeyScheduler:
+    """Thread-safe, quota-aware key scheduling for the default model; its state file opens on first use."""
+    return scheduler_for(DEFAULT_MODEL)
+
+_response_cache: Optional[SQLiteLLMCache] = None
+_response_cache_lock = threading.Lock()
+
+_limiter = AdaptiveLimiter(
+    initial=CONCURRENCY_INITIAL,
+    min_limit=CONCURRENCY_MIN,
+    max_limit=CONCURRENCY_MAX,
+    is_overload=lambda e: classify_error(e) in OVERLOAD_ERRORS,
+)
+
+# Identical prompts already in flight share one upstream call
+_in_flight = SingleFlight()
+
+_hedger: Optional[Hedger] = (
+    Hedger(percentile=float(HEDGE_PERCENTILE), max_ratio=HEDGE_MAX_RATIO) if HEDGE_PERCENTILE else None
+)
+
+# Cache-service clients, one per key (context caches belong to the key's project)
+_cache_clients: Dict[str, Any] = {}
+_cache_clients_lock = threading.Lock()
+
+def _create_cached_content(api_key: str, model: str, prefix: str, ttl: float) -> str:
+    from google.ai.generativelanguage_v1beta import CacheServiceClient, CachedContent, Content, Part
+    with _cache_clients_lock:
+        client = _cache_clients.get(api_key)
+        if client is None:
+            options = endpoint_options()
+            client = CacheServiceClient(
+                client_options={**options.get("client_options", {}), "api_key": api_key},
+                transport=options.get("transport"),
+            )
+            _cache_clients[api_key] = client
+    cached = client.create_cached_content(cached_content=CachedContent(
+        model=f"models/{model}",
+        display_name="agent-prompt-prefix",
+        system_instruction=Content(parts=[Part(text=prefix)]),
+        ttl=timedelta(seconds=ttl),
+    ))
+    logger.info(f"Created context cache {cached.name} for {model} on {scheduler_for(model).alias(api_key)}")
+    return cached.name
+
+_context_cache: Optional[ContextCache] = (
+    ContextCache(_create_cached_content, min_tokens=CONTEXT_CACHE_MIN_TOKENS,
+                 ttl_seconds=CONTEXT_CACHE_TTL, count_tokens=estimate_tokens)
+    if CONTEXT_CACHE_MODE != "off" else None
+)
+
+# Per-call metrics (model, key, tokens, latency, retries, cache hits)
+telemetry = Telemetry()
+
+def _pool_gauges():
+    with _schedulers_lock:
+        schedulers = list(_schedulers.items())
+    for model, scheduler in schedulers:
+        for key in scheduler.snapshot():
+            labels = {"model": model, "key": key["alias"]}
+            yield "llm_key_in_flight", labels, key["in_flight"]
+            yield "llm_key_health", labels, key["health"]
+            yield "llm_key_requests_available", labels, key["requests_available"]
+            yield "llm_key_tokens_available", labels, key["tokens_available"]
+            yield "llm_key_circuit_open", labels, 0 if key["circuit"] == "closed" else 1
+    yield "llm_concurrency_limit", {}, _limiter.limit
+    yield "llm_concurrency_in_flight", {}, _limiter.in_flight
+    yield "llm_concurrency_overloads", {}, _limiter.overloads
+    yield "llm_singleflight_followers", {}, _in_flight.followers
+    if _hedger is not None:
+        yield "llm_hedges_sent", {}, _hedger.budget.hedges
+        yield "llm_hedge_wins", {}, _hedger.wins
+    if _context_cache is not None:
+        for name, value in _context_cache.stats().items():
+            yield f"llm_context_cache_{name}", {}, value
+
+telemetry.add_gauges(_pool_gauges)
+telemetry.add_gauges(router.stats)
+
+# Shared model objects, one per (temperature, model, output cap, fallbacks)
+_llms: Dict[tuple, "PooledGeminiChat"] = {}
+_llms_lock = threading.Lock()
 
 def get_next_api_key() -> Optional[str]:
-    """Get the next available API key, skipping blacklisted ones."""
-    with _api_key_lock:
-        for _ in range(len(_key_queue)):
-            key = _key_queue[0]
-            now = time.time()
-            if key not in _blacklisted_keys or (now - _blacklisted_keys[key] > BLACKLIST_TIMEOUT):
-                _key_queue.rotate(-1)
-                return key
-            else:
-                logger.warning(f"Key {key[:5]}... is blacklisted, skipping.")
-                _key_queue.rotate(-1)
-        return None
+    """Get the healthiest, least-loaded API key, skipping keys that are cooling down."""
+    return _default_scheduler().pick()
 
 def blacklist_api_key(key: str):
-    with _api_key_lock:
-        _blacklisted_keys[key] = time.time()
-        logger.error(f"Blacklisted API key: {key[:5]}...")
-
-def get_llm() -> ChatGoogleGenerativeAI:
-    """Returns an LLM with the next valid API key."""
-    api_key = get_next_api_key()
-    if not api_key:
-        raise RuntimeError("No available API keys left.")
-    # print(f"[Gemini LLM] Using API key: {api_key[:8]}...{api_key[-4:]}")
+    for scheduler in _all_schedulers():
+        scheduler.report_failure(key, cooldown=BLACKLIST_TIMEOUT)
+    logger.error(f"Blacklisted API key: {key[:5]}...")
+
+def get_key_pool_status() -> List[Dict]:
+    """Per-key quota, load and health snapshot."""
+    return _default_scheduler().snapshot()
+
+def _all_schedulers() -> List[KeyScheduler]:
+    with _schedulers_lock:
+        return list(_schedulers.values())
+
+def get_response_cache() -> Optional[SQLiteLLMCache]:
+    """The shared on-disk response cache, or None when caching is off."""
+    global _response_cache
+    if CACHE_MODE == "off":
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SQLiteLLMCache(CACHE_PATH, ttl_seconds=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+        return _response_cache
+
+def _cache_for(temperature: float) -> Optional[SQLiteLLMCache]:
+    if CACHE_MODE == "all" or (CACHE_MODE == "deterministic" and temperature == 0):
+        return get_response_cache()
+    return None
+
+def endpoint_options() -> Dict[str, Any]:
+    """Client kwargs that point Google clients at API_ENDPOINT (REST only)."""
+    if not API_ENDPOINT:
+        return {}
+    return {"client_options": {"api_endpoint": API_ENDPOINT}, "transport": "rest"}
+
+class RestEmbeddings(Embeddings):
+    """Gemini embeddings over plain REST (batchEmbedContents).
+
+    GoogleGenerativeAIEmbeddings ignores `transport` and always speaks gRPC,
+    which cannot reach an http:// endpoint such as the stand-in.
+    """
+
+    def __init__(self, model: str, api_key: str, endpoint: str, batch_size: int = 100, timeout: float = 60):
+        self.model = model if model.startswith("models/") else f"models/{model}"
+        self.api_key = api_key
+        self.url = f"{endpoint.rstrip('/')}/v1beta/{self.model}:batchEmbedContents"
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+    def _embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        vectors = []
+        with httpx.Client(timeout=self.timeout) as client:
+            for start in range(0, len(texts), self.batch_size):
+                requests = [{"model": self.model, "content": {"parts": [{"text": text}]}, "taskType": task_type}
+                            for text in texts[start:start + self.batch_size]]
+                response = client.post(self.url, params={"key": self.api_key}, json={"requests": requests})
+                response.raise_for_status()
+                vectors += [item["values"] for item in response.json()["embeddings"]]
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "RETRIEVAL_DOCUMENT")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "RETRIEVAL_QUERY")[0]
+
+def get_embeddings(model: str = "models/embedding-001") -> Embeddings:
+    """Embeddings client for `model`; REST when GEMINI_API_ENDPOINT is set."""
+    api_key = os.getenv("GOOGLE_API_KEY") or get_next_api_key()
+    if API_ENDPOINT:
+        return RestEmbeddings(model, api_key, API_ENDPOINT)
+    return GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key)
+
+def register_static_prompt(prompt: Union[str, BasePromptTemplate]) -> bool:
+    """Serve the literal text before a prompt's first variable from the context cache.
+
+    Returns False when context caching is off or the prefix is below
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS.
+    """
+    if _context_cache is None:
+        return False
+    prefix = _static_prefix(prompt)
+    if _context_cache.register(prefix):
+        return True
+    if prefix:
+        logger.info(f"Prompt prefix of {estimate_tokens(prefix)} tokens is below "
+                    f"GEMINI_CONTEXT_CACHE_MIN_TOKENS ({CONTEXT_CACHE_MIN_TOKENS}); sent in full, not cached")
+    return False
+
+def _static_prefix(prompt: Union[str, BasePromptTemplate]) -> str:
+    template = prompt if isinstance(prompt, str) else getattr(prompt, "template", "")
+    if not isinstance(template, str):
+        return ""
+    prefix = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        # Formatter un-escapes "{{" in literals, as the rendered prompt does
+        prefix.append(literal)
+        if field is not None:
+            break
+    return "".join(prefix)
+
+def _new_client(api_key: str, model: str, temperature: float, top_p: float,
+                max_output_tokens: Optional[int]) -> ChatGoogleGenerativeAI:
     return ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
+        model=model,
         google_api_key=api_key,
-        temperature=0.7,
-        top_p=0.9,
-        verbose=True
+        temperature=temperature,
+        top_p=top_p,
+        max_output_tokens=max_output_tokens,
+        **endpoint_options(),
     )
 
-def get_llm_chain(prompt_template: str, output_key: str = "output") -> LLMChain:
+async def _client_agenerate(client: ChatGoogleGenerativeAI, messages: List[BaseMessage],
+                            stop: Optional[List[str]], **kwargs: Any) -> ChatResult:
+    if API_ENDPOINT:
+        # The async Gemini client is gRPC-only, so REST endpoints (the stand-in)
+        # are driven through the sync client in a worker thread
+        return await asyncio.to_thread(client._generate, messages, stop=stop, **kwargs)
+    return await client._agenerate(messages, stop=stop, **kwargs)
+
+# One long-lived client per (key, model settings) with bounded concurrency per key
+_clients = ClientPool(_new_client, max_concurrency_per_key=MAX_CONCURRENCY_PER_KEY)
+
+class NoKeyAvailable(RuntimeError):
+    """No key had quota for the model within the allowed wait."""
+
+class PooledGeminiChat(BaseChatModel):
+    """Gemini chat model that schedules every call onto the key pool.
+
+    The key is chosen per call (not per agent), so long-lived agents spread
+    their load across all keys and respect each key's RPM/TPM quota. Both
+    the sync and the async path reuse pooled clients, and the async path
+    never blocks a worker thread on the round trip. When the model's quota
+    is exhausted on every key, the call moves on to `fallback_models` in
+    order.
+    """
+    model: str = DEFAULT_MODEL
+    temperature: float = 0.7
+    top_p: float = 0.9
+    max_output_tokens: Optional[int] = None
+    fallback_models: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "gemini-key-pool"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+    def _estimate(self, messages: List[BaseMessage]) -> int:
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        return prompt_tokens + (self.max_output_tokens or OUTPUT_TOKEN_ESTIMATE)
+
+    def _fingerprint(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> str:
+        return cache_key(dumps(messages), self._get_llm_string(stop=stop, **kwargs))
+
+    def _client(self, api_key: str) -> ChatGoogleGenerativeAI:
+        return _clients.client(api_key, self.model, self.temperature, self.top_p, self.max_output_tokens)
+
+    def _keys(self) -> KeyScheduler:
+        return scheduler_for(self.model)
+
+    def _key_wait(self) -> Optional[float]:
+        return FALLBACK_KEY_WAIT if self.fallback_models else None
+
+    def _tiers(self) -> List["PooledGeminiChat"]:
+        models = [self.model] + [m for m in self.fallback_models if m != self.model]
+        return [self] + [self.model_copy(update={"model": m, "fallback_models": []}) for m in models[1:]]
+
+    def _with_fallbacks(self, call) -> ChatResult:
+        tiers = self._tiers()
+        for index, llm in enumerate(tiers):
+            try:
+                return call(llm)
+            except Exception as e:
+                if index == len(tiers) - 1 or not _quota_exhausted(e):
+                    raise
+                router.record_fallback(llm.model, tiers[index + 1].model, e)
+
+    async def _awith_fallbacks(self, call) -> ChatResult:
+        tiers = self._tiers()
+        for index, llm in enumerate(tiers):
+            try:
+                return await call(llm)
+            except Exception as e:
+                if index == len(tiers) - 1 or not _quota_exhausted(e):
+                    raise
+                router.record_fallback(llm.model, tiers[index + 1].model, e)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        fingerprint = self._fingerprint(messages, stop, **kwargs)
+        result = _in_flight.do(
+            fingerprint, lambda: self._with_fallbacks(lambda llm: llm._hedged_call(messages, stop, **kwargs))
+        )
+        # Callers annotate the result they get back, so each gets its own copy
+        return result.model_copy(deep=True)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        fingerprint = self._fingerprint(messages, stop, **kwargs)
+        result = await _in_flight.ado(
+            fingerprint, lambda: self._awith_fallbacks(lambda llm: llm._ahedged_call(messages, stop, **kwargs))
+        )
+        return result.model_copy(deep=True)
+
+    def _hedged_call(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> ChatResult:
+        if _hedger is None:
+            return self._call_pool(messages, stop, **kwargs)
+        # The backup must go out on a key the primary has not used
+        keys_used: Set[str] = set()
+        return _hedger.call(
+            lambda settled: self._call_pool(messages, stop, keys_used, settled=settled, **kwargs),
+            lambda settled: self._call_pool(messages, stop, keys_used, hedge=True, settled=settled, **kwargs),
+        )
+
+    async def _ahedged_call(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> ChatResult:
+        if _hedger is None:
+            return await self._acall_pool(messages, stop, **kwargs)
+        keys_used: Set[str] = set()
+        return await _hedger.acall(
+            lambda: self._acall_pool(messages, stop, keys_used, **kwargs),
+            lambda: self._acall_pool(messages, stop, keys_used, hedge=True, **kwargs),
+        )
+
+    def _call_pool(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                   keys_used: Optional[Set[str]] = None, hedge: bool = False,
+                   settled: Optional[threading.Event] = None, **kwargs: Any) -> ChatResult:
+        """One logical LLM call: schedule onto a key, retrying under RETRY_POLICY.
+
+        A hedge makes a single attempt on a key outside `keys_used` and
+        never waits for quota. Once `settled` is set (the other attempt of a
+        hedged call won) no further attempt is sent.
+        """
+        scheduler = self._keys()
+        estimated = self._estimate(messages)
+        started = time.monotonic()
+        attempt = 0
+        keys_used = keys_used if keys_used is not None else set()
+        while True:
+            api_key = _acquire_key(scheduler, estimated, keys_used, hedge, self._key_wait())
+            if settled is not None and settled.is_set():
+                # Lost the race (possibly while waiting for quota): send nothing
+                scheduler.release(api_key, estimated)
+                raise HedgeLost("The other attempt of this hedged call finished first.")
+            try:
+                sent, cache_kwargs, prefix = _split_cached_prefix(api_key, self.model, messages)
+                with _clients.slot(api_key), _limiter.slot() as permit:
+                    result = self._send(self._client(api_key)._generate, api_key, messages, sent,
+                                        cache_kwargs, prefix, stop, **kwargs)
+                    permit.cost = _total_tokens(result) or estimated
+            except Exception as e:
+                if hedge:
+                    error_class = _record_failure(scheduler, api_key, e)
+                    scheduler.release(api_key, estimated)
+                    self._record_call(api_key, messages, None, started, attempt, error_class, hedge)
+                    raise
+                delay = self._backoff_or_raise(scheduler, api_key, messages, estimated, e, attempt, started)
+                if settled is not None:
+                    settled.wait(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            # Outcome first: a half-open key takes no other call until it is known
+            scheduler.report_success(api_key)
+            scheduler.release(api_key, estimated, _total_tokens(result))
+            self._record_call(api_key, messages, result, started, attempt, hedge=hedge)
+            return result
+
+    async def _acall_pool(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                          keys_used: Optional[Set[str]] = None, hedge: bool = False, **kwargs: Any) -> ChatResult:
+        """Async twin of _call_pool."""
+        scheduler = self._keys()
+        estimated = self._estimate(messages)
+        started = time.monotonic()
+        attempt = 0
+        keys_used = keys_used if keys_used is not None else set()
+        while True:
+            api_key = await _aacquire_key(scheduler, estimated, keys_used, hedge, self._key_wait())
+            try:
+                sent, cache_kwargs, prefix = await _asplit_cached_prefix(api_key, self.model, messages)
+                async with _clients.aslot(api_key), _limiter.aslot() as permit:
+                    client = self._client(api_key)
+                    result = await self._asend(lambda m, **kw: _client_agenerate(client, m, stop, **kw), api_key,
+                                               messages, sent, cache_kwargs, prefix, **kwargs)
+                    permit.cost = _total_tokens(result) or estimated
+            except asyncio.CancelledError:
+                # Lost a hedge race (or the caller went away): hand the key back
+                scheduler.release(api_key, estimated)
+                raise
+            except Exception as e:
+                if hedge:
+                    error_class = _record_failure(scheduler, api_key, e)
+                    scheduler.release(api_key, estimated)
+                    self._record_call(api_key, messages, None, started, attempt, error_class, hedge)
+                    raise
+                await asyncio.sleep(self._backoff_or_raise(scheduler, api_key, messages, estimated, e, attempt, started))
+                attempt += 1
+                continue
+            # Outcome first: a half-open key takes no other call until it is known
+            scheduler.report_success(api_key)
+            scheduler.release(api_key, estimated, _total_tokens(result))
+            self._record_call(api_key, messages, result, started, attempt, hedge=hedge)
+            return result
+
+    def _send(self, generate, api_key: str, messages: List[BaseMessage], sent: List[BaseMessage],
+              cache_kwargs: Dict[str, Any], prefix: Optional[str], stop: Optional[List[str]], **kwargs: Any) -> ChatResult:
+        """Call `generate`, on the cached prefix when there is one, else with the full prompt."""
+        if not cache_kwargs:
+            return generate(messages, stop=stop, **kwargs)
+        try:
+            return generate(sent, stop=stop, **cache_kwargs, **kwargs)
+        except Exception as e:
+            if classify_error(e) != ErrorClass.CLIENT:
+                raise
+            # The provider dropped (or rejected) the cache: forget it and resend in full
+            logger.warning(f"Context cache rejected ({e}); resending the full prompt")
+            _context_cache.invalidate(api_key, self.model, prefix)
+            return generate(messages, stop=stop, **kwargs)
+
+    async def _asend(self, agenerate, api_key: str, messages: List[BaseMessage], sent: List[BaseMessage],
+                     cache_kwargs: Dict[str, Any], prefix: Optional[str], **kwargs: Any) -> ChatResult:
+        """Async twin of _send; `agenerate` already carries the stop sequences."""
+        if not cache_kwargs:
+            return await agenerate(messages, **kwargs)
+        try:
+            return await agenerate(sent, **cache_kwargs, **kwargs)
+        except Exception as e:
+            if classify_error(e) != ErrorClass.CLIENT:
+                raise
+            logger.warning(f"Context cache rejected ({e}); resending the full prompt")
+            _context_cache.invalidate(api_key, self.model, prefix)
+            return await agenerate(messages, **kwargs)
+
+    def _backoff_or_raise(self, scheduler: KeyScheduler, api_key: str, messages: List[BaseMessage], estimated: int,
+                          error: Exception, attempt: int, started: float) -> float:
+        try:
+            return _retry_delay(scheduler, api_key, estimated, error, attempt, started)
+        except Exception:
+            # Out of retries: the failed call still shows up in the metrics
+            self._record_call(api_key, messages, None, started, attempt, classify_error(error))
+            raise
+
+    def _record_call(self, api_key: str, messages: List[BaseMessage], result: Optional[ChatResult],
+                     started: float, attempt: int, outcome: str = "ok", hedge: bool = False):
+        usage = _usage(result) or {}
+        prompt_tokens = usage.get("input_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = usage.get("output_tokens")
+        if output_tokens is None:
+            output_tokens = sum(estimate_tokens(g.text) for g in result.generations) if result else 0
+        telemetry.record(CallRecord(
+            model=self.model,
+            key_alias=self._keys().alias(api_key),
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            latency=time.monotonic() - started,
+            retries=attempt,
+            outcome=outcome,
+            hedge=hedge,
+            cached_tokens=(usage.get("input_token_details") or {}).get("cache_read") or 0,
+        ))
+
+def _acquire_key(scheduler: KeyScheduler, estimated: int, keys_used: Set[str], hedge: bool = False,
+                 wait: Optional[float] = None) -> str:
+    if hedge:
+        api_key = scheduler.acquire(estimated, timeout=0, exclude=keys_used)
+        if not api_key:
+            raise RuntimeError("No spare API key for a hedged request.")
+    else:
+        api_key = scheduler.acquire(estimated, timeout=wait)
+        if not api_key:
+            raise NoKeyAvailable("No available API keys left.")
+    keys_used.add(api_key)
+    return api_key
+
+async def _aacquire_key(scheduler: KeyScheduler, estimated: int, keys_used: Set[str], hedge: bool = False,
+                        wait: Optional[float] = None) -> str:
+    # Fast path without leaving the loop; only wait for quota in a thread
+    api_key = scheduler.acquire(estimated, timeout=0, exclude=keys_used if hedge else None)
+    if api_key is None:
+        if hedge:
+            raise RuntimeError("No spare API key for a hedged request.")
+        api_key = await asyncio.get_running_loop().run_in_executor(None, scheduler.acquire, estimated, wait)
+        if not api_key:
+            raise NoKeyAvailable("No available API keys left.")
+    keys_used.add(api_key)
+    return api_key
+
+def _split_cached_prefix(api_key: str, model: str, messages: List[BaseMessage]
+                         ) -> Tuple[List[BaseMessage], Dict[str, Any], Optional[str]]:
+    """(messages to send, extra client kwargs, prefix) for a prompt starting with a registered prefix."""
+    matched = _context_cache.match(messages) if _context_cache is not None else None
+    if matched is None:
+        return messages, {}, None
+    prefix, rest = matched
+    name = _context_cache.handle(api_key, model, prefix)
+    if not name:
+        return messages, {}, None
+    return rest, {"cached_content": name}, prefix
+
+async def _asplit_cached_prefix(api_key: str, model: str, messages: List[BaseMessage]
+                                ) -> Tuple[List[BaseMessage], Dict[str, Any], Optional[str]]:
+    matched = _context_cache.match(messages) if _context_cache is not None else None
+    if matched is not None and not _context_cache.ready(api_key, model, matched[0]):
+        # Creating the cache is a blocking round trip
+        return await asyncio.to_thread(_split_cached_prefix, api_key, model, messages)
+    return _split_cached_prefix(api_key, model, messages)
+
+def _retry_delay(scheduler: KeyScheduler, api_key: str, estimated: int, error: Exception, attempt: int,
+                 started: float) -> float:
+    """Release the key after a failed attempt; return the backoff delay or raise."""
+    error_class = _record_failure(scheduler, api_key, error)
+    scheduler.release(api_key, estimated)
+    if not RETRY_POLICY.should_retry(error_class, attempt, started):
+        if error_class == ErrorClass.CLIENT:
+            raise error
+        raise RetryBudgetExhausted(
+            f"LLM call failed after {attempt + 1} attempt(s): {error}", error_class, error
+        ) from error
+    delay = RETRY_POLICY.backoff(attempt, error_class)
+    logger.warning(f"[Attempt {attempt + 1}] {error_class} error on {scheduler.alias(api_key)}: {error}; retrying in {delay:.2f}s")
+    return delay
+
+def _record_failure(scheduler: KeyScheduler, api_key: str, error: Exception) -> str:
+    """Classify a failed call and penalise the key accordingly."""
+    error_class = classify_error(error)
+    if error_class == ErrorClass.AUTH:
+        # A bad key is bad for every model
+        for each in _all_schedulers():
+            each.report_failure(api_key, cooldown=KEY_COOLDOWNS[error_class])
+        logger.error(f"Opened circuit for API key {scheduler.alias(api_key)} ({error_class})")
+    elif error_class in KEY_COOLDOWNS:
+        # Quota is per key and model: open this model's breaker for the key
+        scheduler.report_failure(api_key, cooldown=KEY_COOLDOWNS[error_class])
+        logger.error(f"Opened circuit for API key {scheduler.alias(api_key)} ({error_class})")
+    elif error_class != ErrorClass.CLIENT:
+        # Transient/server errors are not the key's fault; only lower its health
+        scheduler.report_failure(api_key)
+    return error_class
+
+def _quota_exhausted(error: Exception) -> bool:
+    """True when a call failed for lack of quota rather than a bad request or outage."""
+    if isinstance(error, NoKeyAvailable):
+        return True
+    return isinstance(error, RetryBudgetExhausted) and error.error_class == ErrorClass.QUOTA
+
+def _usage(result: Optional[ChatResult]) -> Optional[Dict[str, int]]:
+    if not result or not result.generations:
+        return None
+    return getattr(result.generations[0].message, "usage_metadata", None)
+
+def _total_tokens(result: ChatResult) -> Optional[int]:
+    usage = _usage(result)
+    if usage:
+        return usage.get("total_tokens")
+    return None
+
+def _metered_cache(temperature: float, model: str = DEFAULT_MODEL) -> Optional[MeteredCache]:
+    cache = _cache_for(temperature)
+    if cache is None:
+        return None
+    return MeteredCache(cache, telemetry, model, estimate_tokens)
+
+def get_llm(temperature: float = 0.7, model: str = DEFAULT_MODEL, max_output_tokens: Optional[int] = None,
+            fallback_models: Tuple[str, ...] = ()) -> PooledGeminiChat:
+    """Returns the shared LLM for these settings; it picks the best API key for every call.
+
+    The model object holds no per-call state, so every agent shares one
+    instance (and, through it, the pooled clients). Deterministic
+    (temperature 0) models are served from the response cache when the
+    same prompt was answered before.
+    """
+    if not API_KEYS:
+        raise RuntimeError("No available API keys left.")
+    settings = (temperature, model, max_output_tokens, tuple(fallback_models))
+    with _llms_lock:
+        llm = _llms.get(settings)
+        if llm is None:
+            llm = PooledGeminiChat(
+                model=model,
+                temperature=temperature,
+                top_p=0.9,
+                max_output_tokens=max_output_tokens,
+                fallback_models=list(fallback_models),
+                cache=_metered_cache(temperature, model),
+                verbose=True
+            )
+            _llms[settings] = llm
+        return llm
+
+def route_llm(task: str, latency_budget: Optional[float] = None) -> PooledGeminiChat:
+    """The shared LLM the routing policy picks for a task class and latency budget (seconds).
+
+    Task classes are the keys of TASK_POLICIES. The policy's other tiers
+    are quota fallbacks.
+    """
+    route = router.route(task, latency_budget)
+    return get_llm(
+        route.temperature,
+        model=route.tier.model,
+        max_output_tokens=route.max_output_tokens,
+        fallback_models=tuple(t.model for t in route.fallbacks),
+    )
+
+def get_llm_chain(prompt_template: str, output_key: str = "output", temperature: float = 0.7) -> LLMChain:
     prompt = PromptTemplate(
         template=prompt_template,
         input_variables=["input"]
     )
     return LLMChain(
-        llm=get_llm(),
+        llm=get_llm(temperature),
         prompt=prompt,
         output_key=output_key,
         verbose=True
     )
 
 def run_chain_with_retries(chain: LLMChain, input_text: str, retries: int = 3) -> str:
-    for attempt in range(retries):
-        try:
-            return chain.run(input=input_text)
-        except Exception as e:
-            logger.warning(f"[Attempt {attempt + 1}] Error during LLM call: {e}")
-            current_key = chain.llm.google_api_key
-            blacklist_api_key(current_key)
-            chain.llm = get_llm()
-    raise RuntimeError("All retries failed with available API keys.")
+    # Each LLM call already retries across keys under RETRY_POLICY; this only
+    # re-runs the chain for retryable errors raised outside the model call.
+    # Calls that exhausted their own budget are not retried again.
+    try:
+        return retry_call(
+            lambda: chain.run(input=input_text),
+            RetryPolicy(max_attempts=retries, budget_seconds=RETRY_POLICY.budget_seconds),
+        )
+    except RetryBudgetExhausted as e:
+        raise RuntimeError("All retries failed with available API keys.") from e
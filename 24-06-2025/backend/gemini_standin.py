@@ -0,0 +1,472 @@
+"""Local stand-in for the Gemini REST API, for offline benchmarks and load tests.
+
+Point the LLM factories at it with GEMINI_API_ENDPOINT=http://127.0.0.1:8089
+(any API key is accepted) and start it with:
+
+    python gemini_standin.py --port 8089 --config standin.json
+
+The config file (all keys optional) controls latency, injected errors and
+what the model "says":
+
+    {
+      "seed": 42,
+      "latency": {"distribution": "lognormal", "mean_ms": 800, "sigma": 0.5,
+                   "min_ms": 50, "max_ms": 20000, "per_token_ms": 0,
+                   "per_prompt_token_ms": 0},
+      "errors": {"rate_429": 0.05, "rate_500": 0.01, "rate_timeout": 0.01,
+                 "timeout_seconds": 60},
+      "responses": [{"match": "Fix Generator", "response": "Final Answer: {...}"}],
+      "script": ["first reply", "second reply"],
+      "default_response": "Thought: done\\nFinal Answer: {}",
+      "mode": "stub",
+      "cassette": "standin_cassette.jsonl",
+      "upstream": "https://generativelanguage.googleapis.com",
+      "min_cache_tokens": 0
+    }
+
+Modes: "stub" answers from responses/script/default_response; "record"
+forwards each request upstream with the caller's real key and appends the
+exchange to the cassette; "replay" serves recorded exchanges by request
+hash and falls back to the stub on a miss. Latency and errors are drawn
+from an RNG seeded by (seed, prompt, occurrence), so a given request
+sequence behaves the same on every run.
+
+Context caches (POST /v1beta/cachedContents) are kept in memory. A
+generateContent call naming one gets the cached text prepended to its
+prompt and reports it as cachedContentTokenCount; only uncached prompt
+tokens cost per_prompt_token_ms. Creates below min_cache_tokens fail with
+400, like the real API's minimum cache size.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "seed": 0,
+    "latency": {"distribution": "fixed", "mean_ms": 0, "sigma": 0.5, "min_ms": 0, "max_ms": 60000, "per_token_ms": 0,
+                "per_prompt_token_ms": 0},
+    "errors": {"rate_429": 0.0, "rate_500": 0.0, "rate_timeout": 0.0, "timeout_seconds": 60},
+    "responses": [],
+    "script": [],
+    "default_response": "Thought: I have analysed the input.\nFinal Answer: {\"fixes\": []}",
+    "mode": "stub",
+    "cassette": "standin_cassette.jsonl",
+    "upstream": "https://generativelanguage.googleapis.com",
+    "min_cache_tokens": 0,
+}
+
+ERRORS = {
+    429: ("RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    500: ("INTERNAL", "An internal error has occurred."),
+    504: ("DEADLINE_EXCEEDED", "Deadline exceeded."),
+    404: ("NOT_FOUND", "Requested entity was not found."),
+    400: ("INVALID_ARGUMENT", "Request contains an invalid argument."),
+}
+
+EMBEDDING_SIZE = 768
+
+
+class StandinState:
+    def __init__(self, config: Dict[str, Any]):
+        self.config = _merge(DEFAULT_CONFIG, config)
+        self.lock = threading.Lock()
+        self.seen: Counter = Counter()
+        self.stats: Counter = Counter()
+        self.script_index = 0
+        self.cassette: Dict[str, Dict[str, Any]] = {}
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        if self.config["mode"] == "replay":
+            self._load_cassette()
+
+    def _load_cassette(self):
+        path = self.config["cassette"]
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.cassette[entry["key"]] = entry
+
+    def rng(self, prompt: str) -> random.Random:
+        """Per-request RNG: same seed + prompt + occurrence => same draws."""
+        with self.lock:
+            self.seen[prompt] += 1
+            occurrence = self.seen[prompt]
+        digest = hashlib.sha256(f"{self.config['seed']}|{occurrence}|{prompt}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def next_scripted(self) -> Optional[str]:
+        with self.lock:
+            script = self.config["script"]
+            if self.script_index < len(script):
+                reply = script[self.script_index]
+                self.script_index += 1
+                return reply
+        return None
+
+    def count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    chunks: List[str] = []
+    system = body.get("systemInstruction") or body.get("system_instruction")
+    for content in ([system] if system else []) + list(body.get("contents", [])):
+        for part in content.get("parts", []):
+            if "text" in part:
+                chunks.append(part["text"])
+    return "\n".join(chunks)
+
+
+def _token_count(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def _request_key(model: str, body: Dict[str, Any]) -> str:
+    canonical = json.dumps({"model": model, "body": body}, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _latency_seconds(latency: Dict[str, Any], rng: random.Random) -> float:
+    mean = float(latency.get("mean_ms", 0))
+    distribution = latency.get("distribution", "fixed")
+    if distribution == "uniform":
+        value = rng.uniform(float(latency.get("min_ms", 0)), float(latency.get("max_ms", mean * 2)))
+    elif distribution == "normal":
+        value = rng.gauss(mean, float(latency.get("sigma", 0.5)) * mean)
+    elif distribution == "lognormal" and mean > 0:
+        sigma = float(latency.get("sigma", 0.5))
+        # Parameterised so the distribution's mean is mean_ms
+        value = rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    else:
+        value = mean
+    value = min(max(value, float(latency.get("min_ms", 0))), float(latency.get("max_ms", 60000)))
+    return value / 1000.0
+
+
+def _ttl_seconds(body: Dict[str, Any]) -> float:
+    """Seconds until expiry from a REST `ttl` ("3600s") or `expireTime` (RFC 3339)."""
+    if body.get("expireTime"):
+        expires = datetime.fromisoformat(body["expireTime"].replace("Z", "+00:00"))
+        return expires.timestamp() - time.time()
+    return float(str(body.get("ttl", "3600s")).rstrip("s"))
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _apply_stop(text: str, stop: List[str]) -> str:
+    cut = len(text)
+    for sequence in stop or []:
+        index = text.find(sequence)
+        if index != -1:
+            cut = min(cut, index)
+    return text[:cut]
+
+
+def _error(code: int, message: Optional[str] = None) -> JSONResponse:
+    status, default = ERRORS.get(code, ("UNKNOWN", "Error"))
+    return JSONResponse(
+        status_code=code,
+        content={"error": {"code": code, "message": message or default, "status": status}},
+    )
+
+
+def _candidate_response(model: str, prompt: str, text: str, finish_reason: str = "STOP",
+                        cached_tokens: int = 0) -> Dict[str, Any]:
+    prompt_tokens = _token_count(prompt)
+    output_tokens = _token_count(text)
+    usage = {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": output_tokens,
+        "totalTokenCount": prompt_tokens + output_tokens,
+    }
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": finish_reason,
+            "index": 0,
+            "safetyRatings": [],
+        }],
+        "usageMetadata": usage,
+        "modelVersion": model,
+    }
+
+
+def create_app(config: Optional[Dict[str, Any]] = None) -> FastAPI:
+    state = StandinState(config or {})
+    app = FastAPI(title="Gemini stand-in")
+    app.state.standin = state
+
+    def stub_reply(prompt: str) -> str:
+        for rule in state.config["responses"]:
+            if re.search(rule.get("match", ""), prompt, re.S):
+                return rule["response"]
+        scripted = state.next_scripted()
+        if scripted is not None:
+            return scripted
+        return state.config["default_response"]
+
+    async def inject_faults(prompt: str) -> Optional[JSONResponse]:
+        """Sleep for the sampled latency and maybe return an injected error."""
+        rng = state.rng(prompt)
+        errors = state.config["errors"]
+        roll = rng.random()
+        await asyncio.sleep(_latency_seconds(state.config["latency"], rng))
+        if roll < errors["rate_429"]:
+            state.count("injected_429")
+            return _error(429)
+        roll -= errors["rate_429"]
+        if roll < errors["rate_500"]:
+            state.count("injected_500")
+            return _error(500)
+        roll -= errors["rate_500"]
+        if roll < errors["rate_timeout"]:
+            state.count("injected_timeout")
+            await asyncio.sleep(float(errors["timeout_seconds"]))
+            return _error(504)
+        return None
+
+    async def forward(model: str, action: str, request: Request, body: Dict[str, Any]) -> JSONResponse:
+        """Record mode: proxy to the real API and append the exchange to the cassette."""
+        key = request.headers.get("x-goog-api-key") or request.query_params.get("key", "")
+        url = f"{state.config['upstream'].rstrip('/')}/v1beta/models/{model}:{action}"
+        async with httpx.AsyncClient(timeout=120) as client:
+            upstream = await client.post(url, json=body, headers={"x-goog-api-key": key})
+        payload = upstream.json()
+        entry = {"key": _request_key(model, body), "model": model, "action": action,
+                 "request": body, "status": upstream.status_code, "response": payload}
+        with state.lock:
+            with open(state.config["cassette"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        state.count("recorded")
+        return JSONResponse(status_code=upstream.status_code, content=payload)
+
+    def cached_content(name: str) -> Optional[Dict[str, Any]]:
+        with state.lock:
+            entry = state.caches.get(name)
+            if entry is not None and entry["expires"] <= time.time():
+                del state.caches[name]
+                entry = None
+        return entry
+
+    def cache_resource(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {"name": entry["name"], "model": entry["model"], "displayName": entry.get("displayName", ""),
+                "createTime": _timestamp(entry["created"]), "updateTime": _timestamp(entry["created"]),
+                "expireTime": _timestamp(entry["expires"]),
+                "usageMetadata": {"totalTokenCount": _token_count(entry["text"])}}
+
+    async def passthrough(method: str, path: str, request: Request, body: Optional[Dict[str, Any]] = None) -> JSONResponse:
+        """Record mode: send a non-generation call (cache management) straight upstream."""
+        key = request.headers.get("x-goog-api-key") or request.query_params.get("key", "")
+        async with httpx.AsyncClient(timeout=120) as client:
+            upstream = await client.request(method, f"{state.config['upstream'].rstrip('/')}{path}",
+                                            json=body, headers={"x-goog-api-key": key})
+        return JSONResponse(status_code=upstream.status_code, content=upstream.json() if upstream.content else {})
+
+    async def generate(model: str, request: Request, body: Dict[str, Any]):
+        prompt = _prompt_text(body)
+        state.count("generate")
+        mode = state.config["mode"]
+        if mode == "record":
+            return await forward(model, "generateContent", request, body)
+        if mode == "replay":
+            entry = state.cassette.get(_request_key(model, body))
+            if entry is not None:
+                state.count("replayed")
+                return JSONResponse(status_code=entry["status"], content=entry["response"])
+            state.count("replay_miss")
+        cached_tokens = 0
+        cache_name = body.get("cachedContent") or body.get("cached_content")
+        if cache_name:
+            entry = cached_content(cache_name)
+            if entry is None:
+                return _error(404, f"CachedContent not found (or expired): {cache_name}")
+            state.count("cached_generate")
+            cached_tokens = _token_count(entry["text"])
+            prompt = entry["text"] + "\n" + prompt
+        fault = await inject_faults(prompt)
+        if fault is not None:
+            return fault
+        per_prompt_token = float(state.config["latency"].get("per_prompt_token_ms", 0))
+        if per_prompt_token:
+            # Cached tokens were processed when the cache was created
+            await asyncio.sleep(per_prompt_token * max(0, _token_count(prompt) - cached_tokens) / 1000.0)
+        config = body.get("generationConfig") or body.get("generation_config") or {}
+        text = stub_reply(prompt)
+        stop = config.get("stopSequences") or config.get("stop_sequences") or []
+        text = _apply_stop(text, stop)
+        max_tokens = config.get("maxOutputTokens") or config.get("max_output_tokens")
+        finish = "STOP"
+        if max_tokens and _token_count(text) > int(max_tokens):
+            text = text[: int(max_tokens) * 4]
+            finish = "MAX_TOKENS"
+        per_token = float(state.config["latency"].get("per_token_ms", 0))
+        if per_token:
+            await asyncio.sleep(per_token * _token_count(text) / 1000.0)
+        return JSONResponse(content=_candidate_response(model, prompt, text, finish, cached_tokens))
+
+    async def stream(model: str, request: Request, body: Dict[str, Any]):
+        response = await generate(model, request, body)
+        if response.status_code != 200:
+            return response
+        payload = json.loads(response.body)
+        text = payload["candidates"][0]["content"]["parts"][0]["text"]
+        words = re.findall(r"\S+\s*", text) or [""]
+        per_token = float(state.config["latency"].get("per_token_ms", 0))
+        sse = request.query_params.get("alt") == "sse"
+
+        async def chunks():
+            if not sse:
+                yield "["
+            for index, word in enumerate(words):
+                chunk = _candidate_response(model, "", word)
+                chunk["usageMetadata"] = payload["usageMetadata"]
+                data = json.dumps(chunk)
+                if sse:
+                    yield f"data: {data}\r\n\r\n"
+                else:
+                    yield ("," if index else "") + data
+                if per_token:
+                    await asyncio.sleep(per_token / 1000.0)
+            if not sse:
+                yield "]"
+
+        media_type = "text/event-stream" if sse else "application/json"
+        return StreamingResponse(chunks(), media_type=media_type)
+
+    def embed(body: Dict[str, Any]) -> Dict[str, Any]:
+        """Deterministic pseudo-embedding so RAG code paths work offline."""
+        text = _prompt_text({"contents": [body.get("content", {})]})
+        rng = random.Random(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16))
+        values = [rng.uniform(-1, 1) for _ in range(EMBEDDING_SIZE)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return {"values": [v / norm for v in values]}
+
+    @app.post("/v1beta/models/{model_action:path}")
+    async def model_action(model_action: str, request: Request):
+        model, _, action = model_action.partition(":")
+        model = model.split("/")[-1]
+        body = await request.json()
+        if action == "generateContent":
+            return await generate(model, request, body)
+        if action == "streamGenerateContent":
+            return await stream(model, request, body)
+        if action == "countTokens":
+            contents = body.get("contents") or body.get("generateContentRequest", {}).get("contents", [])
+            return {"totalTokens": _token_count(_prompt_text({"contents": contents}))}
+        if action == "embedContent":
+            state.count("embed")
+            return {"embedding": embed(body)}
+        if action == "batchEmbedContents":
+            state.count("embed")
+            return {"embeddings": [embed(item) for item in body.get("requests", [])]}
+        return _error(404, f"Unsupported action: {action}")
+
+    @app.get("/v1beta/models/{model}")
+    async def get_model(model: str):
+        return {"name": f"models/{model}", "inputTokenLimit": 1048576, "outputTokenLimit": 8192,
+                "supportedGenerationMethods": ["generateContent", "countTokens"]}
+
+    @app.post("/v1beta/cachedContents")
+    async def create_cached_content(request: Request):
+        body = await request.json()
+        if state.config["mode"] == "record":
+            return await passthrough("POST", "/v1beta/cachedContents", request, body)
+        text = _prompt_text(body)
+        model = body.get("model", "")
+        if _token_count(text) < int(state.config["min_cache_tokens"]):
+            return _error(400, f"Cached content is too small. total_token_count={_token_count(text)}, "
+                               f"min_total_token_count={state.config['min_cache_tokens']}")
+        digest = hashlib.sha256(f"{model}|{text}".encode("utf-8")).hexdigest()[:16]
+        now = time.time()
+        entry = {"name": f"cachedContents/{digest}", "model": model, "text": text,
+                 "displayName": body.get("displayName", ""), "created": now, "expires": now + _ttl_seconds(body)}
+        with state.lock:
+            state.caches[entry["name"]] = entry
+        state.count("cache_created")
+        return cache_resource(entry)
+
+    @app.get("/v1beta/cachedContents/{cache_id}")
+    async def get_cached_content(cache_id: str, request: Request):
+        if state.config["mode"] == "record":
+            return await passthrough("GET", f"/v1beta/cachedContents/{cache_id}", request)
+        entry = cached_content(f"cachedContents/{cache_id}")
+        if entry is None:
+            return _error(404)
+        return cache_resource(entry)
+
+    @app.delete("/v1beta/cachedContents/{cache_id}")
+    async def delete_cached_content(cache_id: str, request: Request):
+        if state.config["mode"] == "record":
+            return await passthrough("DELETE", f"/v1beta/cachedContents/{cache_id}", request)
+        with state.lock:
+            entry = state.caches.pop(f"cachedContents/{cache_id}", None)
+        if entry is None:
+            return _error(404)
+        return {}
+
+    @app.get("/standin/stats")
+    async def stats():
+        with state.lock:
+            return dict(state.stats)
+
+    return app
+
+
+def load_config(path: Optional[str]) -> Dict[str, Any]:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+app = create_app(load_config(os.getenv("GEMINI_STANDIN_CONFIG")))
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local Gemini stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--config", default=os.getenv("GEMINI_STANDIN_CONFIG"))
+    parser.add_argument("--mode", choices=["stub", "record", "replay"])
+    parser.add_argument("--cassette")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    for name in ("mode", "cassette", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            config[name] = value
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
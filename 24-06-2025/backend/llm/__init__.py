@@ -0,0 +1,61 @@
+from .adaptive_limiter import AdaptiveLimiter, Permit
+from .client_pool import ClientPool
+from .context_cache import ContextCache
+from .hedging import HedgeBudget, Hedger, LatencyTracker
+from .key_scheduler import KeyScheduler, KeyState, Lease, TokenBucket
+from .prompt_packing import PackResult, PromptPacker, Section, find_anchor_lines
+from .router import ModelRouter, ModelTier, Route, TaskPolicy
+from .response_cache import SQLiteLLMCache, cache_key
+from .shared_state import SharedKeyScheduler, key_id
+from .singleflight import SingleFlight
+from .structured_output import StructuredOutputError, parse_model, repair_json, response_schema
+from .telemetry import CallRecord, Histogram, MeteredCache, Telemetry
+from .retry import (
+    CircuitBreaker,
+    ErrorClass,
+    RetryBudgetExhausted,
+    RetryPolicy,
+    classify_error,
+    retry_call
+)
+
+__all__ = [
+    'AdaptiveLimiter',
+    'Permit',
+    'ClientPool',
+    'ContextCache',
+    'HedgeBudget',
+    'Hedger',
+    'LatencyTracker',
+    'KeyScheduler',
+    'KeyState',
+    'Lease',
+    'TokenBucket',
+    'PackResult',
+    'PromptPacker',
+    'Section',
+    'find_anchor_lines',
+    'ModelRouter',
+    'ModelTier',
+    'Route',
+    'TaskPolicy',
+    'SQLiteLLMCache',
+    'cache_key',
+    'SharedKeyScheduler',
+    'key_id',
+    'SingleFlight',
+    'StructuredOutputError',
+    'parse_model',
+    'repair_json',
+    'response_schema',
+    'CallRecord',
+    'Histogram',
+    'MeteredCache',
+    'Telemetry',
+    'CircuitBreaker',
+    'ErrorClass',
+    'RetryBudgetExhausted',
+    'RetryPolicy',
+    'classify_error',
+    'retry_call'
+]
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger("LLM-Limiter")
+
+
+class AdaptiveLimiter:
+    """Concurrency limit for upstream LLM calls that tunes itself (AIMD + latency gradient).
+
+    - Success at normal latency, with the limit actually in use: additive
+      increase, about +1 per `limit` successes.
+    - Recent latency above `latency_tolerance` x baseline: gentle decrease
+      (x`latency_decrease`).
+    - Overload error (`is_overload`, e.g. 429): multiplicative decrease (x`backoff`).
+
+    Latency is divided by the call's `cost` (set on the permit the slot
+    yields, e.g. total tokens), so long prompts do not read as congestion.
+    Recent latency is a fast EWMA of latency per unit of cost. The baseline
+    is a slow EWMA, so it can follow a provider that has become slower for
+    good.
+    At most one decrease happens per `decrease_interval` seconds, so one
+    burst of 429s halves the limit once instead of collapsing it to
+    `min_limit`. Threads (`slot`) and coroutines (`aslot`) share one limit.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        latency_decrease: float = 0.9,
+        decrease_interval: float = 1.0,
+        is_overload: Callable[[BaseException], bool] = lambda e: False,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.latency_decrease = latency_decrease
+        self.decrease_interval = decrease_interval
+        self.is_overload = is_overload
+        self._limit = float(max(min_limit, min(max_limit, initial)))
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._last_decrease = 0.0
+        self.baseline: Optional[float] = None
+        self.recent: Optional[float] = None
+        self.in_flight = 0
+        self.overloads = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < self.limit:
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(self._try_acquire, timeout)
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._cond:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """Free a slot; `latency` (on success) or `overloaded` adjusts the limit."""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if overloaded:
+                self.overloads += 1
+                self._decrease(self.backoff)
+            elif latency is not None:
+                self._observe(latency)
+            self._wake()
+
+    def _observe(self, latency: float):
+        if self.baseline is None:
+            self.baseline = self.recent = latency
+        self.recent = 0.7 * self.recent + 0.3 * latency
+        self.baseline = 0.95 * self.baseline + 0.05 * latency
+        if self.recent > self.baseline * self.latency_tolerance:
+            self._decrease(self.latency_decrease)
+        elif self.in_flight + 1 >= self.limit // 2:
+            # Only grow while the current limit is actually being used
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_interval:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        if self.limit != previous:
+            logger.info(f"Concurrency limit {previous} -> {self.limit}")
+
+    def _wake(self):
+        # Wake everyone; whoever loses the race re-queues
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_resolve, waiter)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        permit = Permit()
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(overloaded=isinstance(e, Exception) and self.is_overload(e))
+            raise
+        self.release(permit.latency())
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        permit = Permit()
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(overloaded=isinstance(e, Exception) and self.is_overload(e))
+            raise
+        self.release(permit.latency())
+
+
+class Permit:
+    """One held slot; set `cost` once the call's size is known."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.cost = 1.0
+
+    def latency(self) -> float:
+        return (time.monotonic() - self.started) / max(1.0, self.cost)
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class ClientPool:
+    """Long-lived LLM clients with bounded concurrency per API key.
+
+    Clients are built once per (key, settings) and reused, so their
+    underlying gRPC/HTTP connections stay open between calls. Each key also
+    gets a semaphore (one for threads, one per event loop for coroutines)
+    capping how many calls may be in flight on it at once.
+    """
+
+    def __init__(self, factory: Callable[..., Any], max_concurrency_per_key: int = 8):
+        self._factory = factory
+        self.max_concurrency_per_key = max_concurrency_per_key
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple, Any] = {}
+        self._thread_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_slots: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+
+    def client(self, api_key: str, *settings: Hashable) -> Any:
+        client_key = (api_key,) + settings
+        with self._lock:
+            client = self._clients.get(client_key)
+            if client is None:
+                client = self._factory(api_key, *settings)
+                self._clients[client_key] = client
+            return client
+
+    @contextmanager
+    def slot(self, api_key: str):
+        with self._lock:
+            semaphore = self._thread_slots.get(api_key)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_concurrency_per_key)
+                self._thread_slots[api_key] = semaphore
+        with semaphore:
+            yield
+
+    @asynccontextmanager
+    async def aslot(self, api_key: str):
+        # asyncio primitives belong to one loop, so keep one semaphore per loop
+        slot_key = (id(asyncio.get_running_loop()), api_key)
+        with self._lock:
+            semaphore = self._async_slots.get(slot_key)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency_per_key)
+                self._async_slots[slot_key] = semaphore
+        async with semaphore:
+            yield
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._async_slots.clear()
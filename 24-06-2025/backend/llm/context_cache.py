@@ -0,0 +1,111 @@
+import hashlib
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from llm.singleflight import SingleFlight
+
+logger = logging.getLogger("LLM-Context-Cache")
+
+
+class ContextCache:
+    """Static prompt prefixes kept in the provider's context cache.
+
+    Agents register the immutable head of their prompt templates once.
+    When a call's first message starts with a registered prefix, the prefix
+    is served from a cached-content handle and only the variable suffix is
+    sent. Handles are per (API key, model): provider caches belong to the
+    key's project. `create(api_key, model, prefix, ttl)` makes one and
+    returns its name. A failed create (e.g. prefix under the provider
+    minimum) is not retried for `retry_after` seconds, and calls just send
+    the full prompt meanwhile.
+    """
+
+    def __init__(self, create: Callable[[str, str, str, float], str], min_tokens: int = 0,
+                 ttl_seconds: float = 3600, retry_after: float = 300,
+                 count_tokens: Callable[[str], int] = lambda text: len(text) // 4 + 1):
+        self._create = create
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.retry_after = retry_after
+        self.count_tokens = count_tokens
+        self._lock = threading.Lock()
+        self._prefixes: List[str] = []
+        # (api_key, model, prefix digest) -> (handle name or None, valid until)
+        self._handles: Dict[Tuple[str, str, str], Tuple[Optional[str], float]] = {}
+        self._creating = SingleFlight()
+        self.hits = 0
+        self.creates = 0
+
+    def register(self, prefix: str) -> bool:
+        """Register an immutable prompt prefix; returns False if it is too short to cache."""
+        if not prefix or self.count_tokens(prefix) < self.min_tokens:
+            return False
+        with self._lock:
+            if prefix not in self._prefixes:
+                self._prefixes.append(prefix)
+                # Longest first, so the most specific prefix wins
+                self._prefixes.sort(key=len, reverse=True)
+        return True
+
+    def match(self, messages: List[BaseMessage]) -> Optional[Tuple[str, List[BaseMessage]]]:
+        """(prefix, messages without it) if the first message starts with a registered prefix."""
+        if not messages or not isinstance(messages[0].content, str):
+            return None
+        first = messages[0]
+        with self._lock:
+            prefix = next((p for p in self._prefixes if first.content.startswith(p)), None)
+        if prefix is None:
+            return None
+        suffix = first.content[len(prefix):]
+        if isinstance(first, SystemMessage) and not suffix:
+            return prefix, list(messages[1:])
+        if not suffix.strip():
+            return None
+        return prefix, [HumanMessage(content=suffix)] + list(messages[1:])
+
+    def _key(self, api_key: str, model: str, prefix: str) -> Tuple[str, str, str]:
+        return api_key, model, hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    def ready(self, api_key: str, model: str, prefix: str) -> bool:
+        """True if `handle` would answer without calling the provider."""
+        with self._lock:
+            entry = self._handles.get(self._key(api_key, model, prefix))
+        return entry is not None and entry[1] > time.time()
+
+    def handle(self, api_key: str, model: str, prefix: str) -> Optional[str]:
+        """Name of a live cache for `prefix`, creating one if needed; None if unavailable."""
+        key = self._key(api_key, model, prefix)
+        with self._lock:
+            entry = self._handles.get(key)
+        if entry is not None and entry[1] > time.time():
+            if entry[0]:
+                self.hits += 1
+            return entry[0]
+        return self._creating.do("|".join(key), lambda: self._create_handle(key, api_key, model, prefix))
+
+    def _create_handle(self, key: Tuple[str, str, str], api_key: str, model: str, prefix: str) -> Optional[str]:
+        try:
+            name = self._create(api_key, model, prefix, self.ttl_seconds)
+            # Renew a minute early rather than race the provider's expiry
+            valid_until = time.time() + max(0.0, self.ttl_seconds - 60)
+            self.creates += 1
+        except Exception as e:
+            logger.warning(f"Context cache create failed for {model}: {e}; sending full prompts for {self.retry_after:.0f}s")
+            name, valid_until = None, time.time() + self.retry_after
+        with self._lock:
+            self._handles[key] = (name, valid_until)
+        return name
+
+    def invalidate(self, api_key: str, model: str, prefix: str):
+        with self._lock:
+            self._handles.pop(self._key(api_key, model, prefix), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            live = sum(1 for name, until in self._handles.values() if name and until > time.time())
+            prefixes = len(self._prefixes)
+        return {"prefixes": prefixes, "handles": live, "hits": self.hits, "creates": self.creates}
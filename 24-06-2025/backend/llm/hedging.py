@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies with percentile lookups."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(pct / 100.0 * len(samples))) - 1))
+        return samples[index]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgeBudget:
+    """Caps hedges to `max_ratio` of primary calls (e.g. 0.1 = at most 10% extra quota)."""
+
+    def __init__(self, max_ratio: float = 0.1, burst: int = 2):
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+        self._credit = float(burst)
+        self._burst = float(burst)
+        self.calls = 0
+        self.hedges = 0
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+            self._credit = min(self._burst, self._credit + self.max_ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._credit >= 1:
+                self._credit -= 1
+                self.hedges += 1
+                return True
+            return False
+
+
+class HedgeLost(Exception):
+    """Raised by an attempt that noticed the other attempt of its hedged call already won."""
+
+
+def _run(future: Future, fn: Callable[..., Any], *args: Any):
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(fn(*args))
+    except BaseException as e:
+        future.set_exception(e)
+
+
+class Hedger:
+    """Sends a backup request when the primary is slower than a latency percentile.
+
+    The hedge delay is the `percentile` of recently observed latencies; until
+    `min_samples` calls have been seen no hedging happens. Whichever attempt
+    finishes first wins.
+
+    Sync: the primary starts at once on a thread of its own, never queued,
+    so the delay measures the call itself and hedging caps no concurrency.
+    Backups run in a pool of `max_backups` workers; when all are busy the
+    call is not hedged. Both attempts get an Event that is set once the race
+    is decided; the loser should check it before sending or retrying and
+    raise HedgeLost. An HTTP request already in flight cannot be interrupted
+    and runs to completion. Async: the loser's task is cancelled.
+    """
+
+    def __init__(self, percentile: float = 95, max_ratio: float = 0.1, min_samples: int = 20,
+                 max_backups: int = 16):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(max_ratio)
+        self.wins = 0
+        self._backups = ThreadPoolExecutor(max_workers=max_backups, thread_name_prefix="llm-hedge")
+        self._backup_slots = threading.BoundedSemaphore(max_backups)
+
+    def delay(self) -> Optional[float]:
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def call(self, primary: Callable[[threading.Event], Any], backup: Callable[[threading.Event], Any]) -> Any:
+        """Run `primary(settled)`, racing `backup(settled)` against it once it is slow."""
+        self.budget.record_call()
+        delay = self.delay()
+        settled = threading.Event()
+        started = time.monotonic()
+        if delay is None:
+            result = primary(settled)
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        first: Future = Future()
+        threading.Thread(target=_run, args=(first, primary, settled), name="llm-hedge-primary", daemon=True).start()
+        done, _ = wait([first], timeout=delay)
+        if done or not self._backup_slots.acquire(blocking=False):
+            result = first.result()
+            self.latencies.record(time.monotonic() - started)
+            return result
+        if not self.budget.try_spend():
+            self._backup_slots.release()
+            result = first.result()
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        second = self._backups.submit(backup, settled)
+        second.add_done_callback(lambda _: self._backup_slots.release())
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is second:
+                            self.wins += 1
+                        self.latencies.record(time.monotonic() - started)
+                        return future.result()
+            # Both attempts failed: surface the primary's error
+            return first.result()
+        finally:
+            settled.set()
+            second.cancel()
+
+    async def acall(self, primary: Callable[[], Awaitable[Any]], backup: Callable[[], Awaitable[Any]]) -> Any:
+        self.budget.record_call()
+        delay = self.delay()
+        started = time.monotonic()
+        if delay is None:
+            result = await primary()
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        first = asyncio.ensure_future(primary())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self.budget.try_spend():
+            result = await first
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        second = asyncio.ensure_future(backup())
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.wins += 1
+                        self.latencies.record(time.monotonic() - started)
+                        return task.result()
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
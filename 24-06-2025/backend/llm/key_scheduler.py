@@ -0,0 +1,247 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from llm.retry import CircuitBreaker
+
+logger = logging.getLogger("LLM-Key-Rotation")
+
+
+class TokenBucket:
+    """Classic token bucket that refills lazily whenever it is read."""
+
+    def __init__(self, capacity: float, refill_per_second: float, now: Optional[float] = None):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated = now
+
+    def available(self, now: Optional[float] = None) -> float:
+        self._refill(now if now is not None else time.monotonic())
+        return self.tokens
+
+    def consume(self, amount: float, now: Optional[float] = None) -> bool:
+        """Take `amount` tokens if they are all available."""
+        amount = min(amount, self.capacity)
+        if self.available(now) >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def adjust(self, delta: float):
+        """Correct a previous estimate (negative delta returns tokens)."""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def wait_time(self, amount: float, now: Optional[float] = None) -> float:
+        """Seconds until `amount` tokens will be available."""
+        amount = min(amount, self.capacity)
+        missing = amount - self.available(now)
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return missing / self.refill_per_second
+
+
+class Lease(str):
+    """The key returned by `acquire`; also carries its breaker's probe token, if it is the trial call."""
+    probe: Optional[object] = None
+
+    def __new__(cls, key: str, probe: Optional[object] = None):
+        lease = super().__new__(cls, key)
+        lease.probe = probe
+        return lease
+
+
+@dataclass
+class KeyState:
+    key: str
+    alias: str
+    requests: TokenBucket
+    tokens: TokenBucket
+    in_flight: int = 0
+    successes: int = 0
+    failures: int = 0
+    health: float = 1.0  # EWMA of call outcomes, 1.0 = always succeeds
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+    def headroom(self, now: float) -> float:
+        return min(
+            self.requests.available(now) / self.requests.capacity,
+            self.tokens.available(now) / self.tokens.capacity,
+        )
+
+
+class KeyScheduler:
+    """Health-scored scheduler over a pool of API keys.
+
+    Every key has a requests-per-minute and a tokens-per-minute bucket. A call
+    is placed on the healthy key with the most remaining quota (scaled by its
+    health and current in-flight count). When every key is saturated the caller
+    waits for the earliest refill, up to `max_wait` seconds, instead of failing.
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        requests_per_minute: float = 15,
+        tokens_per_minute: float = 1_000_000,
+        max_wait: float = 30.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._keys: Dict[str, KeyState] = {}
+        now = self._now()
+        for index, key in enumerate(keys, 1):
+            self._keys[key] = KeyState(
+                key=key,
+                alias=f"key{index}",
+                requests=TokenBucket(requests_per_minute, requests_per_minute / 60.0, now),
+                tokens=TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, now),
+            )
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        """Guards every read or update of the key states."""
+        with self._cond:
+            yield
+
+    def _wait(self, seconds: float):
+        """Sleep until a release/failure may have freed a key, at most `seconds`."""
+        with self._cond:
+            self._cond.wait(seconds)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def alias(self, key: str) -> str:
+        state = self._keys.get(key)
+        return state.alias if state else "unknown"
+
+    def _score(self, state: KeyState, now: float) -> float:
+        return state.health * state.headroom(now) / (1 + state.in_flight)
+
+    def _ready(self, state: KeyState, estimated_tokens: float, now: float) -> bool:
+        return (
+            state.breaker.allow(now)
+            and state.requests.available(now) >= 1
+            and state.tokens.available(now) >= min(estimated_tokens, state.tokens.capacity)
+        )
+
+    def _wait_for(self, state: KeyState, estimated_tokens: float, now: float) -> float:
+        return max(
+            state.breaker.remaining(now),
+            state.requests.wait_time(1, now),
+            state.tokens.wait_time(estimated_tokens, now),
+        )
+
+    def pick(self) -> Optional[str]:
+        """Best key right now without reserving any quota."""
+        with self._transaction(write=False):
+            now = self._now()
+            ready = [s for s in self._keys.values() if s.breaker.allow(now)]
+            if not ready:
+                return None
+            return max(ready, key=lambda s: self._score(s, now)).key
+
+    def acquire(self, estimated_tokens: float = 0, timeout: Optional[float] = None,
+                exclude: Optional[Set[str]] = None) -> Optional[str]:
+        """Reserve one request and `estimated_tokens` on the best key.
+
+        Keys in `exclude` are never chosen. Returns None if no key frees up
+        within `timeout` (default `max_wait`). Every successful acquire must
+        be paired with `release`, passing back the returned Lease so that a
+        half-open key's trial call is recognised.
+        """
+        started = time.monotonic()
+        budget = self.max_wait if timeout is None else timeout
+        exclude = exclude or set()
+        while True:
+            with self._transaction():
+                now = self._now()
+                candidates = [s for s in self._keys.values() if s.key not in exclude]
+                if not candidates:
+                    return None
+                ready = [s for s in candidates if self._ready(s, estimated_tokens, now)]
+                if ready:
+                    state = max(ready, key=lambda s: self._score(s, now))
+                    state.requests.consume(1, now)
+                    state.tokens.consume(estimated_tokens, now)
+                    state.in_flight += 1
+                    return Lease(state.key, state.breaker.begin(now))
+                wait = min(self._wait_for(s, estimated_tokens, now) for s in candidates)
+            remaining = budget - (time.monotonic() - started)
+            if remaining <= 0 or wait > remaining:
+                if timeout != 0:
+                    logger.warning("All API keys saturated or cooling down.")
+                return None
+            logger.info(f"All API keys saturated, waiting {wait:.2f}s for quota.")
+            self._wait(wait)
+
+    def release(self, key: str, estimated_tokens: float = 0, tokens_used: Optional[float] = None):
+        """Finish a call; `tokens_used` corrects the token estimate taken at acquire."""
+        with self._transaction():
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            state.breaker.end(getattr(key, "probe", None))
+            if tokens_used is not None:
+                state.tokens.adjust(tokens_used - min(estimated_tokens, state.tokens.capacity))
+            self._cond.notify_all()
+
+    def report_success(self, key: str):
+        with self._transaction():
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.successes += 1
+            state.health = 0.8 * state.health + 0.2
+            state.breaker.record_success()
+
+    def report_failure(self, key: str, cooldown: float = 0.0):
+        """Lower a key's health; a non-zero `cooldown` also opens its circuit breaker.
+
+        Only key-specific failures (quota, auth) should pass a cooldown;
+        transient and server errors just lower the health score.
+        """
+        with self._transaction():
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.failures += 1
+            state.health = max(0.05, state.health * 0.5)
+            if cooldown:
+                state.breaker.trip(cooldown, self._now())
+            self._cond.notify_all()
+
+    def snapshot(self) -> List[Dict]:
+        """Per-key view of quota, load and health (for logging/metrics)."""
+        with self._transaction(write=False):
+            now = self._now()
+            return [
+                {
+                    "alias": s.alias,
+                    "requests_available": round(s.requests.available(now), 2),
+                    "tokens_available": round(s.tokens.available(now)),
+                    "in_flight": s.in_flight,
+                    "health": round(s.health, 3),
+                    "circuit": s.breaker.current(now),
+                    "successes": s.successes,
+                    "failures": s.failures,
+                }
+                for s in self._keys.values()
+            ]
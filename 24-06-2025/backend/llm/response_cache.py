@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+logger = logging.getLogger("LLM-Cache")
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Content address of one LLM call: model + sampling params + rendered prompt."""
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """Persistent LLM response cache shared by every process on the host.
+
+    Entries are keyed by `cache_key`, expire after `ttl_seconds` and are
+    evicted least-recently-used once the table grows past `max_entries`.
+    The database runs in WAL mode so readers in other workers never block
+    on a writer. The file is created on the first lookup or update, not
+    when the cache is constructed.
+    """
+
+    def __init__(self, path: str = "llm_cache.sqlite3", ttl_seconds: float = 86400, max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; each thread keeps its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._ensure_schema()
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _ensure_schema(self):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._open()
+            try:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS llm_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created REAL NOT NULL,
+                        accessed REAL NOT NULL
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    def _count(self, hit: bool):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(False)
+                return None
+            value, created = row
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._count(False)
+                return None
+            conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            generations = [loads(item) for item in _split(value)]
+        except (sqlite3.Error, OSError, ValueError) as e:
+            # A broken cache must never break the LLM call
+            logger.warning(f"LLM cache lookup failed: {e}")
+            self._count(False)
+            return None
+        self._count(True)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        value = _join([dumps(generation) for generation in return_val])
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"LLM cache update failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_seconds,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            # Evict a little extra so we don't run this on every insert
+            overflow += max(1, self.max_entries // 10)
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self, **kwargs) -> None:
+        self._connect().execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, int]:
+        (entries,) = self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        with self._counter_lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+# Generations are stored as one text column; the separator cannot occur in JSON
+_SEPARATOR = "\x1e"
+
+def _join(items) -> str:
+    return _SEPARATOR.join(items)
+
+def _split(value: str):
+    return value.split(_SEPARATOR) if value else []
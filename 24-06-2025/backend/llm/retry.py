@@ -0,0 +1,219 @@
+import random
+import re
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("LLM-Retry")
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # google-api-core ships with google-generativeai
+    google_exceptions = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class ErrorClass:
+    QUOTA = "quota"          # 429 / resource exhausted: this key is out of quota
+    AUTH = "auth"            # 401 / 403 / invalid key: this key is unusable
+    TRANSIENT = "transient"  # timeouts and dropped connections
+    SERVER = "server"        # 5xx from the provider
+    CLIENT = "client"        # bad request, bad prompt, output parsing: retrying won't help
+
+RETRYABLE = {ErrorClass.QUOTA, ErrorClass.AUTH, ErrorClass.TRANSIENT, ErrorClass.SERVER}
+# Errors that mean the key itself is the problem, so only these trip its breaker
+KEY_ERRORS = {ErrorClass.QUOTA, ErrorClass.AUTH}
+
+
+class RetryBudgetExhausted(RuntimeError):
+    """Raised once a call has used up its retry budget; never retried again upstream."""
+
+    def __init__(self, message: str, error_class: str, last_error: Optional[BaseException] = None):
+        super().__init__(message)
+        self.error_class = error_class
+        self.last_error = last_error
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(exc, attr, None)
+        if callable(value):
+            continue
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+# Message fallbacks for wrapped provider errors. Status codes only count as
+# whole words, so "1500 tokens" or a request id containing 503 is no 5xx
+_QUOTA_TEXT = re.compile(r"\b429\b|quota|resource has been exhausted|rate limit")
+_AUTH_TEXT = re.compile(r"\b40[13]\b|api key not valid|api_key_invalid|permission denied|unauthenticated")
+_TRANSIENT_TEXT = re.compile(r"\btimed out\b|\btimeout\b|deadline exceeded|\bconnection (?:reset|refused|aborted)\b")
+_SERVER_TEXT = re.compile(r"\b50[0234]\b|internal error|unavailable")
+
+
+def classify_error(exc: BaseException) -> str:
+    """Map an exception from an LLM call to an ErrorClass."""
+    if isinstance(exc, RetryBudgetExhausted):
+        return ErrorClass.CLIENT
+
+    if google_exceptions is not None:
+        if isinstance(exc, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return ErrorClass.QUOTA
+        if isinstance(exc, (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied)):
+            return ErrorClass.AUTH
+        if isinstance(exc, (google_exceptions.DeadlineExceeded, google_exceptions.RetryError)):
+            return ErrorClass.TRANSIENT
+        if isinstance(exc, google_exceptions.ServerError):
+            return ErrorClass.SERVER
+
+    if httpx is not None and isinstance(exc, httpx.TransportError):
+        # Timeouts, refused and dropped connections: nothing reached the model
+        return ErrorClass.TRANSIENT
+
+    status = _status_code(exc)
+    if status == 429:
+        return ErrorClass.QUOTA
+    if status in (401, 403):
+        return ErrorClass.AUTH
+    if status == 408:
+        return ErrorClass.TRANSIENT
+    if status is not None and status >= 500:
+        return ErrorClass.SERVER
+    if status is not None and 400 <= status < 500:
+        return ErrorClass.CLIENT
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return ErrorClass.TRANSIENT
+
+    # langchain_google_genai re-raises most provider errors as generic
+    # exceptions, so fall back to the message text
+    message = str(exc).lower()
+    if _QUOTA_TEXT.search(message):
+        return ErrorClass.QUOTA
+    if _AUTH_TEXT.search(message):
+        return ErrorClass.AUTH
+    if _TRANSIENT_TEXT.search(message):
+        return ErrorClass.TRANSIENT
+    if _SERVER_TEXT.search(message):
+        return ErrorClass.SERVER
+    if isinstance(exc, OSError):
+        return ErrorClass.TRANSIENT
+    return ErrorClass.CLIENT
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and wall-clock budget."""
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    budget_seconds: float = 60.0
+
+    def backoff(self, attempt: int, error_class: str = ErrorClass.SERVER) -> float:
+        """Delay before retry number `attempt` (0-based)."""
+        if error_class in KEY_ERRORS:
+            # The next attempt goes to a different key; no need to wait long
+            return random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_retry(self, error_class: str, attempt: int, started: float) -> bool:
+        if error_class not in RETRYABLE:
+            return False
+        if attempt + 1 >= self.max_attempts:
+            return False
+        return time.monotonic() - started < self.budget_seconds
+
+
+class CircuitBreaker:
+    """Per-key breaker: closed -> open (cooldown) -> half-open (one trial) -> closed.
+
+    Half-open lets a single call through: `begin` hands it a probe token,
+    and no other call is allowed until its outcome is recorded or `end`
+    is called with that token. Calls that started while closed don't
+    release the trial when they finish. Each consecutive trip doubles the cooldown, up to
+    `max_cooldown`.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, max_cooldown: float = 3600.0, probe_wait: float = 1.0):
+        self.max_cooldown = max_cooldown
+        self.probe_wait = probe_wait  # how long callers wait before re-checking a key under trial
+        self.state = self.CLOSED
+        self.opened_until = 0.0
+        self.trips = 0
+        self.probing: Optional[object] = None  # token of the half-open trial call in flight
+
+    def current(self, now: Optional[float] = None) -> str:
+        """State as of `now`; an open breaker whose cooldown has run out is half-open."""
+        now = time.monotonic() if now is None else now
+        if self.state == self.OPEN and now >= self.opened_until:
+            self.state = self.HALF_OPEN
+        return self.state
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        state = self.current(now)
+        return state == self.CLOSED or (state == self.HALF_OPEN and self.probing is None)
+
+    def begin(self, now: Optional[float] = None) -> Optional[object]:
+        """A call was let through; in half-open it is the one trial.
+
+        Returns a token for the trial call (None for any other call); only
+        `end` with that token lets the next call through.
+        """
+        if self.current(now) == self.HALF_OPEN and self.probing is None:
+            self.probing = object()
+            return self.probing
+        return None
+
+    def end(self, probe: Optional[object] = None):
+        """The call was handed back; a trial with no verdict (client error, cancellation) stops blocking the key."""
+        if probe is not None and probe is self.probing:
+            self.probing = None
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        state = self.current(now)
+        if state == self.HALF_OPEN and self.probing is not None:
+            return self.probe_wait
+        return max(0.0, self.opened_until - now) if state == self.OPEN else 0.0
+
+    def trip(self, cooldown: float, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.trips += 1
+        cooldown = min(self.max_cooldown, cooldown * (2 ** (self.trips - 1)))
+        self.state = self.OPEN
+        self.opened_until = max(self.opened_until, now + cooldown)
+        self.probing = None
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.trips = 0
+        self.opened_until = 0.0
+        self.probing = None
+
+
+def retry_call(fn: Callable[[], Any], policy: Optional[RetryPolicy] = None) -> Any:
+    """Run `fn` under `policy`, retrying only errors that classify as retryable."""
+    policy = policy or RetryPolicy()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            error_class = classify_error(e)
+            if not policy.should_retry(error_class, attempt, started):
+                raise
+            delay = policy.backoff(attempt, error_class)
+            logger.warning(f"[Attempt {attempt + 1}] {error_class} error during LLM call: {e}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,107 @@
+import threading
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("LLM-Router")
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """One model offering with its typical latency and per-key quota."""
+    name: str
+    model: str
+    typical_latency: float  # seconds for a typical agent call
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+@dataclass(frozen=True)
+class TaskPolicy:
+    """How one task class is served: tiers in order of preference, sampling settings."""
+    tiers: Tuple[str, ...]
+    temperature: float
+    max_output_tokens: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Route:
+    task: str
+    latency_budget: Optional[float]
+    tier: ModelTier
+    temperature: float
+    max_output_tokens: Optional[int]
+    fallbacks: Tuple[ModelTier, ...]
+    reason: str
+
+    def describe(self) -> str:
+        budget = "none" if self.latency_budget is None else f"{self.latency_budget:g}s"
+        fallbacks = ", ".join(t.name for t in self.fallbacks) or "none"
+        return (f"task={self.task} budget={budget} -> {self.tier.name} ({self.tier.model}, "
+                f"temperature={self.temperature:g}, max_output_tokens={self.max_output_tokens}) "
+                f"fallbacks=[{fallbacks}]: {self.reason}")
+
+
+class ModelRouter:
+    """Picks a model tier and sampling settings per call from a policy table.
+
+    Call sites name a task class and, optionally, a latency budget in
+    seconds. The first tier in the task's preference list whose typical
+    latency fits the budget wins. The remaining tiers become quota
+    fallbacks: tiers that fit come first, then slower ones, since a late
+    answer beats no answer. If nothing fits, the fastest tier is used.
+    Unknown task classes get `default_task`'s policy.
+    """
+
+    def __init__(self, tiers: Dict[str, ModelTier], policies: Dict[str, TaskPolicy], default_task: str = "general"):
+        for task, policy in policies.items():
+            unknown = [name for name in policy.tiers if name not in tiers]
+            if unknown or not policy.tiers:
+                raise ValueError(f"Policy for {task!r} names unknown tiers: {unknown or 'none given'}")
+        if default_task not in policies:
+            raise ValueError(f"No policy for the default task {default_task!r}")
+        self.tiers = tiers
+        self.policies = policies
+        self.default_task = default_task
+        self._lock = threading.Lock()
+        self.decisions: Counter = Counter()
+        self.fallbacks: Counter = Counter()
+
+    def route(self, task: str, latency_budget: Optional[float] = None) -> Route:
+        policy = self.policies.get(task)
+        if policy is None:
+            logger.warning(f"No routing policy for task {task!r}; using {self.default_task!r}")
+            policy = self.policies[self.default_task]
+        candidates = [self.tiers[name] for name in policy.tiers]
+        fitting = [t for t in candidates if latency_budget is None or t.typical_latency <= latency_budget]
+        if fitting:
+            tier = fitting[0]
+            reason = "preferred tier" if tier is candidates[0] else "first preferred tier within budget"
+        else:
+            tier = min(candidates, key=lambda t: t.typical_latency)
+            reason = "no tier fits the budget; using the fastest"
+        slower = sorted((t for t in candidates if t not in fitting), key=lambda t: t.typical_latency)
+        fallbacks = tuple(t for t in fitting + slower if t is not tier)
+        route = Route(task, latency_budget, tier, policy.temperature, policy.max_output_tokens, fallbacks, reason)
+        with self._lock:
+            self.decisions[(task, tier.name)] += 1
+        logger.info(f"Route {route.describe()}")
+        return route
+
+    def tier_for_model(self, model: str) -> Optional[ModelTier]:
+        return next((t for t in self.tiers.values() if t.model == model), None)
+
+    def record_fallback(self, from_model: str, to_model: str, error: BaseException):
+        with self._lock:
+            self.fallbacks[(from_model, to_model)] += 1
+        logger.warning(f"Quota exhausted on {from_model} ({error}); falling back to {to_model}")
+
+    def stats(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(metric name, labels, value) samples for Telemetry.add_gauges."""
+        with self._lock:
+            samples = [("llm_route_decisions", {"task": task, "tier": tier}, count)
+                       for (task, tier), count in sorted(self.decisions.items())]
+            samples += [("llm_route_fallbacks", {"from": src, "to": dst}, count)
+                        for (src, dst), count in sorted(self.fallbacks.items())]
+        return samples
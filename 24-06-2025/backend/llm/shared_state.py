@@ -0,0 +1,132 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import List
+
+from llm.key_scheduler import KeyScheduler
+
+logger = logging.getLogger("LLM-Key-Rotation")
+
+
+def key_id(key: str) -> str:
+    """Stable id for an API key; the key itself never touches the disk."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+class SharedKeyScheduler(KeyScheduler):
+    """KeyScheduler whose quota, health and breaker state live in an SQLite file.
+
+    Every worker process on the host opens the same file, so they draw from
+    one RPM/TPM budget and see each other's open circuits. Updates run in
+    short `BEGIN IMMEDIATE` transactions: load the rows, apply the usual
+    scheduling logic, write them back. In WAL mode readers (`pick`,
+    `snapshot`) never wait on a writer. Timestamps are wall-clock so they
+    mean the same thing in every process. In-flight counts stay per process,
+    so a crashed worker cannot leak them.
+
+    Waiting for quota polls the file every `poll_interval` seconds, because
+    a release in another process cannot wake this one. Schedulers with
+    different `scope`s (e.g. one per model, whose quotas are separate) keep
+    separate rows in the same file.
+    """
+
+    def __init__(self, keys: List[str], path: str = "key_state.sqlite3", poll_interval: float = 0.25,
+                 scope: str = "", **kwargs):
+        self.path = path
+        self.scope = scope
+        self.poll_interval = poll_interval
+        self._conn_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS key_state (
+                key_id TEXT PRIMARY KEY,
+                alias TEXT NOT NULL,
+                requests REAL NOT NULL,
+                requests_updated REAL NOT NULL,
+                tokens REAL NOT NULL,
+                tokens_updated REAL NOT NULL,
+                successes INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                health REAL NOT NULL DEFAULT 1.0,
+                circuit TEXT NOT NULL DEFAULT 'closed',
+                opened_until REAL NOT NULL DEFAULT 0,
+                trips INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        super().__init__(keys, **kwargs)
+        self._ids = {key: key_id(f"{scope}|{key}" if scope else key) for key in self._keys}
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, state in self._keys.items():
+                    # First worker to start creates the rows; later ones adopt them
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO key_state (key_id, alias, requests, requests_updated, tokens, tokens_updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (self._ids[key], state.alias, state.requests.tokens, state.requests.updated,
+                         state.tokens.tokens, state.tokens.updated),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _now(self) -> float:
+        return time.time()
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        with self._cond, self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                self._load()
+                yield
+                if write:
+                    self._save()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT key_id, requests, requests_updated, tokens, tokens_updated, successes, failures, "
+            "health, circuit, opened_until, trips FROM key_state"
+        ).fetchall()
+        by_id = {row[0]: row[1:] for row in rows}
+        for key, state in self._keys.items():
+            row = by_id.get(self._ids[key])
+            if row is None:
+                continue
+            (state.requests.tokens, state.requests.updated, state.tokens.tokens, state.tokens.updated,
+             state.successes, state.failures, state.health, state.breaker.state,
+             state.breaker.opened_until, state.breaker.trips) = row
+
+    def _save(self):
+        self._conn.executemany(
+            "UPDATE key_state SET requests = ?, requests_updated = ?, tokens = ?, tokens_updated = ?, "
+            "successes = ?, failures = ?, health = ?, circuit = ?, opened_until = ?, trips = ? WHERE key_id = ?",
+            [
+                (s.requests.tokens, s.requests.updated, s.tokens.tokens, s.tokens.updated,
+                 s.successes, s.failures, s.health, s.breaker.state,
+                 s.breaker.opened_until, s.breaker.trips, self._ids[key])
+                for key, s in self._keys.items()
+            ],
+        )
+
+    def _wait(self, seconds: float):
+        with self._cond:
+            self._cond.wait(min(seconds, self.poll_interval))
+
+    def close(self):
+        with self._conn_lock:
+            self._conn.close()
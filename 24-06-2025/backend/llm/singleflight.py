@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Abandoned(Exception):
+    """Set on a shared call whose leader was cancelled or interrupted before it finished."""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key (the leader) runs the call; everyone who
+    arrives while it is running waits for the same result or exception.
+    If the leader is cancelled (or interrupted) instead, that is not the
+    call's outcome: its followers join again, and one of them takes over.
+    Threaded callers (`do`) and asyncio callers (`ado`) share one table, so
+    a coroutine can join a call a worker thread started and vice versa.
+    Nothing is remembered once the call finishes: that is the cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _join(self, key: str):
+        """Return (future, is_leader) for `key`."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def _fail(self, key: str, future: Future, error: BaseException):
+        self._finish(key, future)
+        # Only a real error is shared; cancellation is the leader's own business
+        future.set_exception(error if isinstance(error, Exception) else _Abandoned())
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _Abandoned:
+                continue
+        try:
+            result = fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._finish(key, future)
+        future.set_result(result)
+        return result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # shield: a cancelled follower must not cancel the shared call
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _Abandoned:
+                continue
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._finish(key, future)
+        future.set_result(result)
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,165 @@
+import json
+import re
+import logging
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger("LLM-Structured")
+
+T = TypeVar("T", bound=BaseModel)
+
+_GEMINI_TYPES = {
+    "object": "OBJECT",
+    "array": "ARRAY",
+    "string": "STRING",
+    "integer": "INTEGER",
+    "number": "NUMBER",
+    "boolean": "BOOLEAN",
+}
+
+
+class StructuredOutputError(ValueError):
+    """The model's reply could not be parsed or validated, even after local repair."""
+
+    def __init__(self, message: str, text: str):
+        super().__init__(message)
+        self.text = text
+
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Gemini `response_schema` for a pydantic model.
+
+    Gemini takes an OpenAPI subset: no $ref, no titles or defaults, enums
+    only on strings. References are inlined and unsupported keywords dropped.
+    """
+    schema = model.model_json_schema()
+    return _convert(schema, schema.get("$defs", {}))
+
+
+def _convert(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        return _convert(defs[node["$ref"].split("/")[-1]], defs)
+    if "anyOf" in node:
+        # Optional[X] arrives as anyOf [X, null]
+        options = [o for o in node["anyOf"] if o.get("type") != "null"]
+        converted = _convert(options[0], defs) if options else {"type_": "STRING"}
+        if len(options) < len(node["anyOf"]):
+            converted["nullable"] = True
+        return converted
+    if "enum" in node or "const" in node:
+        values = node.get("enum") or [node["const"]]
+        return {"type_": "STRING", "enum": [str(v) for v in values]}
+    out: Dict[str, Any] = {"type_": _GEMINI_TYPES.get(node.get("type", "string"), "STRING")}
+    if node.get("description"):
+        out["description"] = node["description"]
+    if out["type_"] == "OBJECT":
+        out["properties"] = {name: _convert(prop, defs) for name, prop in node.get("properties", {}).items()}
+        if node.get("required"):
+            out["required"] = list(node["required"])
+    elif out["type_"] == "ARRAY":
+        out["items"] = _convert(node.get("items", {}), defs)
+    return out
+
+
+_PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_SMART_QUOTES = "\u201c\u201d"
+
+
+def repair_json(text: str) -> str:
+    """Cheap fixes for the usual ways LLM JSON goes wrong.
+
+    Strips markdown fences and surrounding prose, and outside string values
+    turns smart quotes into plain ones, Python literals (None/True/False)
+    into JSON ones and drops trailing commas. String contents are never
+    touched. A truncated reply (ending inside a string or with brackets
+    open) raises StructuredOutputError instead: closing it would pass a
+    cut-off value off as a whole one. The result is not guaranteed to parse.
+    """
+    text = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", text.strip())
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start > 0:
+        text = text[start:]
+
+    out = []
+    closers = []
+    quote = None  # closing character(s) of the string we are in
+    escaped = False
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char in quote:
+                quote = None
+                char = '"'
+            elif char == '"':
+                # A plain quote inside a string opened with a smart one
+                char = '\\"'
+            elif char == "\n":
+                # Raw newlines are invalid inside JSON strings
+                char = "\\n"
+            out.append(char)
+            index += 1
+            continue
+        if char == '"' or char in _SMART_QUOTES:
+            quote = '"' if char == '"' else _SMART_QUOTES
+            char = '"'
+        elif char.isalpha():
+            word = re.match(r"[A-Za-z_]\w*", text[index:])
+            if word:
+                out.append(_PYTHON_LITERALS.get(word.group(), word.group()))
+                index += len(word.group())
+                continue
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not closers:
+                break
+            closers.pop()
+            # Trailing comma before the closer
+            end = len(out)
+            while end and out[end - 1].isspace():
+                end -= 1
+            if end and out[end - 1] == ",":
+                del out[end - 1]
+            out.append(char)
+            if not closers:
+                # Anything after the top-level value is prose
+                break
+            index += 1
+            continue
+        out.append(char)
+        index += 1
+    if quote or closers:
+        raise StructuredOutputError("Reply is truncated: it ends inside a string or with brackets open", text)
+    return "".join(out)
+
+
+def parse_model(text: str, model: Type[T], finish_reason: Optional[str] = None) -> T:
+    """Parse `text` into `model`, running `repair_json` if the raw text fails.
+
+    A reply that stopped at the token limit is invalid whatever it looks
+    like; pass the response's `finish_reason` so it is rejected up front.
+    """
+    if finish_reason == "MAX_TOKENS":
+        raise StructuredOutputError(f"Reply was cut off at the token limit; it is not a complete {model.__name__}", text)
+    try:
+        return model.model_validate(json.loads(text))
+    except (json.JSONDecodeError, ValidationError) as e:
+        first_error = e
+    repaired = repair_json(text)
+    try:
+        return model.model_validate(json.loads(repaired))
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise StructuredOutputError(f"Reply does not match {model.__name__}: {e}", text) from first_error
+
+
+def reask_prompt(error: Exception, model: Optional[Type[BaseModel]] = None) -> str:
+    """Follow-up message asking the model to correct an invalid reply."""
+    schema = f"\nThe JSON schema is:\n{json.dumps(model.model_json_schema())}" if model else ""
+    return (f"Your previous reply was not valid: {error}\n"
+            f"Reply again with only the corrected JSON, no other text.{schema}")
@@ -0,0 +1,199 @@
+import bisect
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+
+logger = logging.getLogger("LLM-Telemetry")
+
+# Bucket upper bounds; the last (+Inf) bucket is implicit
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 8)
+
+
+@dataclass
+class CallRecord:
+    """One logical LLM call as seen by the key pool (or served from cache)."""
+    model: str
+    key_alias: str
+    prompt_tokens: int
+    output_tokens: int
+    latency: float
+    retries: int = 0
+    cache_hit: bool = False
+    outcome: str = "ok"  # "ok" or the ErrorClass of the final failure
+    hedge: bool = False
+    cached_tokens: int = 0  # prompt tokens served from a provider context cache
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        rows = []
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            rows.append(("+Inf" if bound == float("inf") else _number(bound), total))
+        return rows
+
+
+class Telemetry:
+    """Aggregates CallRecords into counters and histograms.
+
+    Series are labelled by model and key alias (cache hits use the alias
+    "cache"). The last `recent` records are kept verbatim for debugging.
+    Gauge providers registered with `add_gauges` are sampled on render, so
+    values such as key health are always current.
+    """
+
+    def __init__(self, recent: int = 200):
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str, str], int] = {}
+        self._sources: Dict[Tuple[str, str], int] = {}
+        self._tokens: Dict[Tuple[str, str, str], int] = {}
+        self._histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self._recent: List[CallRecord] = []
+        self._recent_max = recent
+        self._gauges: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+    def record(self, call: CallRecord):
+        labels = (call.model, call.key_alias)
+        with self._lock:
+            outcome_key = labels + (call.outcome,)
+            self._calls[outcome_key] = self._calls.get(outcome_key, 0) + 1
+            source = (call.model, "cache" if call.cache_hit else "api")
+            self._sources[source] = self._sources.get(source, 0) + 1
+            for kind, count in (("prompt", call.prompt_tokens), ("output", call.output_tokens)):
+                self._tokens[labels + (kind,)] = self._tokens.get(labels + (kind,), 0) + count
+                self._histogram(f"llm_{kind}_tokens", labels, TOKEN_BUCKETS).observe(count)
+            if call.cached_tokens:
+                self._tokens[labels + ("cached",)] = self._tokens.get(labels + ("cached",), 0) + call.cached_tokens
+            self._histogram("llm_call_latency_seconds", labels, LATENCY_BUCKETS).observe(call.latency)
+            self._histogram("llm_call_retries", labels, RETRY_BUCKETS).observe(call.retries)
+            self._recent.append(call)
+            del self._recent[:-self._recent_max]
+        logger.debug(f"LLM call {asdict(call)}")
+
+    def _histogram(self, name: str, labels: Tuple[str, str], buckets: Sequence[float]) -> Histogram:
+        key = (name,) + labels
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            self._histograms[key] = histogram
+        return histogram
+
+    def add_gauges(self, provider: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """Register a callable yielding (metric name, labels, value) tuples."""
+        self._gauges.append(provider)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [asdict(call) for call in self._recent]
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._sources.clear()
+            self._tokens.clear()
+            self._histograms.clear()
+            self._recent.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            lines.append("# TYPE llm_calls_total counter")
+            for (model, alias, outcome), count in sorted(self._calls.items()):
+                lines.append(f"llm_calls_total{_labels(model=model, key=alias, outcome=outcome)} {count}")
+            lines.append("# TYPE llm_responses_total counter")
+            for (model, source), count in sorted(self._sources.items()):
+                lines.append(f"llm_responses_total{_labels(model=model, source=source)} {count}")
+            lines.append("# TYPE llm_tokens_total counter")
+            for (model, alias, kind), count in sorted(self._tokens.items()):
+                lines.append(f"llm_tokens_total{_labels(model=model, key=alias, kind=kind)} {count}")
+            declared = set()
+            for (name, model, alias), histogram in sorted(self._histograms.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {name} histogram")
+                    declared.add(name)
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{name}_bucket{_labels(model=model, key=alias, le=bound)} {count}")
+                lines.append(f"{name}_sum{_labels(model=model, key=alias)} {_number(histogram.sum)}")
+                lines.append(f"{name}_count{_labels(model=model, key=alias)} {histogram.count}")
+        declared = set()
+        for provider in self._gauges:
+            try:
+                samples = list(provider())
+            except Exception as e:
+                logger.warning(f"Gauge provider failed: {e}")
+                continue
+            for name, labels, value in samples:
+                if name not in declared:
+                    lines.append(f"# TYPE {name} gauge")
+                    declared.add(name)
+                lines.append(f"{name}{_labels(**labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MeteredCache(BaseCache):
+    """Wraps an LLM cache and records every hit as a zero-retry CallRecord.
+
+    LangChain answers cache hits before the model's `_generate` runs, so
+    this is the only place they can be counted. Misses are not recorded
+    here; the call that follows records itself.
+    """
+
+    def __init__(self, cache: BaseCache, telemetry: Telemetry, model: str,
+                 count_tokens: Callable[[str], int]):
+        self.cache = cache
+        self.telemetry = telemetry
+        self.model = model
+        self.count_tokens = count_tokens
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        started = time.monotonic()
+        value = self.cache.lookup(prompt, llm_string)
+        if value is not None:
+            self.telemetry.record(CallRecord(
+                model=self.model,
+                key_alias="cache",
+                prompt_tokens=self.count_tokens(prompt),
+                output_tokens=sum(self.count_tokens(g.text) for g in value),
+                latency=time.monotonic() - started,
+                cache_hit=True,
+            ))
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.cache.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear(**kwargs)
+
+
+def _labels(**labels: Any) -> str:
+    parts = []
+    for name, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
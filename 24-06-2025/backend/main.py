@@ -1,9 +1,11 @@
 from dotenv import load_dotenv
 from agents import run_bug_fixer
+import logging
 import os
 from pprint import pprint
 
 load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
 def main():
     # Example input data
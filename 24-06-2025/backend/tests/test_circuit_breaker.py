@@ -0,0 +1,71 @@
+import httpx
+import pytest
+
+from llm.key_scheduler import KeyScheduler
+from llm.retry import CircuitBreaker, ErrorClass, classify_error
+
+
+def half_open_scheduler():
+    scheduler = KeyScheduler(["a"], requests_per_minute=100)
+    scheduler._keys["a"].breaker.trip(10, now=scheduler._now() - 60)
+    return scheduler
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker()
+    breaker.trip(10, now=0)
+    assert breaker.allow(5) is False
+    probe = breaker.begin(11)
+    assert probe is not None
+    assert breaker.allow(11) is False and breaker.begin(11) is None
+    breaker.end(probe)
+    assert breaker.allow(11)
+
+
+def test_release_of_a_call_started_while_closed_keeps_the_trial_exclusive():
+    scheduler = KeyScheduler(["a"], requests_per_minute=100)
+    closed_call = scheduler.acquire(timeout=0)
+    assert closed_call.probe is None
+    scheduler.report_failure("a", cooldown=10)
+    scheduler._keys["a"].breaker.opened_until = scheduler._now() - 1  # cooldown over: half-open
+
+    probe = scheduler.acquire(timeout=0)
+    assert probe == "a" and probe.probe is not None
+    scheduler.release(closed_call)
+    assert scheduler.acquire(timeout=0) is None
+    scheduler.release(probe)
+    assert scheduler.acquire(timeout=0) == "a"
+
+
+def test_stale_probe_does_not_release_a_later_trial():
+    scheduler = half_open_scheduler()
+    first = scheduler.acquire(timeout=0)
+    scheduler.report_failure("a", cooldown=10)  # the trial failed: open again
+    scheduler._keys["a"].breaker.opened_until = scheduler._now() - 1
+    second = scheduler.acquire(timeout=0)
+    assert second.probe is not None
+    scheduler.release(first)
+    assert scheduler.acquire(timeout=0) is None
+
+
+class StatusError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("error, expected", [
+    (StatusError("slow down", 429), ErrorClass.QUOTA),
+    (StatusError("bad key", 403), ErrorClass.AUTH),
+    (StatusError("upstream", 503), ErrorClass.SERVER),
+    (StatusError("bad request: 503 in the prompt", 400), ErrorClass.CLIENT),
+    (httpx.ConnectError("refused"), ErrorClass.TRANSIENT),
+    (TimeoutError(), ErrorClass.TRANSIENT),
+    (ValueError("503 Service Unavailable"), ErrorClass.SERVER),
+    (ValueError("Resource has been exhausted (e.g. check quota)."), ErrorClass.QUOTA),
+    (ValueError("API key not valid. Please pass a valid API key."), ErrorClass.AUTH),
+    (ValueError("Output parser failed on request 15032 after 1500 tokens"), ErrorClass.CLIENT),
+    (ValueError("Invalid connection string in the generated config"), ErrorClass.CLIENT),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
@@ -0,0 +1,55 @@
+from agents.fix_templates import registry
+from analysis import document_for
+
+HTML = """<html><body>
+<div style="position: absolute; top: 0">first</div>
+<p>text</p>
+<div style="position: absolute; left: 0">second</div>
+<img src="#" alt="">
+<img src="#">
+</body></html>"""
+
+
+def issues_for(html):
+    """Issues as the validators report them: one per element, at its source line."""
+    doc = document_for({"html": html})
+    issues = []
+    for div in doc.by_tag("div"):
+        issues.append({"type": "positioning", "element": "div", "location": str(doc.line(div))})
+    for img in doc.by_tag("img"):
+        issues.append({"type": "missing_image", "location": str(doc.line(img)), "content": str(img)})
+    return issues
+
+
+def test_elements_carry_their_source_line():
+    doc = document_for({"html": HTML})
+    assert [doc.line(div) for div in doc.by_tag("div")] == [2, 4]
+    assert [doc.line(img) for img in doc.by_tag("img")] == [5, 6]
+
+
+def test_repeated_issues_each_get_their_own_span():
+    fixes, left = registry.split(issues_for(HTML), {"html": HTML})
+    assert left == []
+    assert sorted(fix["span"]["line"] for fix in fixes) == [2, 4, 5, 6]
+    assert len({(fix["span"]["start"], fix["span"]["end"]) for fix in fixes}) == 4
+
+
+def test_elements_sharing_a_line_go_to_the_llm():
+    html = '<div style="position: absolute">a</div><div style="position: absolute">b</div>'
+    issues = issues_for(html)
+    fixes, left = registry.split(issues, {"html": html})
+    assert fixes == [] and left == issues
+
+
+def test_issue_without_a_line_goes_to_the_llm():
+    issue = {"type": "missing_image", "location": "None"}
+    fixes, left = registry.split([issue], {"html": HTML})
+    assert fixes == [] and left == [issue]
+
+
+def test_second_issue_on_a_taken_span_is_not_dropped():
+    html = "<p>lorem ipsum dolor</p>"
+    first = {"type": "placeholder", "location": "1", "content": "lorem ipsum dolor"}
+    second = dict(first, description="reported again by another check")
+    fixes, left = registry.split([first, second], {"html": html})
+    assert len(fixes) == 1 and left == [second]
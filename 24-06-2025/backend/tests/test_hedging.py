@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from llm.hedging import Hedger
+
+
+def hedger(delay=0.05, max_backups=16, max_ratio=1.0):
+    hedge = Hedger(percentile=50, max_ratio=max_ratio, min_samples=1, max_backups=max_backups)
+    hedge.budget._credit = hedge.budget._burst = 100.0
+    hedge.latencies.record(delay)
+    return hedge
+
+
+def test_primaries_are_not_capped_by_the_backup_pool():
+    hedge = hedger(delay=5, max_backups=2)
+    calls = 24
+    barrier = threading.Barrier(calls, timeout=5)
+
+    def primary(settled):
+        # Only returns once every call's primary is running at the same time
+        barrier.wait()
+        return "primary"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(hedge.call(primary, lambda s: "backup")))
+               for _ in range(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results == ["primary"] * calls
+    assert hedge.budget.hedges == 0
+
+
+def test_backup_wins_and_the_loser_is_told():
+    hedge = hedger(delay=0.05)
+    saw_settled = threading.Event()
+
+    def primary(settled):
+        if settled.wait(2):
+            saw_settled.set()
+        return "primary"
+
+    assert hedge.call(primary, lambda settled: "backup") == "backup"
+    assert hedge.wins == 1
+    assert saw_settled.wait(2)
+
+
+def test_no_hedge_when_every_backup_worker_is_busy():
+    hedge = hedger(delay=0.01, max_backups=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_backup(settled):
+        started.set()
+        release.wait(5)
+        return "backup"
+
+    first = threading.Thread(target=lambda: hedge.call(lambda s: release.wait(5) and "primary", slow_backup))
+    first.start()
+    assert started.wait(2)
+    # The only backup worker is taken: this call runs unhedged
+    assert hedge.call(lambda s: time.sleep(0.05) or "primary", slow_backup) == "primary"
+    assert hedge.budget.hedges == 1
+    release.set()
+    first.join(5)
+
+
+def test_both_failing_raises_the_primary_error():
+    hedge = hedger(delay=0.01)
+
+    def primary(settled):
+        time.sleep(0.05)
+        raise ValueError("primary")
+
+    def backup(settled):
+        raise KeyError("backup")
+
+    with pytest.raises(ValueError):
+        hedge.call(primary, backup)
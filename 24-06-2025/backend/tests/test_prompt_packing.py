@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+from llm import prompt_packing
+
+DAY9_COPY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "day9", "prompt_packing.py")
+
+
+@pytest.mark.skipif(not os.path.exists(DAY9_COPY), reason="day9 is not checked out next to this project")
+def test_day9_copy_matches():
+    with open(prompt_packing.__file__, encoding="utf-8") as ours, open(DAY9_COPY, encoding="utf-8") as theirs:
+        assert theirs.read() == ours.read(), "day9/prompt_packing.py has drifted; copy the backend module over it"
@@ -0,0 +1,15 @@
+import os
+
+from langchain_core.outputs import Generation
+
+from llm.response_cache import SQLiteLLMCache
+
+
+def test_cache_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "state" / "llm_cache.sqlite3"
+    cache = SQLiteLLMCache(str(path))
+    assert not os.path.exists(path.parent)
+    assert cache.lookup("prompt", "model") is None
+    assert path.exists()
+    cache.update("prompt", "model", [Generation(text="answer")])
+    assert [g.text for g in cache.lookup("prompt", "model")] == ["answer"]
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import pytest
+
+from llm.singleflight import SingleFlight
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1 and flight.in_flight() == 0
+
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("k", fetch))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.ado("k", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == ["result"] * 3
+    assert len(calls) == 2
+
+
+def test_cancelled_follower_leaves_the_shared_call_running():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("k", fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.ado("k", fetch))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_thread_follower_takes_over_from_a_cancelled_async_leader():
+    flight = SingleFlight()
+    leading = threading.Event()
+    results = []
+
+    async def main():
+        async def fetch():
+            leading.set()
+            await asyncio.sleep(1)
+
+        leader = asyncio.create_task(flight.ado("k", fetch))
+        await asyncio.to_thread(leading.wait, 2)
+        follower = threading.Thread(target=lambda: results.append(flight.do("k", lambda: "from thread")))
+        follower.start()
+        while flight.followers == 0:
+            await asyncio.sleep(0.005)
+        leader.cancel()
+        await asyncio.to_thread(follower.join, 2)
+
+    asyncio.run(main())
+    assert results == ["from thread"]
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.02)
+        raise ValueError("bad")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(e, ValueError) for e in asyncio.run(main()))
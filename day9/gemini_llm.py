@@ -1,28 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.language_models import BaseLLM
-from langchain_core.outputs import LLMResult
-from typing import Optional, List, Any, Mapping
+from langchain_core.outputs import GenerationChunk, LLMResult
+from typing import Optional, List, Any, Iterator, Mapping
 from pydantic import Field, BaseModel
 import google.generativeai as genai
+import asyncio
+import os
+
+# Gemini accepts at most this many stop sequences per request
+MAX_STOP_SEQUENCES = 5
+
+# Optional REST endpoint override, e.g. the local Gemini stand-in used for
+# offline load tests (24-06-2025/backend/gemini_standin.py)
+API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 
 class GeminiLLM(BaseLLM, BaseModel):
     model_name: str = Field(default="gemini-1.5-flash")
     api_key: str = Field(...)
+    # Prompts of one batch sent to Gemini at the same time
+    max_concurrency: int = Field(default=4)
     
     def __init__(self, api_key: str, model: str = "gemini-1.5-flash"):
         super().__init__(api_key=api_key, model_name=model)
-        genai.configure(api_key=api_key)
+        if API_ENDPOINT:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": API_ENDPOINT})
+        else:
+            genai.configure(api_key=api_key)
         self._model = genai.GenerativeModel(model)
 
-    def invoke(self, prompt: str, **kwargs: Any) -> str:
+    def invoke(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
         """Direct invocation method for simple string inputs"""
         try:
-            response = self._model.generate_content(prompt)
-            if hasattr(response, 'text'):
-                return response.text.strip()
-            return str(response)
+            return self._complete(prompt, stop)
         except Exception as e:
             return f"Error generating response: {str(e)}"
 
+    def _complete(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        response = self._model.generate_content(prompt, generation_config=_generation_config(stop))
+        if hasattr(response, 'text'):
+            # Gemini takes only MAX_STOP_SEQUENCES; cut at any others here
+            return _cut_at_stop(response.text, stop).strip()
+        return str(response)
+
+    def _batch_entry(self, prompt: str, stop: Optional[List[str]]) -> dict:
+        """One prompt of a batch; its failure is reported on it alone"""
+        try:
+            return {"text": self._complete(prompt, stop), "generation_info": {}}
+        except Exception as e:
+            return {"text": f"Error generating response: {str(e)}", "generation_info": {"error": str(e)}}
+
     @property
     def _llm_type(self) -> str:
         return "gemini"
@@ -34,9 +60,80 @@ class GeminiLLM(BaseLLM, BaseModel):
         run_manager: Optional[Any] = None,
         **kwargs: Any,
     ) -> LLMResult:
-        """Generate method required by LangChain"""
-        generations = []
-        for prompt in prompts:
-            response = self.invoke(prompt, **kwargs)
-            generations.append([{"text": response, "generation_info": {}}])
-        return LLMResult(generations=generations)
+        """Generate method required by LangChain; a batch runs max_concurrency prompts at a time"""
+        if len(prompts) == 1:
+            entries = [self._batch_entry(prompts[0], stop)]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(prompts)))) as pool:
+                # map keeps results in prompt order
+                entries = list(pool.map(lambda prompt: self._batch_entry(prompt, stop), prompts))
+        return LLMResult(generations=[[entry] for entry in entries])
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        """Async batch generation with the same concurrency bound"""
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def entry(prompt: str) -> dict:
+            async with semaphore:
+                # The Gemini client is blocking here, so each call runs in a worker thread
+                return await asyncio.to_thread(self._batch_entry, prompt, stop)
+
+        entries = await asyncio.gather(*(entry(prompt) for prompt in prompts))
+        return LLMResult(generations=[[e] for e in entries])
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream the response, closing it as soon as a stop sequence shows up"""
+        response = self._model.generate_content(prompt, generation_config=_generation_config(stop), stream=True)
+        # Hold back enough text to see a stop sequence split across chunks
+        holdback = max((len(s) for s in stop or []), default=1) - 1
+        pending = ""
+        for chunk in response:
+            try:
+                pending += chunk.text
+            except ValueError:
+                # Chunk without text (e.g. only a finish reason)
+                continue
+            cut = _cut_at_stop(pending, stop)
+            if len(cut) < len(pending):
+                # Stop sequence reached: emit what precedes it and hang up
+                yield self._emit(cut, run_manager)
+                return
+            ready, pending = pending[:len(pending) - holdback], pending[len(pending) - holdback:]
+            if ready:
+                yield self._emit(ready, run_manager)
+        if pending:
+            yield self._emit(pending, run_manager)
+
+    def _emit(self, text: str, run_manager: Optional[Any]) -> GenerationChunk:
+        chunk = GenerationChunk(text=text)
+        if run_manager:
+            run_manager.on_llm_new_token(text, chunk=chunk)
+        return chunk
+
+
+def _generation_config(stop: Optional[List[str]]) -> Optional[genai.GenerationConfig]:
+    if not stop:
+        return None
+    return genai.GenerationConfig(stop_sequences=list(stop)[:MAX_STOP_SEQUENCES])
+
+
+def _cut_at_stop(text: str, stop: Optional[List[str]]) -> str:
+    """Text up to the first stop sequence, if any"""
+    cut = len(text)
+    for sequence in stop or []:
+        index = text.find(sequence)
+        if index != -1:
+            cut = min(cut, index)
+    return text[:cut]
@@ -0,0 +1,264 @@
+# Shared by 24-06-2025/backend/llm/prompt_packing.py and day9/prompt_packing.py,
+# which keeps a copy because every day folder installs and runs on its own.
+# Edit both together: backend/tests/test_prompt_packing.py fails when they differ.
+import os
+import re
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Container, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("LLM-Prompt")
+
+# Token budget for one prompt, template included
+DEFAULT_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "8000"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Section:
+    """One variable part of a prompt.
+
+    Lower `priority` sections are shortened first. `anchors` are 1-based
+    line numbers worth keeping (issue locations); the section is windowed
+    around them before anything else. `summarize` turns the text into a
+    shorter outline. `required` sections are shortened but never dropped.
+    """
+    name: str
+    text: str
+    priority: int = 0
+    anchors: Sequence[int] = ()
+    summarize: Optional[Callable[[str], str]] = None
+    required: bool = False
+
+
+@dataclass
+class SectionReport:
+    name: str
+    original_tokens: int
+    tokens: int
+    action: str = "kept"  # kept, windowed, summarized, truncated or dropped
+
+
+@dataclass
+class PackResult:
+    sections: Dict[str, str]
+    reports: List[SectionReport]
+    budget: int
+    reserved: int = 0
+
+    @property
+    def original_tokens(self) -> int:
+        return self.reserved + sum(r.original_tokens for r in self.reports)
+
+    @property
+    def tokens(self) -> int:
+        return self.reserved + sum(r.tokens for r in self.reports)
+
+    @property
+    def trimmed_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+    @property
+    def trimmed(self) -> bool:
+        return any(r.action != "kept" for r in self.reports)
+
+    def summary(self) -> str:
+        changed = ", ".join(
+            f"{r.name} {r.action} {r.original_tokens}->{r.tokens}" for r in self.reports if r.action != "kept"
+        )
+        return f"{self.original_tokens} -> {self.tokens} tokens (budget {self.budget}): {changed or 'nothing trimmed'}"
+
+
+class PromptPacker:
+    """Fits prompt sections into a token budget.
+
+    Shortening runs in passes. Each pass visits sections lowest priority
+    (then largest) first and stops as soon as the prompt fits. Anchored
+    sections are windowed around their anchors first, other sections are
+    summarized next, and truncation by whole lines comes last. Cheap steps
+    on every section run before lossy ones on any, and windowed sections
+    are truncated only after all others. A section whose share would fall
+    below `min_section_tokens` is dropped instead, unless it is required.
+    """
+
+    def __init__(self, budget: int = DEFAULT_BUDGET, count_tokens: Callable[[str], int] = estimate_tokens,
+                 context_lines: int = 3, min_section_tokens: int = 32):
+        self.budget = budget
+        self.count_tokens = count_tokens
+        self.context_lines = context_lines
+        self.min_section_tokens = min_section_tokens
+
+    def pack(self, sections: List[Section], reserve: int = 0) -> PackResult:
+        """Shorten `sections` so they fit the budget minus `reserve` (the fixed template text)."""
+        texts = {s.name: s.text for s in sections}
+        reports = {s.name: SectionReport(s.name, self.count_tokens(s.text), self.count_tokens(s.text)) for s in sections}
+        over = sum(r.tokens for r in reports.values()) - (self.budget - reserve)
+        for shrink in (self._window_pass, self._summarize_pass, self._truncate_pass):
+            # Windows around issues are the last thing to truncate; among
+            # equal priorities the largest section gives way first
+            ordered = sorted(
+                sections,
+                key=lambda s: (reports[s.name].action == "windowed", s.priority, -reports[s.name].tokens)
+            )
+            for section in ordered:
+                if over <= 0:
+                    break
+                report = reports[section.name]
+                shrunk = shrink(section, texts[section.name], report, max(0, report.tokens - over))
+                if shrunk is None:
+                    continue
+                text, action = shrunk
+                tokens = self.count_tokens(text)
+                if tokens >= report.tokens:
+                    continue
+                over -= report.tokens - tokens
+                texts[section.name] = text
+                report.tokens = tokens
+                report.action = action
+        result = PackResult(texts, [reports[s.name] for s in sections], self.budget, reserve)
+        if result.trimmed:
+            logger.debug(f"Prompt packed: {result.summary()}")
+        return result
+
+    def fill(self, template: str, sections: List[Section]) -> Tuple[str, PackResult]:
+        """Pack `sections` to fit `template` (str.format placeholders) and render it."""
+        reserve = self.count_tokens(template.format(**{s.name: "" for s in sections}))
+        result = self.pack(sections, reserve)
+        return template.format(**result.sections), result
+
+    def _window_pass(self, section: Section, text: str, report: SectionReport,
+                     target: int) -> Optional[Tuple[str, str]]:
+        if not section.anchors:
+            return None
+        return self.window(section.text, section.anchors, target), "windowed"
+
+    def _summarize_pass(self, section: Section, text: str, report: SectionReport,
+                        target: int) -> Optional[Tuple[str, str]]:
+        # A window around the issues beats an outline of the whole section
+        if not section.summarize or report.action != "kept":
+            return None
+        return section.summarize(section.text), "summarized"
+
+    def _truncate_pass(self, section: Section, text: str, report: SectionReport,
+                       target: int) -> Optional[Tuple[str, str]]:
+        if target < self.min_section_tokens and not section.required:
+            return f"[{section.name} omitted: {report.original_tokens} tokens]", "dropped"
+        action = "truncated" if report.action == "kept" else report.action
+        return self.truncate(text, target), action
+
+    def window(self, text: str, anchors: Iterable[int], target: int) -> str:
+        """Keep lines around `anchors`, narrowing the context until it fits `target`.
+
+        If even the bare anchor lines are too long, they are returned as is
+        and left to the truncation pass.
+        """
+        lines = text.splitlines()
+        anchors = sorted({a for a in anchors if 1 <= a <= len(lines)})
+        if not anchors:
+            return text
+        windowed = text
+        for context in range(self.context_lines, -1, -1):
+            keep = set()
+            for anchor in anchors:
+                keep.update(range(max(0, anchor - 1 - context), min(len(lines), anchor + context)))
+            windowed = _render_kept(lines, keep)
+            if self.count_tokens(windowed) <= target:
+                break
+        return windowed
+
+    def truncate(self, text: str, target: int) -> str:
+        """Keep whole leading lines up to `target` tokens."""
+        if self.count_tokens(text) <= target:
+            return text
+        kept, used = [], 0
+        lines = text.splitlines()
+        for line in lines:
+            cost = self.count_tokens(line + "\n")
+            if used + cost > target:
+                break
+            kept.append(line)
+            used += cost
+        if not kept and lines:
+            # One huge line (minified code): cut it by characters instead
+            return text[:max(0, target * 4 - 40)] + f"\n... [{self.count_tokens(text) - target} tokens truncated] ..."
+        return "\n".join(kept + [f"... [{len(lines) - len(kept)} more lines truncated] ..."])
+
+
+def _render_kept(lines: List[str], keep: set) -> str:
+    out = []
+    skipped_from = None
+    for index, line in enumerate(lines):
+        if index in keep:
+            if skipped_from is not None:
+                out.append(f"... [lines {skipped_from + 1}-{index} omitted] ...")
+                skipped_from = None
+            out.append(line)
+        elif skipped_from is None:
+            skipped_from = index
+    if skipped_from is not None:
+        out.append(f"... [lines {skipped_from + 1}-{len(lines)} omitted] ...")
+    return "\n".join(out)
+
+
+def find_anchor_lines(text: str, issues: Iterable[Any], location_types: Optional[Container[str]] = None) -> List[int]:
+    """Line numbers in `text` that issues point at.
+
+    Snippets (`content`, `selector`, `before`) are looked up in the text.
+    The numeric `location` is trusted only for issue types in
+    `location_types`, because validators report lines for different files.
+    """
+    lines = []
+    for issue in issues:
+        if not isinstance(issue, dict):
+            continue
+        for key in ("content", "selector", "before"):
+            snippet = issue.get(key)
+            if isinstance(snippet, str) and snippet.strip():
+                index = text.find(snippet.strip())
+                if index >= 0:
+                    lines.append(text.count("\n", 0, index) + 1)
+        location = str(issue.get("location", ""))
+        if location_types is not None and issue.get("type") in location_types and location.isdigit():
+            lines.append(int(location))
+    return sorted(set(lines))
+
+
+_START_TAG = re.compile(r"<([a-zA-Z][\w-]*)([^>]*)>")
+_ATTR = re.compile(r"""\b(id|class)\s*=\s*["']([^"']*)["']""")
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_JS_OUTLINE = re.compile(
+    r"^\s*(?:export\s+)?(?:async\s+)?(?:function\b|class\b|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:function|\(|\w+\s*=>))"
+    r"|addEventListener|getElementById|querySelector"
+)
+
+
+def summarize_html(html: str) -> str:
+    """Outline of the element tree: tag names with ids and classes, repeats collapsed."""
+    outline = []
+    for match in _START_TAG.finditer(html):
+        tag = match.group(1).lower()
+        attrs = " ".join(f'{name}="{value}"' for name, value in _ATTR.findall(match.group(2)))
+        entry = f"<{tag}{' ' + attrs if attrs else ''}>"
+        if outline and outline[-1][0] == entry:
+            outline[-1][1] += 1
+        else:
+            outline.append([entry, 1])
+    return "\n".join(entry if count == 1 else f"{entry} x{count}" for entry, count in outline)
+
+
+def summarize_css(css: str) -> str:
+    """Selectors with their declaration counts."""
+    rules = []
+    for selector, body in _CSS_RULE.findall(re.sub(r"/\*.*?\*/", "", css, flags=re.S)):
+        declarations = [d for d in body.split(";") if d.strip()]
+        rules.append(f"{' '.join(selector.split())} {{ {len(declarations)} declarations }}")
+    return "\n".join(rules)
+
+
+def summarize_js(js: str) -> str:
+    """Function/class declarations and DOM lookups, one line each."""
+    return "\n".join(line.strip() for line in js.splitlines() if _JS_OUTLINE.search(line))